@@ -0,0 +1,307 @@
+"""
+Push of the poules to the inscription website.
+
+Every poule drawn is queued in a table of the tirage database, then
+sent by a background worker that retries with an exponential backoff
+while the website is unreachable. The queue survives restarts of the bot.
+
+The url of the api is read from TFJM_API_URL, so the bot can be
+pointed at a local server.
+"""
+
+import asyncio
+import random
+import sqlite3
+import sys
+import traceback
+from collections import namedtuple
+from contextlib import contextmanager
+from time import time
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from src.base_tirage import BaseTirage, Poule
+from src.constants import *
+from src.errors import TfjmError
+from src.tirage_store import get_store
+
+__all__ = ["PoolPusher", "PushResult", "get_pusher", "pool_payload", "is_drawn"]
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS api_outbox (
+    tirage_id INTEGER NOT NULL,
+    rnd INTEGER NOT NULL,
+    poule TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_try REAL NOT NULL,
+    error TEXT,
+    PRIMARY KEY (tirage_id, rnd, poule)
+);
+"""
+
+PushResult = namedtuple("PushResult", ["poule", "ok", "status"])
+
+
+def is_drawn(tirage: BaseTirage, poule: Poule) -> bool:
+    """Whether every team of the poule accepted a problem."""
+
+    return all(tirage.teams[t].accepted(poule.rnd) for t in tirage.poules[poule])
+
+
+def pool_payload(tirage: BaseTirage, poule: Poule) -> str:
+    """The body expected by the api for a poule: the round, then each team and its problem."""
+
+    teams = [tirage.teams[t] for t in tirage.poules[poule]]
+    if not is_drawn(tirage, poule):
+        raise TfjmError(f"Les problèmes de la poule {poule} ne sont pas encore tirés.")
+
+    data = f"{poule.rnd + 1};" + ";".join(
+        x for t in teams for x in (t.name, t.accepted_problems[poule.rnd][0])
+    )
+    return f'"{data}"'
+
+
+class PoolPusher:
+    """Sends the poules to the api, with a durable queue for the ones that fail."""
+
+    BASE_DELAY = 5
+    """Seconds before the first retry, doubled at each failure."""
+    MAX_DELAY = 15 * 60
+    MAX_ATTEMPTS = 20
+    CONCURRENCY = 4
+    """Maximum number of requests to the api at the same time."""
+
+    def __init__(self, db: sqlite3.Connection, url=TFJM_API_URL, token=TFJM_TOKEN):
+        self.db = db
+        self.db.executescript(OUTBOX_SCHEMA)
+        self.url = url.rstrip("/") + "/pool/"
+        self.token = token
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # (tirage id, round, poule) -> done once its row of the queue is up to date
+        self._in_flight: Dict[tuple, asyncio.Future] = {}
+
+    @property
+    def enabled(self):
+        return self.token is not None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """A single session for all requests, so connections are reused."""
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers={
+                    "Authorization": f"Token {self.token}",
+                    "Content-type": "application/json",
+                },
+                timeout=aiohttp.ClientTimeout(total=30),
+                connector=aiohttp.TCPConnector(limit=self.CONCURRENCY),
+            )
+        return self._session
+
+    async def post(self, payload: str) -> int:
+        """Send one poule and return the http status."""
+
+        async with self.session.post(self.url, data=payload) as resp:
+            await resp.read()
+            return resp.status
+
+    @contextmanager
+    def _sending(self, key):
+        """Mark a poule as being sent, until its row of the queue is up to date."""
+
+        done = asyncio.get_event_loop().create_future()
+        self._in_flight[key] = done
+        try:
+            yield
+        finally:
+            del self._in_flight[key]
+            done.set_result(None)
+
+    def _queued(self, key) -> bool:
+        return (
+            self.db.execute(
+                "SELECT 1 FROM api_outbox WHERE tirage_id = ? AND rnd = ? AND poule = ?",
+                key,
+            ).fetchone()
+            is not None
+        )
+
+    async def push(self, tirage: BaseTirage, poule: Poule) -> PushResult:
+        """
+        Send a poule now. If it fails, it is queued to be retried later.
+
+        If the worker is already sending it, its result is used instead
+        of sending the poule twice.
+        """
+
+        key = (tirage.id, poule.rnd, poule.poule)
+        payload = pool_payload(tirage, poule)
+        if key in self._in_flight:
+            await asyncio.shield(self._in_flight[key])
+            return PushResult(poule, not self._queued(key), "déjà en cours d'envoi")
+
+        with self._sending(key):
+            try:
+                status = await self.post(payload)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = type(e).__name__
+
+            ok = isinstance(status, int) and status < 300
+            if ok:
+                self.db.execute(
+                    "DELETE FROM api_outbox "
+                    "WHERE tirage_id = ? AND rnd = ? AND poule = ?",
+                    key,
+                )
+            else:
+                self._enqueue(tirage.id, poule, payload, delay=self.BASE_DELAY)
+        return PushResult(poule, ok, status)
+
+    async def push_all(self, tirage: BaseTirage) -> List[PushResult]:
+        """
+        Send all the drawn poules of a tirage concurrently.
+
+        The poules whose problems are not all drawn yet are skipped.
+        A poule that fails does not stop the others, its error is
+        its status.
+        """
+
+        poules = [p for p in tirage.poules if is_drawn(tirage, p)]
+        results = await asyncio.gather(
+            *(self.push(tirage, p) for p in poules), return_exceptions=True
+        )
+        return [
+            PushResult(p, False, repr(r)) if isinstance(r, Exception) else r
+            for p, r in zip(poules, results)
+        ]
+
+    def enqueue(self, tirage: BaseTirage, poule: Poule):
+        """Queue a poule to be sent in the background."""
+
+        if self.enabled:
+            self._enqueue(tirage.id, poule, pool_payload(tirage, poule))
+
+    def _enqueue(self, tirage_id, poule: Poule, payload, delay=0):
+        self.db.execute(
+            "INSERT OR REPLACE INTO api_outbox (tirage_id, rnd, poule, payload, next_try) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (tirage_id, poule.rnd, poule.poule, payload, time() + delay),
+        )
+        self.start()
+
+    def pending(self):
+        """The poules still waiting to be sent, with the last error."""
+
+        return self.db.execute(
+            "SELECT tirage_id, rnd, poule, attempts, error FROM api_outbox "
+            "ORDER BY tirage_id, rnd, poule"
+        ).fetchall()
+
+    def start(self):
+        """Start the background worker, if it is not running."""
+
+        if not self.enabled:
+            return
+
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.ensure_future(self._work())
+        else:
+            self._wakeup.set()
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+        if self._session is not None:
+            await self._session.close()
+
+    async def _work(self):
+        while True:
+            due = self.db.execute(
+                "SELECT tirage_id, rnd, poule, payload, attempts FROM api_outbox "
+                "WHERE attempts < ? AND next_try <= ?",
+                (self.MAX_ATTEMPTS, time()),
+            ).fetchall()
+
+            if due:
+                await asyncio.gather(
+                    *(self._retry(*row) for row in due), return_exceptions=True
+                )
+                continue
+
+            (next_try,) = self.db.execute(
+                "SELECT MIN(next_try) FROM api_outbox WHERE attempts < ?",
+                (self.MAX_ATTEMPTS,),
+            ).fetchone()
+            if next_try is None:
+                return
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(0, next_try - time()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _retry(self, tirage_id, rnd, poule, payload, attempts):
+        key = (tirage_id, rnd, poule)
+        if key in self._in_flight:
+            # Being sent by push, which updates the queue
+            return await asyncio.shield(self._in_flight[key])
+
+        with self._sending(key):
+            await self._send_queued(key, payload, attempts)
+
+    async def _send_queued(self, key, payload, attempts):
+        tirage_id, rnd, poule = key
+        try:
+            status = await self.post(payload)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status, error = None, repr(e)
+        except Exception as e:
+            # Like a malformed response: the poule is kept and retried later
+            traceback.print_tb(e.__traceback__, file=sys.stderr)
+            status, error = None, repr(e)
+        else:
+            error = f"HTTP {status}"
+
+        if status is not None and status < 300:
+            self.db.execute(
+                "DELETE FROM api_outbox WHERE tirage_id = ? AND rnd = ? AND poule = ?",
+                key,
+            )
+            return
+
+        if status is not None and 400 <= status < 500 and status not in (408, 429):
+            # The request itself is wrong, no need to retry.
+            attempts = self.MAX_ATTEMPTS
+        else:
+            attempts += 1
+
+        delay = min(self.MAX_DELAY, self.BASE_DELAY * 2**attempts)
+        delay *= random.uniform(0.5, 1)
+        print(
+            f"Could not send poule {poule}{rnd + 1} of tirage {tirage_id}: {error}",
+            file=sys.stderr,
+        )
+        self.db.execute(
+            "UPDATE api_outbox SET attempts = ?, next_try = ?, error = ? "
+            "WHERE tirage_id = ? AND rnd = ? AND poule = ?",
+            (attempts, time() + delay, error, *key),
+        )
+
+
+_pusher = None
+
+
+def get_pusher() -> PoolPusher:
+    """Return the pusher shared by the whole bot, sharing the database of the tirages."""
+
+    global _pusher
+    if _pusher is None:
+        _pusher = PoolPusher(get_store().db)
+    return _pusher
@@ -2,17 +2,20 @@ import asyncio
 import random
 import sys
 import traceback
-from functools import wraps
+from collections import Counter, namedtuple
+from functools import lru_cache, wraps
 from pathlib import Path
 from pprint import pprint
+from time import time
 
 from io import StringIO
-from typing import Type, Union, Dict, List
+from typing import Type, Union, Dict, List, Optional, Tuple
 
 import discord
-import yaml
 
 from src.constants import *
+from src.partition import fill, separate
+from src.passage import passage_order, rooms_for
 from src.utils import pprint_send
 
 
@@ -32,44 +35,181 @@ def skip_if(check, default=None):
 
 
 class Event(asyncio.Event):
-    def __init__(self, team: str, value: Union[bool, int, str]):
+    def __init__(self, team: str, value: Union[bool, int, str], ctx=None):
         super(Event, self).__init__()
         self.value = value
         self.team = team
+        self.ctx = ctx
+        """Where the event comes from, used to answer it."""
         self.response = None
 
 
+PROBLEM_INDEX: Dict[str, int] = {pb: i for i, pb in enumerate(PROBLEMS)}
+PROBLEM_NAMES: List[str] = list(PROBLEMS)
+
+
+def problem_index(pb: str) -> int:
+    """The index of a problem, registering problems of old tirages that are not in PROBLEMS."""
+
+    i = PROBLEM_INDEX.get(pb)
+    if i is None:
+        i = PROBLEM_INDEX[pb] = len(PROBLEM_NAMES)
+        PROBLEM_NAMES.append(pb)
+    return i
+
+
+def problems_in(mask: int) -> Tuple[str, ...]:
+    """The problems whose bit is set in the mask, in the order of PROBLEMS."""
+
+    return tuple(pb for i, pb in enumerate(PROBLEM_NAMES) if mask >> i & 1)
+
+
+Mark = namedtuple("Mark", ["time", "kind", "team", "poule"])
+
+WAKE_UP = Event(None, None)
+"""Put in the queue to make a tirage check its deadline again."""
+
+
+@lru_cache(maxsize=1 << 16)
+def can_complete(free: Tuple[int, ...], forbidden: Tuple[int, ...]) -> bool:
+    """
+    Whether each team can still get a problem.
+
+    `free` is how many more teams can accept each problem and `forbidden`
+    the bitmask of the problems each team can not accept, sorted so
+    that the cache is shared between the teams in any order.
+    """
+
+    if not forbidden:
+        return True
+
+    mask, rest = forbidden[0], forbidden[1:]
+    tried = set()
+    for i, f in enumerate(free):
+        if not f or mask >> i & 1:
+            continue
+        # Two problems with as many free places, forbidden for the
+        # same teams, lead to the same result.
+        kind = (f, tuple(m >> i & 1 for m in rest))
+        if kind in tried:
+            continue
+        tried.add(kind)
+
+        if can_complete(free[:i] + (f - 1,) + free[i + 1 :], rest):
+            return True
+    return False
+
+
 class Team:
-    yaml_tag = "Team"
+    """
+    The state of a team in a tirage.
+
+    Problems are stored as their index in PROBLEMS, and the rejected
+    problems of each round as a bitmask, as there are thousands of
+    teams in the history and in simulations.
+    """
+
+    __slots__ = ("name", "mention", "_accepted", "_rejected")
 
     def __init__(self, team_role):
         self.name = team_role.name
         self.mention = team_role.mention
 
-        self.accepted_problems = [None, None]
-        self.rejected = [set(), set()]
+        self._accepted = (-1,) * len(ROUND_NAMES)
+        """Index of the accepted problem in each round, -1 if there is none."""
+        self._rejected = (0,) * len(ROUND_NAMES)
+        """Bitmask of the rejected problems in each round."""
+
+    @classmethod
+    def restore(cls, name, mention, accepted_problems, rejected):
+        """Rebuild a team from stored data, without a discord role."""
+
+        team = cls.__new__(cls)
+        team.name = name
+        team.mention = mention
+        team._accepted = tuple(
+            -1 if pb is None else problem_index(pb) for pb in accepted_problems
+        )
+        team._rejected = tuple(
+            sum(1 << problem_index(pb) for pb in set(r)) for r in rejected
+        )
+        return team
+
+    @property
+    def accepted_problems(self) -> Tuple[Optional[str], ...]:
+        """The problem accepted in each round, or None."""
+
+        return tuple(None if i < 0 else PROBLEM_NAMES[i] for i in self._accepted)
+
+    @property
+    def rejected(self) -> Tuple[Tuple[str, ...], ...]:
+        """The problems rejected in each round."""
+
+        return tuple(map(problems_in, self._rejected))
+
+    def accepted(self, rnd) -> Optional[str]:
+        """The problem accepted in this round, or None."""
+
+        i = self._accepted[rnd]
+        return None if i < 0 else PROBLEM_NAMES[i]
+
+    def accept(self, rnd, pb):
+        accepted = list(self._accepted)
+        accepted[rnd] = problem_index(pb)
+        self._accepted = tuple(accepted)
+
+    def reject(self, rnd, pb):
+        rejected = list(self._rejected)
+        rejected[rnd] |= 1 << problem_index(pb)
+        self._rejected = tuple(rejected)
+
+    def has_rejected(self, rnd, pb) -> bool:
+        return bool(self._rejected[rnd] >> problem_index(pb) & 1)
+
+    def rejected_count(self, rnd) -> int:
+        return bin(self._rejected[rnd]).count("1")
+
+    def accepted_mask(self) -> int:
+        """Bitmask of the problems accepted in any round, which can not be drawn again."""
+
+        return sum(1 << i for i in self._accepted if i >= 0)
+
+    def reset(self, rnd):
+        """Forget what the team drew in this round."""
+
+        accepted, rejected = list(self._accepted), list(self._rejected)
+        accepted[rnd], rejected[rnd] = -1, 0
+        self._accepted, self._rejected = tuple(accepted), tuple(rejected)
 
     def __str__(self):
         s = StringIO()
-        pprint(self.__dict__, stream=s)
+        pprint(
+            {
+                "name": self.name,
+                "mention": self.mention,
+                "accepted_problems": self.accepted_problems,
+                "rejected": self.rejected,
+            },
+            stream=s,
+        )
         s.seek(0)
         return s.read()
 
     __repr__ = __str__
 
     def coeff(self, round):
-        if len(self.rejected[round]) <= MAX_REFUSE:
+        refused = self.rejected_count(round)
+        if refused <= MAX_REFUSE:
             return 2
         else:
-            return 2 - 0.5 * (len(self.rejected[round]) - MAX_REFUSE)
+            return 2 - 0.5 * (refused - MAX_REFUSE)
 
     def details(self, round):
 
+        rejected = self.rejected[round]
         info = {
             # "Accepté": self.accepted_problems[round],
-            "Refusés": ", ".join(p[0] for p in self.rejected[round])
-            if self.rejected[round]
-            else "aucun",
+            "Refusés": ", ".join(p[0] for p in rejected) if rejected else "aucun",
             "Coefficient": self.coeff(round),
             # "Ordre passage": self.passage_order[round],
         }
@@ -88,20 +228,28 @@ class Team:
 # """
 
 
-class Poule(yaml.YAMLObject):
-    yaml_tag = "Poule"
+class Poule:
+    __slots__ = ("poule", "rnd")
 
     def __init__(self, poule, rnd):
         self.poule = poule
         self.rnd = rnd
 
+    def __eq__(self, other):
+        return (
+            isinstance(other, Poule)
+            and self.poule == other.poule
+            and self.rnd == other.rnd
+        )
+
+    def __hash__(self):
+        return hash((self.poule, self.rnd))
+
     def __str__(self):
         return f"{self.poule}{self.rnd + 1}"
 
 
-class BaseTirage(yaml.YAMLObject):
-    yaml_tag = "Tirage"
-
+class BaseTirage:
     def __init__(self, *teams: discord.Role, fmt=(3, 3)):
         assert sum(fmt) == len(teams), "Different number of teams and format"
 
@@ -110,16 +258,91 @@ class BaseTirage(yaml.YAMLObject):
         self.queue = asyncio.Queue()
         self.poules: Dict[Poule, List[str]] = {}
         """A mapping between the poule and the list of teams in this poule."""
+        self.taken: Dict[Poule, Counter] = {}
+        """How many teams accepted each problem, in each poule."""
+        self.journal = None
+        """Where the accepted events are written, if any."""
+        self.replaying = 0
+        """Number of journaled events still to be replayed."""
+        self.current_event: Optional[Event] = None
+        """The event being handled."""
+        self.phase = ("start",)
+        """What the tirage is waiting for, with the poule or team concerned."""
+        self.groups: Optional[Dict[str, str]] = None
+        """If not None, the poules are optimized to separate teams of the same group."""
+        self.deadline: Optional[float] = None
+        """Seconds the teams have to play, before they are reminded then auto-played."""
+        self.autoplay = False
+        """Whether the teams play automatically after the deadline."""
+        self.autoplayed = 0
+        self.marks: List[Mark] = []
+        """Timestamps of the steps of the tirage, not yet saved."""
+
+    @classmethod
+    def restore(cls, id, fmt, teams: Dict[str, Team], poules: Dict[Poule, List[str]]):
+        """Rebuild a tirage from stored data, without running __init__."""
+
+        tirage = cls.__new__(cls)
+        tirage.id = id
+        tirage.format = fmt
+        tirage.teams = teams
+        tirage.poules = poules
+        tirage.taken = {}
+        tirage.queue = None
+        tirage.journal = None
+        tirage.replaying = 0
+        tirage.current_event = None
+        tirage.phase = ("finished",)
+        tirage.groups = None
+        tirage.deadline = None
+        tirage.autoplay = False
+        tirage.autoplayed = 0
+        tirage.marks = []
+        return tirage
+
+    def reset_rounds(self, rounds):
+        """Forget everything that was drawn during the given rounds."""
+
+        for team in self.teams.values():
+            for rnd in rounds:
+                team.reset(rnd)
+
+        self.poules = {p: t for p, t in self.poules.items() if p.rnd not in rounds}
+        self.taken = {p: c for p, c in self.taken.items() if p.rnd not in rounds}
+
+    def resume(self, events):
+        """
+        Queue journaled events so that `run` goes through them again.
+
+        The events must be replayed from the state the tirage had
+        when the journal was created. While they are replayed,
+        `self.replaying` is not zero.
+        """
+
+        self.replaying = len(events)
+        for team, value in events:
+            self.queue.put_nowait(Event(team, value))
+
+    def capacity(self, poule):
+        """How many teams of the poule can accept the same problem."""
+
+        return 2 if len(self.poules[poule]) >= 5 else 1
+
+    def counts(self, poule) -> Counter:
+        """How many teams of the poule accepted each problem."""
+
+        counts = self.taken.get(poule)
+        if counts is None:
+            # Only computed once, then draw_poule keeps it up to date.
+            counts = Counter(
+                self.teams[team].accepted(poule.rnd) for team in self.poules[poule]
+            )
+            del counts[None]
+            self.taken[poule] = counts
+        return counts
 
     def availaible(self, pb, poule):
-        pbs = [
-            self.teams[team].accepted_problems[poule.rnd] for team in self.poules[poule]
-        ]
-
-        if len(self.poules[poule]) < 5:
-            return pb not in pbs
-        else:
-            return pbs.count(pb) < 2
+        return self.counts(poule)[pb] < self.capacity(poule)
 
     async def event(self, event: Event):
         event.set()
@@ -127,51 +350,165 @@ class BaseTirage(yaml.YAMLObject):
         await event.wait()
         return event.response
 
-    async def dice(self, trigram):
-        return await self.event(Event(trigram, random.randint(1, 100)))
+    def current_poule(self, trigram) -> Optional[Poule]:
+        """The poule in which the team is drawing a problem, if any."""
 
-    async def rproblem(self, trigram):
         team = self.teams[trigram]
-        rnd = 0 if team.accepted_problems[0] is None else 1
+        rnd = 0 if team.accepted(0) is None else 1
         for poule, teams in self.poules.items():
             if trigram in teams and poule.rnd == rnd:
-                break
-        else:
+                return poule
+        return None
+
+    async def dice(self, trigram, ctx=None):
+        return await self.event(Event(trigram, random.randint(1, 100), ctx))
+
+    def feasible(self, poule, team: Team, problems: List[str]) -> List[str]:
+        """The problems such that, if `team` accepts one, all the teams of the poule can still get one."""
+
+        counts = self.counts(poule)
+        capacity = self.capacity(poule)
+        free = tuple(capacity - counts[p] for p in PROBLEMS)
+        full = (1 << len(PROBLEMS)) - 1
+        others = tuple(
+            sorted(
+                t.accepted_mask() & full
+                for t in (self.teams[tri] for tri in self.poules[poule])
+                if t is not team and t.accepted(poule.rnd) is None
+            )
+        )
+
+        # When each team has more choices than there are teams,
+        # even after one is taken, any choice works.
+        available = sum(1 << i for i, f in enumerate(free) if f)
+        if all(bin(available & ~m).count("1") > len(others) for m in others):
+            return problems
+
+        feasible = []
+        for pb in problems:
+            i = PROBLEM_INDEX[pb]
+            if can_complete(free[:i] + (free[i] - 1,) + free[i + 1 :], others):
+                feasible.append(pb)
+        return feasible
+
+    async def rproblem(self, trigram, ctx=None):
+        team = self.teams[trigram]
+        poule = self.current_poule(trigram)
+        if poule is None:
             return await self.warn_wrong_team(None, trigram)
 
+        return await self.event(Event(trigram, self.draw_problem(team, poule), ctx))
+
+    def draw_problem(self, team: Team, poule) -> str:
+        counts = self.counts(poule)
+        capacity = self.capacity(poule)
+        accepted = team.accepted_problems
         available = [
-            pb
-            for pb in PROBLEMS
-            if pb not in team.accepted_problems and self.availaible(pb, poule)
+            pb for pb in PROBLEMS if counts[pb] < capacity and pb not in accepted
         ]
-        return await self.event(Event(trigram, random.choice(available)))
+        # Never draw a problem that would leave another team without any
+        safe = self.feasible(poule, team, available)
+        return random.choice(safe or available)
 
-    async def accept(self, trigram, yes: bool):
-        return await self.event(Event(trigram, yes))
+    async def accept(self, trigram, yes: bool, ctx=None):
+        return await self.event(Event(trigram, yes, ctx))
+
+    async def next(self, typ, team=None, waiting=(), auto=None):
+        """
+        Wait for an event of the given type, from the given team if any.
+
+        If a deadline is set, the `waiting` teams are reminded after half
+        of it, and after the whole deadline, `auto()` gives the events to
+        play for them in auto-play mode. The first one is returned and the
+        others are queued, so that all the waiting teams play at once.
+        """
 
-    async def next(self, typ, team=None):
         while True:
-            event = await self.queue.get()
+            event = await self.wait_event(waiting, auto)
+            self.current_event = event
             if team is not None and event.team != team:
                 await self.warn_wrong_team(team, event.team)
             elif not isinstance(event.value, typ):
                 await self.warn_unwanted(typ, event.value)
             else:
                 event.clear()
+                if self.replaying:
+                    self.replaying -= 1
+                elif self.journal is not None:
+                    self.journal.append(event)
                 return event
             event.clear()
 
+    def mark(self, kind, team=None, poule=None):
+        """Record the time of a step, to know where the time goes."""
+
+        if not self.replaying:
+            self.marks.append(Mark(time(), kind, team, poule and str(poule)))
+
+    def set_deadline(self, deadline: Optional[float], autoplay=False):
+        """
+        Change the deadline, which also applies to the step being played.
+
+        It is written in the header of the journal, to be kept if the
+        tirage is resumed.
+        """
+
+        self.deadline = deadline
+        self.autoplay = autoplay
+        if self.journal is not None:
+            self.journal.update_header(deadline=deadline, autoplay=autoplay)
+        self.queue.put_nowait(WAKE_UP)
+
+    async def wait_event(self, waiting, auto) -> Event:
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        reminders = 0
+        while True:
+            if self.deadline is None:
+                event = await self.queue.get()
+            else:
+                elapsed = loop.time() - start
+                can_play = self.autoplay and auto is not None
+                if can_play and elapsed >= self.deadline:
+                    event, *others = auto()
+                    for e in [event, *others]:
+                        self.autoplayed += 1
+                        await self.info_autoplay(e)
+                    for e in others:
+                        self.queue.put_nowait(e)
+                    return event
+
+                # Reminders after half of the deadline, then after each deadline
+                reminder = self.deadline * (reminders + 0.5)
+                if elapsed >= reminder:
+                    reminders += 1
+                    await self.warn_idle(waiting)
+                    continue
+
+                timeout = reminder - elapsed
+                if can_play:
+                    timeout = min(timeout, self.deadline - elapsed)
+                try:
+                    event = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    continue
+
+            if event is not WAKE_UP:
+                return event
+
     async def run(self, rounds=(0, 1)):
 
         await self.info_start()
 
         for i in rounds:
+            self.phase = ("poules", i)
             new_poules = await self.make_poules(i)
             self.poules.update(new_poules)
 
             for poule in new_poules:
                 await self.draw_poule(poule)
 
+        self.phase = ("finished",)
         await self.info_finish()
 
     async def get_dices(self, teams):
@@ -182,19 +519,27 @@ class BaseTirage(yaml.YAMLObject):
             for t in collisions:
                 dices[t] = None
 
+            self.mark("dice_round")
             while None in dices.values():
-                event = await self.next(int)
+                idle = [t for t, d in dices.items() if d is None]
+                event = await self.next(
+                    int,
+                    waiting=idle,
+                    auto=lambda: [Event(t, random.randint(1, 100)) for t in idle],
+                )
 
                 if event.team not in dices:
                     await self.warn_wrong_team(None, event.team)
                 elif dices[event.team] is None:
                     dices[event.team] = event.value
+                    self.mark("dice", event.team)
                     await self.info_dice(event.team, event.value)
                 else:
                     await self.warn_twice(int)
 
             collisions = [t for t in teams if list(dices.values()).count(dices[t]) > 1]
             if collisions:
+                self.mark("collision")
                 await self.warn_colisions(collisions)
 
         return dices
@@ -203,96 +548,102 @@ class BaseTirage(yaml.YAMLObject):
         """Put teams in poules for a given round (0 or 1)."""
 
         poules = {}
+        self.mark("poules")
         await self.start_make_poule(rnd)
 
         dices = await self.get_dices(self.teams)
         sorted_teams = sorted(self.teams, key=lambda t: dices[t])
 
-        idx = 0
-        for i, qte in enumerate(self.format):
+        if self.groups is None:
+            parts = fill(sorted_teams, self.format)
+        else:
+            met = [teams for p, teams in self.poules.items() if p.rnd < rnd]
+            parts = separate(sorted_teams, self.format, self.groups, met)
+
+        for i, teams in enumerate(parts):
             letter = chr(ord("A") + i)
-            poules[Poule(letter, rnd)] = sorted_teams[idx : idx + qte]
-            idx += qte
+            poules[Poule(letter, rnd)] = teams
 
+        self.mark("poules_done")
         await self.annonce_poules(poules)
         return poules
 
     async def draw_poule(self, poule):
 
+        self.mark("poule", poule=poule)
         await self.start_draw_poule(poule)
 
         # Trigrams in draw order
+        self.phase = ("order", poule)
         trigrams = await self.draw_order(poule)
 
         # Teams in draw order
         teams = [self.teams[tri] for tri in trigrams]
         current = 0
-        while not all(team.accepted_problems[poule.rnd] for team in teams):
+        while not all(team.accepted(poule.rnd) for team in teams):
             team = teams[current]
-            if team.accepted_problems[poule.rnd] is not None:
+            if team.accepted(poule.rnd) is not None:
                 # The team already accepted a problem
                 current += 1
                 current %= len(teams)
                 continue
 
             # Choose problem
+            self.phase = ("problem", poule, team.name)
+            self.mark("select", team.name, poule)
             await self.start_select_pb(team)
-            pevent = await self.next(str, team.name)
-            # TODO: Add check for already selected / taken by someone else
-            # This is not a bug for now, since it cannot happen yet
+            pevent = await self.next(
+                str,
+                team.name,
+                waiting=[team.name],
+                auto=lambda: [Event(team.name, self.draw_problem(team, poule))],
+            )
+            # rproblem only draws problems that are available and keep the poule feasible
+            self.mark("drawn", team.name, poule)
             await self.info_draw_pb(team, pevent.value, poule.rnd)
 
-            # Accept it
-            accept = await self.next(bool, team.name)
+            # Accept it, automatically after the deadline as refusing could cost a penalty
+            accept = await self.next(
+                bool,
+                team.name,
+                waiting=[team.name],
+                auto=lambda: [Event(team.name, True)],
+            )
+            self.mark("accepted" if accept.value else "rejected", team.name, poule)
             if accept.value:
-                team.accepted_problems[poule.rnd] = pevent.value
+                self.counts(poule)[pevent.value] += 1
+                team.accept(poule.rnd, pevent.value)
                 await self.info_accepted(
                     team, pevent.value, self.availaible(pevent.value, poule)
                 )
             else:
                 await self.info_rejected(team, pevent.value, rnd=poule.rnd)
-                team.rejected[poule.rnd].add(pevent.value)
+                team.reject(poule.rnd, pevent.value)
 
             current += 1
             current %= len(teams)
 
-        if len(teams) == 5:
+        if self.capacity(poule) > 1:
             # We can determine the passage order only once problems are drawn.
-            order = [self.teams[tri] for tri in self.poules[poule]]
-            pbs = [team.accepted_problems[poule.rnd] for team in order]
-
-            doubles = []
-            i = 0
-            while i < len(order):
-                team = order[i]
-                if pbs.count(team.accepted_problems[poule.rnd]) == 2:
-                    # We pop the two with the same pb and add them to the doubles
-                    doubles.append(order.pop(i))
-                    other = next(
-                        filter(
-                            lambda t: team.accepted_problems[poule.rnd]
-                            == t.accepted_problems[poule.rnd],
-                            order,
-                        )
-                    )
-                    doubles.append(other)
-                    order.remove(other)
-                else:
-                    i += 1
-            # The conflicts
-            order = doubles + order
-
-            self.poules[poule] = [t.name for t in order]
-
+            trigrams = self.poules[poule]
+            self.poules[poule] = passage_order(
+                trigrams,
+                [self.teams[tri].accepted(poule.rnd) for tri in trigrams],
+                rooms_for(len(trigrams)),
+            )
+
+        self.mark("poule_done", poule=poule)
         await self.annonce_poule(poule)
 
     async def draw_order(self, poule):
+        self.mark("order", poule=poule)
         await self.start_draw_order(poule)
 
         teams = self.poules[poule]
         dices = await self.get_dices(teams)
 
         order = sorted(teams, key=lambda t: dices[t], reverse=True)
+        self.mark("order_done", poule=poule)
 
         await self.annonce_draw_order(order)
         return order
@@ -309,6 +660,12 @@ class BaseTirage(yaml.YAMLObject):
     async def warn_twice(self, typ: Type):
         """Called when an event appears once again and not wanted."""
 
+    async def warn_idle(self, teams: List[str]):
+        """Called when the teams did not play after half of the deadline."""
+
+    async def info_autoplay(self, event: Event):
+        """Called when the deadline is over and the event is played for the team."""
+
     async def start_make_poule(self, rnd):
         """Called when it starts drawing the poules for round `rnd`"""
 
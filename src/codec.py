@@ -0,0 +1,329 @@
+"""
+Serialization of tirages.
+
+A tirage is encoded as a plain, versioned JSON document:
+
+    {
+        "version": 1,
+        "id": 42,
+        "format": [3, 3],
+        "teams": [
+            {"name": "ABC", "mention": "<@&1>",
+             "accepted": ["1. Problème", null], "rejected": [["2. Autre"], []]},
+            ...
+        ],
+        "poules": [{"poule": "A", "rnd": 0, "teams": ["ABC", "DEF", "GHI"]}, ...]
+    }
+
+Every document is checked against this schema when decoded. The old
+yaml dumps of python objects can be read with `load_legacy_yaml`, which
+only knows the tags of tirages and never builds arbitrary objects.
+
+Run the benchmark with
+
+    python -m src.codec --tirages 1000
+"""
+
+import argparse
+import json
+import random
+from time import perf_counter
+from typing import Any, Dict, IO, Type, Union
+
+import yaml
+
+from src.base_tirage import BaseTirage, Poule, Team
+from src.constants import *
+from src.errors import InvalidTirage
+
+try:
+    # Optional, but about 5 times faster
+    import orjson
+except ImportError:
+    orjson = None
+
+__all__ = ["VERSION", "encode", "decode", "dumps", "loads", "load_legacy_yaml"]
+
+VERSION = 1
+
+
+def encode(tirage: BaseTirage) -> Dict[str, Any]:
+    """The document describing the tirage."""
+
+    return {
+        "version": VERSION,
+        "id": tirage.id,
+        "format": list(tirage.format),
+        "teams": [
+            {
+                "name": team.name,
+                "mention": team.mention,
+                "accepted": list(team.accepted_problems),
+                "rejected": [sorted(r) for r in team.rejected],
+            }
+            for team in tirage.teams.values()
+        ],
+        "poules": [
+            {"poule": poule.poule, "rnd": poule.rnd, "teams": list(teams)}
+            for poule, teams in tirage.poules.items()
+        ],
+    }
+
+
+def check(condition, what):
+    if not condition:
+        raise InvalidTirage(what)
+
+
+def is_problem(pb):
+    return pb is None or isinstance(pb, str)
+
+
+def decode(data: Dict[str, Any], cls: Type[BaseTirage] = BaseTirage) -> BaseTirage:
+    """Rebuild a tirage from its document, after checking the document is valid."""
+
+    check(isinstance(data, dict), "le tirage n'est pas un objet")
+    check(data.get("version") == VERSION, f"version {data.get('version')} inconnue")
+    check(isinstance(data.get("id"), int), "id invalide")
+
+    fmt = data.get("format")
+    check(
+        isinstance(fmt, list) and all(isinstance(n, int) and n > 0 for n in fmt),
+        "format invalide",
+    )
+
+    teams = {}
+    for t in data.get("teams", ()):
+        accepted, rejected = t.get("accepted"), t.get("rejected")
+        check(isinstance(t.get("name"), str), "nom d'équipe invalide")
+        check(isinstance(t.get("mention"), str), f"mention de {t['name']} invalide")
+        check(
+            isinstance(accepted, list)
+            and len(accepted) == len(ROUND_NAMES)
+            and all(map(is_problem, accepted)),
+            f"problèmes acceptés de {t['name']} invalides",
+        )
+        check(
+            isinstance(rejected, list)
+            and len(rejected) == len(ROUND_NAMES)
+            and all(
+                isinstance(r, list) and all(isinstance(pb, str) for pb in r)
+                for r in rejected
+            ),
+            f"problèmes refusés de {t['name']} invalides",
+        )
+        teams[t["name"]] = Team.restore(t["name"], t["mention"], accepted, rejected)
+    check(len(teams) == sum(fmt), "le nombre d'équipes ne correspond pas au format")
+
+    poules = {}
+    for p in data.get("poules", ()):
+        check(
+            isinstance(p.get("poule"), str)
+            and p.get("rnd") in range(len(ROUND_NAMES))
+            and isinstance(p.get("teams"), list)
+            and all(t in teams for t in p["teams"]),
+            "poule invalide",
+        )
+        poules[Poule(p["poule"], p["rnd"])] = list(p["teams"])
+
+    return cls.restore(data["id"], tuple(fmt), teams, poules)
+
+
+def dumps(tirage: BaseTirage) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(encode(tirage))
+    return json.dumps(encode(tirage), separators=(",", ":")).encode()
+
+
+def loads(raw: Union[bytes, str], cls: Type[BaseTirage] = BaseTirage) -> BaseTirage:
+    try:
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except ValueError as e:
+        raise InvalidTirage(f"JSON invalide: {e}")
+    return decode(data, cls)
+
+
+# The C parser is much faster, when libyaml is available
+class LegacyLoader(getattr(yaml, "CSafeLoader", yaml.SafeLoader)):
+    """
+    Safe loader for the yaml files written before the codec.
+
+    Tirages, teams and poules are built as codec documents,
+    any other python object is refused.
+    """
+
+
+def construct_tirage(loader: LegacyLoader, node):
+    state = loader.construct_mapping(node, deep=True)
+    return {
+        "version": VERSION,
+        "id": state.get("id"),
+        "format": list(state.get("format", ())),
+        "teams": list(state.get("teams", {}).values()),
+        "poules": [
+            {"poule": poule, "rnd": rnd, "teams": teams}
+            for (poule, rnd), teams in state.get("poules", {}).items()
+        ],
+    }
+
+
+def construct_team(loader: LegacyLoader, node):
+    state = loader.construct_mapping(node, deep=True)
+    return {
+        "name": state.get("name"),
+        "mention": state.get("mention"),
+        "accepted": list(state.get("accepted_problems", ())),
+        "rejected": [sorted(r) for r in state.get("rejected", ())],
+    }
+
+
+def construct_poule(loader: LegacyLoader, node):
+    # A tuple, as poules are used as keys
+    state = loader.construct_mapping(node)
+    return state["poule"], state["rnd"]
+
+
+def construct_tuple(loader: LegacyLoader, node):
+    return tuple(loader.construct_sequence(node))
+
+
+# The yaml tags of the classes have no "!", so they are local tags
+LegacyLoader.add_constructor("Tirage", construct_tirage)
+# DiscordTirage had no tag of its own, the bot saved it as a python object
+LegacyLoader.add_constructor(
+    "tag:yaml.org,2002:python/object:src.cogs.tirages.DiscordTirage",
+    construct_tirage,
+)
+LegacyLoader.add_constructor(
+    "tag:yaml.org,2002:python/object:src.base_tirage.BaseTirage", construct_tirage
+)
+LegacyLoader.add_constructor("Poule", construct_poule)
+LegacyLoader.add_constructor(
+    "tag:yaml.org,2002:python/object:src.base_tirage.Team", construct_team
+)
+LegacyLoader.add_constructor("tag:yaml.org,2002:python/tuple", construct_tuple)
+
+
+def load_legacy_yaml(
+    stream: Union[str, IO], cls: Type[BaseTirage] = BaseTirage
+) -> Dict[int, BaseTirage]:
+    """Read the tirages of a file written by the old `yaml.dump`."""
+
+    try:
+        documents = yaml.load(stream, Loader=LegacyLoader) or {}
+    except yaml.YAMLError as e:
+        raise InvalidTirage(str(e))
+
+    tirages = {}
+    for tirage_id, data in documents.items():
+        data["id"] = tirage_id
+        tirages[tirage_id] = decode(data, cls)
+    return tirages
+
+
+class LegacyDumper(getattr(yaml, "CDumper", yaml.Dumper)):
+    """Writes tirages with the tags of the old yaml files, for the benchmark."""
+
+
+def represent_tirage(dumper: LegacyDumper, tirage: BaseTirage):
+    state = {"id": tirage.id, "format": tuple(tirage.format)}
+    state.update(teams=tirage.teams, poules=tirage.poules)
+    return dumper.represent_mapping("Tirage", state)
+
+
+def represent_team(dumper: LegacyDumper, team: Team):
+    state = {
+        "name": team.name,
+        "mention": team.mention,
+        "accepted_problems": list(team.accepted_problems),
+        "rejected": [set(r) for r in team.rejected],
+    }
+    return dumper.represent_mapping(
+        "tag:yaml.org,2002:python/object:src.base_tirage.Team", state
+    )
+
+
+def represent_poule(dumper: LegacyDumper, poule: Poule):
+    return dumper.represent_mapping("Poule", {"poule": poule.poule, "rnd": poule.rnd})
+
+
+LegacyDumper.add_multi_representer(BaseTirage, represent_tirage)
+LegacyDumper.add_representer(Team, represent_team)
+LegacyDumper.add_representer(Poule, represent_poule)
+
+
+def dump_legacy_yaml(tirages: Dict[int, BaseTirage]) -> str:
+    return yaml.dump(tirages, Dumper=LegacyDumper)
+
+
+def random_tirage(tirage_id) -> BaseTirage:
+    """A finished tirage with random teams and problems."""
+
+    fmt = random.choice([(3, 3), (3, 4), (4, 4), (5, 5), (3, 3, 3)])
+    names = random.sample(
+        [f"{a}{b}{c}" for a in "ABCD" for b in "EFGH" for c in "IJKL"], sum(fmt)
+    )
+
+    teams = {}
+    for name in names:
+        rejected = [
+            set(random.sample(PROBLEMS, random.randint(0, 4))) for _ in ROUND_NAMES
+        ]
+        accepted = [random.choice(PROBLEMS) for _ in ROUND_NAMES]
+        teams[name] = Team.restore(
+            name, f"<@&{random.getrandbits(60)}>", accepted, rejected
+        )
+
+    poules = {}
+    for rnd in range(len(ROUND_NAMES)):
+        random.shuffle(names)
+        start = 0
+        for i, size in enumerate(fmt):
+            poules[Poule(chr(ord("A") + i), rnd)] = names[start : start + size]
+            start += size
+
+    return BaseTirage.restore(tirage_id, fmt, teams, poules)
+
+
+def timed(f, *args):
+    start = perf_counter()
+    result = f(*args)
+    return result, perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--tirages", type=int, default=1000)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    tirages = {i: random_tirage(i) for i in range(args.tirages)}
+
+    legacy, yaml_dump = timed(dump_legacy_yaml, tirages)
+    loaded, yaml_load = timed(load_legacy_yaml, legacy)
+    # yaml.dump sorts the teams by name
+    assert all(
+        sorted(encode(loaded[i])["teams"], key=str)
+        == sorted(encode(t)["teams"], key=str)
+        for i, t in tirages.items()
+    )
+
+    raw, codec_dump = timed(lambda: [dumps(t) for t in tirages.values()])
+    decoded, codec_load = timed(lambda: [loads(r) for r in raw])
+    assert [encode(t) for t in decoded] == [encode(t) for t in tirages.values()]
+
+    backend = "orjson" if orjson is not None else "json"
+    print(f"{args.tirages} tirages")
+    print(f"{'':>20} {'dump':>10} {'load':>10} {'size':>10}")
+    print(
+        f"{'yaml, safe loader':>20} {yaml_dump:9.3f}s {yaml_load:9.3f}s {len(legacy):>10}"
+    )
+    print(
+        f"{'codec, ' + backend:>20} {codec_dump:9.3f}s {codec_load:9.3f}s "
+        f"{sum(map(len, raw)):>10}"
+    )
+
+
+if __name__ == "__main__":
+    main()
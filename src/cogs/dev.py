@@ -8,7 +8,7 @@ from textwrap import indent
 from typing import Union
 
 import discord
-from discord import TextChannel, PermissionOverwrite, Message, ChannelType
+from discord import TextChannel, Message, ChannelType
 from discord.ext.commands import (
     command,
     has_role,
@@ -21,10 +21,11 @@ from discord.ext.commands import (
 from discord.utils import get
 from ptpython.repl import embed
 
+from src import layout
 from src.constants import *
 from src.core import CustomBot
 from src.errors import TfjmError
-from src.utils import fg, french_join
+from src.utils import fg
 
 COGS_SHORTCUTS = {
     "bt": "src.base_tirage",
@@ -137,77 +138,26 @@ class DevCog(Cog, name="Dev tools"):
         else:
             await ctx.send(f":tada: L'extension **{name}** a bien été ajoutée !")
 
-    # noinspection PyUnreachableCode
-    @command(name="setup")
+    @command(name="setup", usage="[--apply]")
     @has_role(Role.DEV)
-    async def setup_roles(self, ctx: Context, *teams: discord.Role):
+    async def setup_cmd(self, ctx: Context, apply: str = ""):
         """
-        (dev) Commande temporaire pour setup le serveur.
-        """
-        return
-        finalist = get(ctx.guild.roles, name=Role.FINALISTE)
-        assert finalist
-
-        for t in teams:
-            m: discord.Member
-            for m in t.members:
-                await m.add_roles(finalist)
-
-        await ctx.send(
-            f"{french_join(t.mention for t in teams)} ont été ajouté en finale !"
-        )
-
-        return
-        guild: discord.Guild = ctx.guild
-        nothing = PermissionOverwrite(read_messages=False)
-        see = PermissionOverwrite(read_messages=True)
-        # orga = get(guild.roles, name=f"Orga {t}")
-
-        for t in TOURNOIS[3:]:
-            jury = get(guild.roles, name=f"Jury {t}")
-            for p in "AB":
-                await guild.create_voice_channel(
-                    f"blabla-jury-poule-{p}",
-                    overwrites={guild.default_role: nothing, jury: see},
-                    category=get(guild.categories, name=t),
-                )
+        (dev) Met le serveur en accord avec `data/layout.yaml`.
 
-        return
+        Sans argument, affiche seulement ce qui serait fait et le nombre
+        d'appels à l'API nécessaires. Rien n'est jamais supprimé.
 
-        aide: TextChannel = get(guild.text_channels, name="aide")
-        for t in TOURNOIS:
-            await aide.set_permissions(orga, overwrite=see)
-            await aide.set_permissions(jury, overwrite=see)
-
-        return
-
-        tournois = {
-            tournoi: get(guild.categories, name=tournoi) for tournoi in TOURNOIS
-        }
-
-        for ch in guild.text_channels:
-            print(repr(ch.category))
-
-        for tournoi, cat in tournois.items():
-            if tournoi == "Lyon":
-                continue
+        Exemples:
+            `!setup` - Montre ce qui doit changer
+            `!setup --apply` - Fait les changements
+        """
 
-            jury_channel: TextChannel = get(
-                guild.text_channels, category=cat, name="cro"
-            )
-            await jury_channel.delete()
-            # jury = get(guild.roles, name=f"Jury {tournoi}")
-            orga = get(guild.roles, name=f"Orga {tournoi}")
-            ov = {
-                guild.default_role: nothing,
-                # jury: see,
-                orga: see,
-            }
-            await guild.create_text_channel(
-                f"cro-{tournoi}", category=cat, overwrites=ov
-            )
+        steps, problems = layout.plan(ctx.guild, layout.load_layout())
+        await ctx.send(layout.describe(steps, problems))
 
-            await ctx.send(str(jury_channel))
+        if apply == "--apply" and any(steps):
+            await layout.apply(steps)
+            await ctx.send(":tada: Le serveur est à jour.")
 
     @command(name="send")
     @has_role(Role.DEV)
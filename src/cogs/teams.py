@@ -1,39 +1,120 @@
-from collections import namedtuple
-from typing import List, Tuple
+import asyncio
+import sys
+import traceback
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import discord
 from discord import Member, VoiceChannel, PermissionOverwrite
 from discord.ext import commands
 from discord.ext.commands import Cog, group, Context
-from discord.utils import get, find
+from discord.utils import get
 
 from src.constants import *
 from src.core import CustomBot
-from src.utils import has_role, send_and_bin, french_join
+from src.outbox import LiveMessage, Outbox
+from src.registry import Membership, Team, TeamRegistry
+from src.tirage_store import get_store
+from src.utils import RateLimiter, send_and_bin, french_join
+
+POULE_EDITS = (10, 10)
+"""Edits of the voice channels of the poules allowed by `!poules`, as (calls, seconds)."""
+IMPORT_WORKERS = 4
+"""Teams imported at the same time by `!team import`."""
+IMPORT_ROUTES = {
+    "create_role": (5, 10),
+    "create_channel": (5, 10),
+}
+"""Requests allowed per route by `!team import`, as (calls, seconds)."""
+
+
+def poule_channel(category: discord.CategoryChannel, poule) -> Optional[VoiceChannel]:
+    return get(category.voice_channels, name=f"Poule {poule}")
+
+
+def poule_overwrites(
+    guild: discord.Guild, tournoi, teams: Iterable[discord.Role]
+) -> Dict[discord.Role, PermissionOverwrite]:
+    """The permissions of the voice channel of a poule: only its teams, the jury and the orgas."""
+
+    overwrites = {
+        guild.default_role: PermissionOverwrite(connect=False, view_channel=False)
+    }
+    for name in (f"Jury {tournoi}", f"Orga {tournoi}"):
+        role = get(guild.roles, name=name)
+        if role is not None:
+            overwrites[role] = PermissionOverwrite(
+                view_channel=True, connect=True, mute_members=True
+            )
+    for team in teams:
+        overwrites[team] = PermissionOverwrite(view_channel=True, connect=True)
+    return overwrites
+
+
+async def sync_overwrites(channel, overwrites) -> int:
+    """
+    Give these permissions to the channel in a single request, if they changed.
 
-Team = namedtuple("Team", ["name", "trigram", "tournoi", "secret", "status"])
+    Return the number of roles whose permissions were changed.
+    """
+
+    current = channel.overwrites
+    changed = sum(
+        current.get(target) != overwrites.get(target)
+        for target in current.keys() | overwrites.keys()
+    )
+    if changed:
+        await channel.edit(overwrites=overwrites, reason="Setup of a poule")
+    return changed
 
 
 class TeamsCog(Cog, name="Teams"):
     def __init__(self, bot: CustomBot):
         self.bot = bot
-        self.teams = self.load_teams()
-
-    def load_teams(self):
-        with open(File.TEAMS) as f:
-            # first line is header
-            lines = f.read().splitlines()[1:]
-        teams = [
-            Team(*[field.strip('"') for field in line.split(";")]) for line in lines
-        ]
-        return teams
+        self.teams = TeamRegistry()
+        self.membership = Membership(self.teams)
+
+    def members(self, guild) -> Membership:
+        """The index of the members of the teams, built the first time."""
+
+        if not self.membership.ready:
+            self.membership.build(guild)
+        return self.membership
+
+    @Cog.listener()
+    async def on_ready(self):
+        for guild in self.bot.guilds:
+            self.membership.build(guild)
+
+    @Cog.listener()
+    async def on_member_update(self, before: Member, after: Member):
+        if self.membership.ready and before.roles != after.roles:
+            self.membership.update_member(after)
+
+    @Cog.listener()
+    async def on_member_join(self, member: Member):
+        if self.membership.ready:
+            self.membership.update_member(member)
+
+    @Cog.listener()
+    async def on_member_remove(self, member: Member):
+        self.membership.remove_member(member.id)
+
+    @Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if self.membership.ready and before.name != after.name:
+            self.membership.update_role(before, after)
+
+    @Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        if self.membership.ready:
+            self.membership.update_role(role)
 
     def teams_for(self, member) -> List[Tuple[Team, discord.Role]]:
         """Return a list of pairs (role, team) corresponding to the teams of the member"""
 
         teams = []
         for role in member.roles:
-            team = get(self.teams, trigram=role.name)
+            team = self.teams.for_role(role)
             if team:
                 teams.append((team, role))
         return teams
@@ -49,45 +130,86 @@ class TeamsCog(Cog, name="Teams"):
         *teams: discord.Role,
     ):
         """(cno) Setup les permissions pour un salon vocal de poule"""
-        assert poule in "AB"
-        see = PermissionOverwrite(connect=True, speak=False)
-        speak = PermissionOverwrite(connect=True, speak=True)
 
-        guild: discord.Guild = ctx.guild
-        name = "Poule" + ("" if poule is None else " " + poule)
-        channel: VoiceChannel = get(
-            guild.voice_channels, category__name=category.name, name=name
+        channel = poule_channel(category, poule)
+        if channel is None:
+            return f"Il n'y a pas de salon vocal Poule {poule} dans {category.name}."
+
+        changed = await sync_overwrites(
+            channel, poule_overwrites(ctx.guild, category.name, teams)
         )
+        if not changed:
+            return "Les permissions étaient déjà bonnes."
+        return f"C'est fait ! ({changed} rôles modifiés)"
 
-        role: discord.Role
-        for role in channel.overwrites:
-            # remove all permissions
-            await channel.set_permissions(role, overwrite=None)
+    @commands.command(name="poules", usage="TOUR [TOURNOI:ID ...]")
+    @commands.has_role(Role.CNO)
+    @send_and_bin
+    async def setup_poules(self, ctx: Context, rnd: int, *tirages: str):
+        """
+        (cno) Setup les salons vocaux de toutes les poules d'un tour.
 
-        orga = get(guild.roles, name=f"Orga {category.name}")
-        jury = get(guild.roles, name=f"Jury {category.name}")
+        Pour chaque tournoi, les poules sont celles du dernier tirage
+        commencé dans sa catégorie. On peut aussi donner l'ID du tirage
+        d'un tournoi.
 
-        await channel.set_permissions(
-            guild.default_role, connect=False, view_channel=False
-        )
-        await channel.set_permissions(
-            jury, view_channel=True, connect=True, mute_members=True
-        )
-        await channel.set_permissions(
-            orga, view_channel=True, connect=True, mute_members=True
-        )
-        for team in teams:
-            await channel.set_permissions(team, view_channel=True, connect=True)
+        Exemples:
+            `!poules 1` - Les poules du premier tour de tous les tournois
+            `!poules 2 Finale:42` - Pour la finale, avec le tirage n°42
+        """
+
+        if rnd not in range(1, len(ROUND_NAMES) + 1):
+            return f"Le tour doit être entre 1 et {len(ROUND_NAMES)}."
 
-        # tourist_name = f"{category.name} {poule}"
-        # tourist = get(guild.roles, name=tourist_name)
-        # if tourist is None:
-        #     tourist = await guild.create_role(name=tourist_name)
-        #
-        # await channel.set_permissions(tourist, connect=True, speak=False)
+        chosen = {}
+        for arg in tirages:
+            tournoi, _, tirage_id = arg.rpartition(":")
+            if tournoi not in TOURNOIS or not tirage_id.isdigit():
+                return f"`{arg}` n'est pas de la forme `TOURNOI:ID`."
+            chosen[tournoi] = int(tirage_id)
 
-        # return str(channel.changed_roles)
-        return "C'est fait !"
+        store = get_store()
+        guild: discord.Guild = ctx.guild
+        jobs = []
+        missing = []
+        no_tirage = []
+        for tournoi in TOURNOIS:
+            category = get(guild.categories, name=tournoi)
+            if category is None:
+                missing.append(tournoi)
+                continue
+            tirage_id = chosen.get(tournoi, store.latest_of(tournoi))
+            tirage = store.load(tirage_id) if tirage_id is not None else None
+            if tirage is None:
+                no_tirage.append(tournoi)
+                continue
+
+            for poule, trigrams in sorted(tirage.poules.items(), key=str):
+                if poule.rnd != rnd - 1:
+                    continue
+                channel = poule_channel(category, poule.poule)
+                roles = [get(guild.roles, name=t) for t in trigrams]
+                if channel is None or None in roles:
+                    missing.append(f"{tournoi} {poule}")
+                    continue
+                jobs.append((channel, poule_overwrites(guild, tournoi, roles)))
+
+        limiter = RateLimiter(*POULE_EDITS)
+
+        async def sync(channel, overwrites):
+            async with limiter:
+                return await sync_overwrites(channel, overwrites)
+
+        changed = await asyncio.gather(*(sync(*job) for job in jobs))
+        msg = f"{sum(map(bool, changed))} salons modifiés sur {len(jobs)}."
+        if missing:
+            msg += f" Salons ou rôles introuvables pour {french_join(missing)}."
+        if no_tirage:
+            msg += (
+                f" Pas de tirage trouvé pour {french_join(no_tirage)}, "
+                f"il faut le donner avec `TOURNOI:ID`."
+            )
+        return msg
 
     @commands.command(name="tourist", aliases=["touriste"])
     @send_and_bin
@@ -147,18 +269,20 @@ class TeamsCog(Cog, name="Teams"):
 
         await ctx.message.delete()
 
-        team: Team = get(self.teams, trigram=trigram)
+        team: Team = self.teams.get(trigram)
         role: discord.Role = get(ctx.guild.roles, name=trigram)
         captain_role = get(ctx.guild.roles, name=Role.CAPTAIN)
+        # The roles created by `!team import` have no captain yet
+        captains = self.members(ctx.guild).captains_of(trigram) if role else set()
 
         if team is None:
             msg = (
                 f"{ctx.author.mention}: le trigram `{trigram}` "
                 f"n'est pas valide. Es-tu sûr d'avoir le bon ?"
             )
-        elif role is not None:
+        elif captains:
             # Team exists
-            captain = find(lambda m: captain_role in m.roles, role.members)
+            captain = ctx.guild.get_member(next(iter(captains))) or role
             msg = (
                 f"{ctx.author.mention}: l'équipe {trigram} "
                 f"existe déjà. Tu peux demander a ton capitaine "
@@ -173,7 +297,7 @@ class TeamsCog(Cog, name="Teams"):
         else:
             # Team creation !
             guild: discord.Guild = ctx.guild
-            team_role = await guild.create_role(
+            team_role = role or await guild.create_role(
                 name=trigram,
                 color=discord.Colour.from_rgb(255, 255, 255),
                 reason="Creation of a new team",
@@ -331,6 +455,100 @@ class TeamsCog(Cog, name="Teams"):
 
         return f"{ctx.author.mention}: La salon vocal '{channel.mention}' à été créé."
 
+    @team.command(name="import")
+    @commands.has_role(Role.CNO)
+    async def import_cmd(self, ctx: Context):
+        """
+        (cno) Crée les rôles et les salons de toutes les équipes inscrites.
+
+        Pour chaque équipe du fichier des inscriptions, crée son rôle et
+        son salon s'ils n'existent pas. Le capitaine prend ensuite le rôle
+        avec `!team create`. Ce qui existe déjà n'est pas refait, la
+        commande peut donc être relancée si elle s'arrête.
+        """
+
+        guild: discord.Guild = ctx.guild
+        teams = list(self.teams)
+        counts = {"Rôles créés": 0, "Salons créés": 0}
+        errors: Dict[str, str] = {}
+        done = 0
+
+        def progress(finished=False):
+            embed = discord.Embed(
+                title="Import des équipes" + (" terminé" if finished else ""),
+                description=f"{done}/{len(teams)} équipes",
+                color=EMBED_COLOR,
+            )
+            for name, n in counts.items():
+                embed.add_field(name=name, value=str(n))
+            if errors:
+                txt = "\n".join(f"{t}: {e}" for t, e in errors.items())
+                embed.add_field(name="Erreurs", value=txt[:1024], inline=False)
+            return embed
+
+        board = LiveMessage(Outbox(ctx.channel), pin=False)
+        board.update(progress())
+
+        limiters = {
+            route: RateLimiter(*limit) for route, limit in IMPORT_ROUTES.items()
+        }
+        queue = asyncio.Queue()
+        for team in teams:
+            queue.put_nowait(team)
+
+        async def worker():
+            nonlocal done
+            while not queue.empty():
+                team = queue.get_nowait()
+                try:
+                    result = await self.import_team(guild, team, limiters)
+                except discord.HTTPException as e:
+                    errors[team.trigram] = e.text or str(e.status)
+                except Exception as e:
+                    # The other teams are still imported, and the board closed
+                    traceback.print_tb(e.__traceback__, file=sys.stderr)
+                    errors[team.trigram] = repr(e)
+                else:
+                    for key, n in result.items():
+                        counts[key] += n
+                done += 1
+                board.update(progress())
+
+        await asyncio.gather(*(worker() for _ in range(IMPORT_WORKERS)))
+        await board.close(progress(finished=True))
+
+    async def import_team(
+        self, guild: discord.Guild, team: Team, limiters: Dict[str, RateLimiter]
+    ) -> Dict[str, int]:
+        """Create what is missing for the team, and count what was done."""
+
+        role = get(guild.roles, name=team.trigram)
+        created_role = role is None
+        if created_role:
+            async with limiters["create_role"]:
+                role = await guild.create_role(
+                    name=team.trigram,
+                    color=discord.Colour.from_rgb(255, 255, 255),
+                    reason="Import of the teams",
+                )
+
+        category = get(guild.categories, name=TEAMS_CHANNEL_CATEGORY)
+        channels = category.text_channels if category else guild.text_channels
+        created_channel = get(channels, name=team.trigram.lower()) is None
+        if created_channel:
+            async with limiters["create_channel"]:
+                await guild.create_text_channel(
+                    team.trigram.lower(),
+                    overwrites={
+                        guild.default_role: PermissionOverwrite(read_messages=False),
+                        role: PermissionOverwrite(read_messages=True),
+                    },
+                    category=category,
+                    reason="Import of the teams",
+                )
+
+        return {"Rôles créés": int(created_role), "Salons créés": int(created_channel)}
+
     @team.command(name="list")
     @commands.has_role(Role.CNO)
     async def list_cmd(self, ctx):
@@ -338,15 +556,9 @@ class TeamsCog(Cog, name="Teams"):
 
         embed = discord.Embed(title="Liste des équipes", color=EMBED_COLOR)
 
-        captains = [m for m in ctx.guild.members if has_role(m, Role.CAPTAIN)]
-        tournois = {
-            tournoi: [c for c in captains if has_role(c, tournoi)]
-            for tournoi in TOURNOIS
-        }
-
-        for tournoi, caps in tournois.items():
-            # we assume captains have exactly one team.
-            txt = "\n".join(self.teams_for(c)[0][0].trigram for c in caps)
+        tournois = self.members(ctx.guild).teams_by_tournoi()
+        for tournoi in TOURNOIS:
+            txt = "\n".join(tournois.get(tournoi, ()))
             txt = txt or "Il n'y a pas encore d'équipes sur le discord."
             embed.add_field(name=tournoi, value=txt)
 
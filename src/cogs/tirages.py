@@ -7,66 +7,153 @@ import sys
 import traceback
 from collections import defaultdict, namedtuple
 from dataclasses import dataclass
+from datetime import timedelta
 from functools import wraps
 from io import StringIO
+from itertools import groupby
+from operator import itemgetter
 from pprint import pprint
+from time import time
 from typing import Type, Dict, Union, Optional, List
 
-import aiohttp
 import discord
-import yaml
 from discord.ext import commands
 from discord.ext.commands import group, Cog, Context, RoleConverter
 from discord.utils import get
 
+from src.api import get_pusher
 from src.base_tirage import BaseTirage, Event, Poule
 from src.constants import *
 from src.core import CustomBot
 from src.errors import TfjmError, UnwantedCommand
+from src.export import export
+from src.journal import Journal
+from src.montecarlo import Rules, Strategy, simulate_async
+from src.outbox import MAX_MESSAGE_LENGTH, LiveMessage, Outbox
+from src.partition import pool_sizes
+from src.passage import layout, render_table
+from src.scheduler import TirageScheduler
+from src.timings import summary
+from src.tirage_store import TirageStore, get_store
 
 __all__ = ["TirageCog"]
 
-from src.utils import send_and_bin, french_join, pprint_send, confirm
+from src.utils import send_and_bin, french_join, pprint_send, confirm, paginate
 
 RE_DRAW_START = re.compile(
-    r"^((?P<fmt>\d(\+\d)*) )?(?P<teams>[A-Z]{3}(\s[A-Z]{3})+)((?P<finale>\s--finale)|(\s--continue[= ](?P<continue>\d+)))$"
+    r"^((?P<fmt>\d+(\+\d+)*) )?(?P<teams>[A-Z]{3}(\s[A-Z]{3})+)$"
 )
+START_FLAGS = {"--optimize": "optimize", "--optimise": "optimize", "--finale": "finale"}
 
 Record = namedtuple("Record", ["name", "pb", "penalite"])
 
+TIRAGES_PER_PAGE = 20
+MAX_CONCURRENT_SENDS = 2
+"""How many requests a tirage can send to discord at the same time."""
+NOT_YOUR_TURN = "ce n'était pas à ton tour."
+MIN_POULE_SIZE = 3
+MAX_POULE_SIZE = len(PROBLEMS)
+"""With more teams, the last ones could have no problem left to draw."""
+MAX_FIELD_LENGTH = 1024
+MAX_FIELDS = 25
+"""Fields allowed in an embed."""
+MIN_DEADLINE = 10
+MAX_TABLE_LENGTH = 2000
+
+
+async def delete_and_explain(ctx, reason=None):
+    await ctx.message.delete()
+    await ctx.author.send(
+        "J'ai supprimé ton message:\n> "
+        + ctx.message.clean_content
+        + "\nC'est pas grave, c'est juste pour ne pas encombrer "
+        "le chat lors du tirage."
+    )
+    if reason:
+        await ctx.author.send(f"Raison: {reason}")
+
 
 def delete_and_pm(f):
+    """Delete the message that triggered the event being handled and PM the reason."""
+
     @wraps(f)
     async def wrapper(self, *args, **kwargs):
-        await self.ctx.message.delete()
-        await self.ctx.author.send(
-            "J'ai supprimé ton message:\n> "
-            + self.ctx.message.clean_content
-            + "\nC'est pas grave, c'est juste pour ne pas encombrer "
-            "le chat lors du tirage."
-        )
-
         msg = await f(self, *args, **kwargs)
-        if msg:
-            await self.ctx.author.send(f"Raison: {msg}")
+        ctx = self.current_event and self.current_event.ctx
+        if ctx is not None:
+            async with self.limiter:
+                await delete_and_explain(ctx, msg)
 
     return wrapper
 
 
+def parse_start(args):
+    """
+    Split the arguments of `!draw start`, with the options in any order.
+
+    Return the match of the format and the teams, the set of options and
+    the id given with `--continue`, or None if the command is malformed.
+    """
+
+    words, flags, continue_id = [], set(), None
+    args = iter(args)
+    for arg in args:
+        if arg.startswith("--continue"):
+            value = arg[len("--continue=") :] if "=" in arg else next(args, "")
+            if not value.isdigit() or continue_id is not None:
+                return None
+            continue_id = int(value)
+        elif arg.startswith("--"):
+            if arg not in START_FLAGS:
+                return None
+            flags.add(START_FLAGS[arg])
+        else:
+            words.append(arg)
+
+    match = re.match(RE_DRAW_START, " ".join(words))
+    if match is None or ("finale" in flags and continue_id is not None):
+        return None
+    return match, flags, continue_id
+
+
+def describe_phase(phase):
+    name, *args = phase
+    if name == "start":
+        return "début"
+    if name == "poules":
+        return f"tirage des poules du {ROUND_NAMES[args[0]]}"
+    if name == "order":
+        return f"ordre de tirage de la poule {args[0]}"
+    if name == "problem":
+        return f"poule {args[0]}, {args[1]} tire un problème"
+    return "fini"
+
+
+def describe_deadline(tirage):
+    if tirage.deadline is None:
+        return "aucun"
+    auto = ", puis jeu automatique" if tirage.autoplay else ""
+    return f"{tirage.deadline:.0f}s{auto}"
+
+
 def send_all(f):
     @wraps(f)
     async def wrapper(self, *args, **kwargs):
         async for msg in f(self, *args, **kwargs):
-            await self.ctx.send(msg)
+            self.outbox.put(msg)
 
     return wrapper
 
 
 def safe(f):
     @wraps(f)
-    async def wrapper(*args, **kwargs):
+    async def wrapper(self, *args, **kwargs):
+        if self.replaying:
+            # Those messages were already sent before the tirage was interrupted
+            return
+
         try:
-            return await f(*args, **kwargs)
+            return await f(self, *args, **kwargs)
         except Exception as e:
             traceback.print_tb(e.__traceback__, file=sys.stderr)
             print(e)
@@ -77,38 +164,70 @@ def safe(f):
 class DiscordTirage(BaseTirage):
     def __init__(self, ctx, *teams, fmt):
         super(DiscordTirage, self).__init__(*teams, fmt=fmt)
-        self.ctx = ctx
-        self.captain_mention = get(ctx.guild.roles, name=Role.CAPTAIN).mention
+        self.attach(ctx)
 
-        ts = self.load_all()
-        self.id = 1 + (max(ts) if ts else 0)
+        self.id = get_store().new_id()
         self.save()
 
-    @staticmethod
-    def load_all():
-        if not File.TIRAGES.exists():
-            return {}
+    @classmethod
+    def restore(cls, id, fmt, teams, poules):
+        tirage = super().restore(id, fmt, teams, poules)
+        tirage.ctx = None
+        tirage.captain_mention = None
+        tirage.limiter = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+        tirage.outbox = None
+        tirage.board = None
+        tirage.board_dices = {}
+        return tirage
+
+    @classmethod
+    def load(cls, tirage_id) -> Optional["DiscordTirage"]:
+        return get_store().load(tirage_id, cls)
+
+    @classmethod
+    def load_all(cls):
+        return get_store().load_all(cls)
 
-        with open(File.TIRAGES) as f:
-            tirages = yaml.load(f)
+    def save(self):
+        get_store().save(self)
 
-        return tirages
+    def attach(self, ctx):
+        """Make the tirage ready to run in the channel of `ctx`, which can also be the channel."""
 
-    def save(self):
-        ts = self.load_all()
+        self.ctx = ctx
+        self.captain_mention = get(ctx.guild.roles, name=Role.CAPTAIN).mention
+        self.queue = asyncio.Queue()
+        self.limiter = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+        self.outbox = Outbox(
+            ctx.channel if isinstance(ctx, Context) else ctx, self.limiter
+        )
+        self.board = None
+        self.board_dices = {}
 
-        ctx = self.ctx
-        queue = self.queue
-        self.ctx = None
-        self.queue = None
-        ts[self.id] = self
+    async def next(self, typ, team=None, **kwargs):
+        # A captain has to answer, they need to see everything before.
+        await self.flush()
+        return await super().next(typ, team, **kwargs)
 
-        File.TIRAGES.touch()
-        with open(File.TIRAGES, "w") as f:
-            yaml.dump(ts, f)
+    async def run(self, rounds=(0, 1)):
+        try:
+            await super().run(rounds)
+        except asyncio.CancelledError:
+            # Aborted or the bot is stopping, nothing more is sent
+            self.outbox.cancel()
+            raise
+        finally:
+            await self.close()
 
-        self.ctx = ctx
-        self.queue = queue
+    @safe
+    async def flush(self):
+        await self.outbox.flush()
+
+    @safe
+    async def close(self):
+        """Send the last messages and wait for all the sends of the tirage."""
+
+        await self.outbox.close()
 
     def team_for(self, author):
         for team in self.teams:
@@ -132,33 +251,104 @@ class DiscordTirage(BaseTirage):
         ]
 
     async def dice(self, ctx, n):
-        self.ctx = ctx
         trigram = self.team_for(ctx.author)
 
         if trigram is None:
-            await self.warn_wrong_team(None, None)
+            await self.explain(ctx, NOT_YOUR_TURN)
         elif n == 100:
-            await super().dice(trigram)
+            await super().dice(trigram, ctx)
         else:
-            await self.warn_unwanted(int, int)
+            await self.explain(ctx, "Il faut lancer un dé à 100 faces.")
 
     async def rproblem(self, ctx):
-        self.ctx = ctx
         trigram = self.team_for(ctx.author)
 
-        if trigram is None:
-            await self.warn_wrong_team(None, None)
+        if trigram is None or self.current_poule(trigram) is None:
+            await self.explain(ctx, NOT_YOUR_TURN)
         else:
-            await super().rproblem(trigram)
+            await super().rproblem(trigram, ctx)
 
     async def accept(self, ctx, yes):
-        self.ctx = ctx
         trigram = self.team_for(ctx.author)
 
         if trigram is None:
-            await self.warn_wrong_team(None, None)
+            await self.explain(ctx, NOT_YOUR_TURN)
         else:
-            await super().accept(trigram, yes)
+            await super().accept(trigram, yes, ctx)
+
+    def open_board(self, title, teams, poule=None):
+        """Start a live scoreboard for these teams, pinned until it is closed."""
+
+        self.board = LiveMessage(self.outbox)
+        self.board_title = title
+        self.board_teams = list(teams)
+        self.board_poule = poule
+        self.board_dices = {}
+        self.refresh_board()
+
+    def refresh_board(self):
+        if self.board is not None:
+            self.board.update(self.render_board())
+
+    async def close_board(self, embed=None):
+        if self.board is not None:
+            board, self.board = self.board, None
+            await board.close(embed)
+
+    def render_board(self) -> discord.Embed:
+        embed = discord.Embed(
+            title=self.board_title,
+            description=f"Étape: {describe_phase(self.phase)}",
+            color=EMBED_COLOR,
+        )
+
+        def dice(trigram):
+            if trigram not in self.board_dices:
+                return "en attente"
+            return self.board_dices[trigram] or "à relancer"
+
+        if self.board_poule is None:
+            embed.add_field(
+                name="Dés",
+                value="\n".join(f"{t}: {dice(t)}" for t in self.board_teams),
+                inline=False,
+            )
+            return embed
+
+        poule = self.board_poule
+        rnd = poule.rnd
+        for trigram in self.board_teams:
+            team = self.teams[trigram]
+            lines = [f"Dé: {dice(trigram)}"]
+            lines.append(f"Problème: **{team.accepted(rnd) or 'pas encore tiré'}**")
+            if team.rejected_count(rnd):
+                lines.append(f"Refusés: {', '.join(sorted(team.rejected[rnd]))}")
+                lines.append(f"Coefficient: {team.coeff(rnd)}")
+            if team.accepted(rnd) is None:
+                free = max(0, MAX_REFUSE - team.rejected_count(rnd))
+                lines.append(f"Refus sans pénalité: {free}")
+            embed.add_field(name=trigram, value="\n".join(lines), inline=True)
+
+        counts = self.counts(poule)
+        capacity = self.capacity(poule)
+        available = []
+        for pb in PROBLEMS:
+            if counts[pb] < capacity:
+                last = capacity > 1 and counts[pb] == capacity - 1
+                available.append(pb + (" (une dernière place)" if last else ""))
+        embed.add_field(
+            name="Problèmes encore disponibles",
+            value="\n".join(available) or "aucun",
+            inline=False,
+        )
+        return embed
+
+    @safe
+    async def explain(self, ctx, reason):
+        """Reject a command that was not sent at the right time."""
+
+        async with self.limiter:
+            await delete_and_explain(ctx, reason)
 
     @safe
     @delete_and_pm
@@ -191,16 +381,39 @@ class DiscordTirage(BaseTirage):
     @safe
     @delete_and_pm
     async def warn_wrong_team(self, expected, got):
-        return "ce n'était pas à ton tour."
+        return NOT_YOUR_TURN
 
     @safe
     async def warn_colisions(self, collisions: List[str]):
-        await self.ctx.send(
+        for trigram in collisions:
+            self.board_dices[trigram] = None
+        self.refresh_board()
+        self.outbox.put(
             f"Les equipes {french_join(collisions)} ont fait le même résultat "
             "et doivent relancer un dé. "
             "Le nouveau lancer effacera l'ancien."
         )
 
+    @safe
+    async def warn_idle(self, teams: List[str]):
+        mentions = [self.teams[t].mention for t in teams]
+        msg = f"{french_join(mentions)}, c'est à vous ! "
+        if self.autoplay:
+            msg += (
+                f"Sans réponse dans {self.deadline / 2:.0f} secondes, "
+                f"je jouerai à votre place."
+            )
+        self.outbox.put(msg)
+
+    @safe
+    async def info_autoplay(self, event: Event):
+        if isinstance(event.value, bool):
+            self.outbox.put(f"Temps écoulé, j'accepte le problème pour {event.team}.")
+        elif isinstance(event.value, int):
+            self.outbox.put(f"Temps écoulé, je lance le dé pour {event.team}.")
+        else:
+            self.outbox.put(f"Temps écoulé, je tire un problème pour {event.team}.")
+
     @safe
     @delete_and_pm
     async def warn_twice(self, typ: Type):
@@ -214,6 +427,7 @@ class DiscordTirage(BaseTirage):
     @safe
     @send_all
     async def start_make_poule(self, rnd):
+        self.open_board(f"Poules du {ROUND_NAMES[rnd]}", self.teams)
         if rnd == 0:
             yield (
                 f"Les {self.captain_mention}s, vous pouvez désormais tous lancer un dé 100 "
@@ -230,6 +444,7 @@ class DiscordTirage(BaseTirage):
     @safe
     @send_all
     async def start_draw_poule(self, poule):
+        self.open_board(f"Poule {poule}", self.poules[poule], poule)
         yield (
             f"Nous allons commencer le tirage pour la poule **{poule}** entre les "
             f"équipes {french_join('**%s**' %p for p in self.poules[poule])}. Les autres équipes peuvent "
@@ -248,13 +463,15 @@ class DiscordTirage(BaseTirage):
 
     @safe
     async def start_select_pb(self, team):
-        await self.ctx.send(
+        self.refresh_board()
+        self.outbox.put(
             f"C'est au tour de {team.mention} de choisir un problème (`!rp`)."
         )
 
     @safe
     @send_all
     async def annonce_poules(self, poules):
+        await self.close_board()
         first = "\n".join(
             f"{p}: {french_join(t)}" for p, t in poules.items() if p.rnd == 0
         )
@@ -267,72 +484,32 @@ class DiscordTirage(BaseTirage):
             yield (f"Pour le second tour les poules sont :" f"```{second}```")
 
     @safe
-    @send_all
     async def annonce_draw_order(self, order):
-        order_str = "\n".join(f"{i+1}) {tri}" for i, tri in enumerate(order))
-        yield f"L'ordre de tirage des problèmes pour ce tour est donc: ```{order_str}```"
+        self.board_teams = list(order)
+        self.refresh_board()
 
-    @safe
-    async def annonce_poule(self, poule):
+    def render_summary(self, poule) -> discord.Embed:
         teams = [self.teams[tri] for tri in self.poules[poule]]
 
-        if len(teams) == 3:
-            table = """```
-╔═════╦═════════╦═════════╦═════════╗
-║ T F ║ Phase 1 ║ Phase 2 ║ Phase 3 ║
-║ J M ║  Pb. {0.pb}  ║  Pb. {1.pb}  ║  Pb. {2.pb}  ║
-╠═════╬═════════╬═════════╬═════════╣
-║ {0.name} ║   Def   ║   Rap   ║   Opp   ║
-╠═════╬═════════╬═════════╬═════════╣
-║ {1.name} ║   Opp   ║   Def   ║   Rap   ║
-╠═════╬═════════╬═════════╬═════════╣
-║ {2.name} ║   Rap   ║   Opp   ║   Def   ║
-╚═════╩═════════╩═════════╩═════════╝```"""
-        elif len(teams) == 4:
-            table = """```
-+-----+---------+---------+---------+---------+
-|     | Phase 1 | Phase 2 | Phase 3 | Phase 4 |
-|     |  Pb  {0.pb}  |  Pb  {1.pb}  |  Pb  {2.pb}  |  Pb  {3.pb}  |
-+-----+---------+---------+---------+---------+
-| {0.name} |   Déf   |         |   Rap   |   Opp   |
-+-----+---------+---------+---------+---------+
-| {1.name} |   Opp   |   Déf   |         |   Rap   |
-+-----+---------+---------+---------+---------+
-| {2.name} |   Rap   |   Opp   |   Déf   |         |
-+-----+---------+---------+---------+---------+
-| {3.name} |         |   Rap   |   Opp   |   Déf   |
-+-----+---------+---------+---------+---------+```"""
-        elif len(teams) == 5:
-            table = """```
-╔═══╦═══════════════════╦═══════════════════╦═════════╗
-║   ║      Phase 1      ║      Phase 2      ║ Phase 3 ║
-╠═══╬═════════╦═════════╬═════════╦═════════╬═════════╣
-║   ║ Salle 1 ║ Salle 2 ║ Salle 1 ║ Salle 2 ║ Salle 1 ║
-║   ║  Pb. {0.pb}  ║  Pb. {1.pb}  ║  Pb. {2.pb}  ║  Pb. {3.pb}  ║  Pb. {4.pb}  ║
-╠═══╬═════════╬═════════╬═════════╬═════════╬═════════╣
-║{0.name}║   Def   ║         ║   Opp   ║   Rap   ║         ║
-╠═══╬═════════╬═════════╬═════════╬═════════╬═════════╣
-║{1.name}║         ║   Def   ║   Rap   ║         ║   Opp   ║
-╠═══╬═════════╬═════════╬═════════╬═════════╬═════════╣
-║{2.name}║   Opp   ║         ║   Def   ║         ║   Rap   ║
-╠═══╬═════════╬═════════╬═════════╬═════════╬═════════╣
-║{3.name}║   Rap   ║   Opp   ║         ║   Def   ║         ║
-╠═══╬═════════╬═════════╬═════════╬═════════╬═════════╣
-║{4.name}║         ║   Rap   ║         ║   Opp   ║   Def   ║
-╚═══╩═════════╩═════════╩═════════╩═════════╩═════════╝```"""
-        else:
-            table = "WTF il n'y a pas 3,4 ou 5 equipes ici."
+        records = self.records(teams, poule.rnd)
+        table = render_table(records, layout(len(teams)))
+        if len(table) > MAX_TABLE_LENGTH:
+            table = render_table(records, layout(len(teams)), compact=True)
 
         embed = discord.Embed(
             title=f"Résumé du tirage entre {french_join([t.name for t in teams])}",
             color=EMBED_COLOR,
         )
 
-        embed.add_field(
-            name=ROUND_NAMES[poule.rnd].capitalize(),
-            value=table.format(*self.records(teams, poule.rnd)),
-            inline=False,
-        )
+        if len(table) <= MAX_FIELD_LENGTH:
+            embed.add_field(
+                name=ROUND_NAMES[poule.rnd].capitalize(),
+                value=table,
+                inline=False,
+            )
+        else:
+            # Big poules do not fit in a field
+            embed.description = f"**{ROUND_NAMES[poule.rnd].capitalize()}**\n{table}"
 
         for team in teams:
             embed.add_field(
@@ -344,10 +521,39 @@ class DiscordTirage(BaseTirage):
         embed.set_footer(
             text=f"Ce tirage peut être affiché à tout moment avec `!draw show {self.id}`"
         )
+        return embed
+
+    def summary(self, poule) -> discord.Embed:
+        """
+        The summary of the poule, rendered once per version of the tirage.
+
+        Only finished poules are cached, the others change at each step.
+        """
+
+        store = get_store()
+        version = store.version(self.id)
+        data = store.summary(self.id, poule, version)
+        if data is not None:
+            return discord.Embed.from_dict(data)
 
-        await self.ctx.send(embed=embed)
+        embed = self.render_summary(poule)
+        if all(self.teams[t].accepted(poule.rnd) for t in self.poules[poule]):
+            store.save_summary(self.id, poule, version, embed.to_dict())
+        return embed
 
+    @safe
+    async def annonce_poule(self, poule):
+        # Saved first, so the summary is cached for the new version
         self.save()
+        try:
+            embed = self.summary(poule)
+            if self.board is not None and self.board_poule == poule:
+                # The scoreboard becomes the summary
+                await self.close_board(embed)
+            else:
+                await self.outbox.send(embed=embed)
+        finally:
+            get_pusher().enqueue(self, poule)
 
     @safe
     @send_all
@@ -381,9 +587,9 @@ class DiscordTirage(BaseTirage):
         # TODO: make them available with the api
 
     @safe
-    @send_all
     async def info_dice(self, team, dice):
-        yield f"L'équipe {team} a lancé un... {dice} :game_die:"
+        self.board_dices[team] = dice
+        self.refresh_board()
 
     @safe
     @send_all
@@ -391,7 +597,7 @@ class DiscordTirage(BaseTirage):
 
         yield (f"L'équipe {self.mention(team.name)} a tiré... **{pb}**")
 
-        if pb in team.rejected[rnd]:
+        if team.has_rejected(rnd, pb):
             yield (
                 f"Vous avez déjà refusé **{pb}**, "
                 f"vous pouvez le refuser à nouveau (`!non`) et "
@@ -399,7 +605,7 @@ class DiscordTirage(BaseTirage):
                 f"ou changer d'avis et l'accepter (`!oui`)."
             )
         else:
-            if len(team.rejected[rnd]) >= MAX_REFUSE:
+            if team.rejected_count(rnd) >= MAX_REFUSE:
                 yield (
                     f"Vous pouvez accepter ou refuser **{pb}** "
                     f"mais si vous choisissez de le refuser, il y "
@@ -409,37 +615,25 @@ class DiscordTirage(BaseTirage):
             else:
                 yield (
                     f"Vous pouvez l'accepter (`!oui`) ou le refuser (`!non`). "
-                    f"Il reste {MAX_REFUSE - len(team.rejected[rnd])} refus sans pénalité "
+                    f"Il reste {MAX_REFUSE - team.rejected_count(rnd)} refus sans pénalité "
                     f"pour {team.mention}."
                 )
 
     @safe
     async def info_accepted(self, team, pb, still_available):
-        if still_available:
-            await self.ctx.send(
-                f"L'équipe {team.mention} a accepté "
-                f"**{pb}** ! Une autre équipe peut encore l'accepter."
-            )
-        else:
-            await self.ctx.send(
-                f"L'équipe {team.mention} a accepté "
-                f"**{pb}** ! Les autres équipes "
-                f"ne peuvent plus l'accepter."
-            )
+        self.refresh_board()
 
     @safe
     async def info_rejected(self, team, pb, rnd):
-        msg = f"{team.mention} a refusé **{pb}** "
-        if pb in team.rejected[rnd]:
-            msg += "sans pénalité."
-        else:
-            msg += "!"
-        await self.ctx.send(msg)
+        self.refresh_board()
+
+    async def show(self, ctx, *poules):
+        """Show the summary of the given poules, or all of them."""
 
-    async def show(self, ctx):
         self.ctx = ctx
-        for poule in self.poules:
-            await self.annonce_poule(poule)
+        self.outbox = Outbox(ctx.channel, self.limiter)
+        for poule in poules or self.poules:
+            await self.outbox.send(embed=self.summary(poule))
 
 
 class TirageCog(Cog, name="Tirages"):
@@ -450,9 +644,14 @@ class TirageCog(Cog, name="Tirages"):
         # We don't want tirages to be just an attribute
         # as we want them to outlive the Cog, for instance
         # if the cog is reloaded turing a tirage.
-        from src.tfjm_discord_bot import tirages
+        from src.tfjm_discord_bot import scheduler
 
-        self.tirages = tirages
+        self.scheduler: TirageScheduler = scheduler
+
+    def cog_unload(self):
+        # The queue is kept in the database, the worker starts again with
+        # the next poule or when the bot is ready.
+        asyncio.ensure_future(get_pusher().close())
 
     # ---------- Commandes hors du groupe draw ----------- #
 
@@ -492,8 +691,9 @@ class TirageCog(Cog, name="Tirages"):
                 )
 
         channel = ctx.channel.id
-        if channel in self.tirages:
-            await self.tirages[channel].dice(ctx, n)
+        tirage = self.scheduler.get(channel)
+        if tirage is not None:
+            await tirage.dice(ctx, n)
         else:
             if n == 0:
                 raise TfjmError(f"Un dé sans faces ? Le concept m'intéresse...")
@@ -516,10 +716,11 @@ class TirageCog(Cog, name="Tirages"):
     async def dice_all_cmd(self, ctx, *teams):
         """(dev) Lance un dé pour chaque equipe en entrée."""
         channel = ctx.channel.id
-        if channel in self.tirages:
+        tirage = self.scheduler.get(channel)
+        if tirage is not None:
             for t in teams:
                 d = random.randint(1, 100)
-                await self.tirages[channel].event(Event(t, d))
+                await tirage.event(Event(t, d, ctx))
 
     @commands.command(
         name="random-problem",
@@ -529,8 +730,9 @@ class TirageCog(Cog, name="Tirages"):
         """Choisit un problème parmi ceux de cette année."""
 
         channel = ctx.channel.id
-        if channel in self.tirages:
-            await self.tirages[channel].rproblem(ctx)
+        tirage = self.scheduler.get(channel)
+        if tirage is not None:
+            await tirage.rproblem(ctx)
         else:
             problem = random.choice(PROBLEMS)
             await ctx.send(f"Le problème tiré est... **{problem}**")
@@ -547,8 +749,9 @@ class TirageCog(Cog, name="Tirages"):
         """
 
         channel = ctx.channel.id
-        if channel in self.tirages:
-            await self.tirages[channel].accept(ctx, True)
+        tirage = self.scheduler.get(channel)
+        if tirage is not None:
+            await tirage.accept(ctx, True)
         else:
             await ctx.send(f"{ctx.author.mention} approuve avec vigeur !")
 
@@ -563,8 +766,9 @@ class TirageCog(Cog, name="Tirages"):
         """
 
         channel = ctx.channel.id
-        if channel in self.tirages:
-            await self.tirages[channel].accept(ctx, False)
+        tirage = self.scheduler.get(channel)
+        if tirage is not None:
+            await tirage.accept(ctx, False)
         else:
             await ctx.send(f"{ctx.author.mention} nie tout en bloc !")
 
@@ -583,12 +787,13 @@ class TirageCog(Cog, name="Tirages"):
         await ctx.invoke(self.bot.get_command("help"), "draw")
 
     @draw_group.command(
-        name="start", usage="FMT TRI1 TRI2... [--finale] [--continue=ID]",
+        name="start",
+        usage="FMT TRI1 TRI2... [--optimize] [--finale] [--continue=ID]",
     )
     @commands.has_any_role(*Role.ORGAS)
     async def start(self, ctx: Context, *args):
         """
-        (orga) Commence un tirage avec 3 ou 4 équipes.
+        (orga) Commence un tirage avec des poules de 3 équipes ou plus.
 
         Cette commande attend des trigrames d'équipes.
 
@@ -597,29 +802,35 @@ class TirageCog(Cog, name="Tirages"):
             `!draw start 3+3 AAA BBB CCC DDD EEE FFF` - Deux poules de 3 équipes
             `!draw start 3 AAA BBB CCC --finale` - Tirage seulement du premier tour
             `!draw start AAA BBB CCC --continue=7` - Continue un tirage commencé avec `--finale`
+            `!draw start AAA BBB ... ZZZ --optimize` - Choisit le format et sépare dans les
+                poules les équipes d'un même tournoi et celles qui se sont déjà rencontrées
         """
 
         channel: discord.TextChannel = ctx.channel
         channel_id = channel.id
-        if channel_id in self.tirages:
+        if channel_id in self.scheduler:
             raise TfjmError(
                 "Il y a déjà un tirage en cours sur cette channel, "
                 "il est possible d'en commencer un autre sur une autre channel."
             )
 
-        query = " ".join(args)
-        match = re.match(RE_DRAW_START, query)
-
-        if match is None:
+        parsed = parse_start(args)
+        if parsed is None:
             await ctx.send("La commande est mal formée.")
             return await ctx.invoke(self.bot.get_command("help"), "draw start")
 
+        match, flags, continue_id = parsed
         teams = match["teams"].split()
-        finale = bool(match["finale"])
-        continue_id = int(match["continue"]) if match["continue"] else None
+        finale = "finale" in flags
+        optimize = "optimize" in flags
 
         if match["fmt"]:
-            fmt = list(map(int, match["fmt"].split()))
+            fmt = list(map(int, match["fmt"].split("+")))
+        elif optimize:
+            try:
+                fmt = pool_sizes(len(teams))
+            except ValueError:
+                raise TfjmError("Il n'y a pas assez d'équipes pour faire des poules.")
         else:
             l = len(teams)
             if l <= 5:
@@ -638,8 +849,14 @@ class TirageCog(Cog, name="Tirages"):
                     "Le tirage est annulé, vous pouvez le recommencer en précisant le format."
                 )
 
-        if not set(fmt).issubset({3, 4, 5}):
-            raise TfjmError("Seuls les poules à 3, 4 ou 5 équipes sont suportées.")
+        if not all(MIN_POULE_SIZE <= n <= MAX_POULE_SIZE for n in fmt):
+            raise TfjmError(
+                f"Les poules doivent avoir entre {MIN_POULE_SIZE} et {MAX_POULE_SIZE} équipes."
+            )
+        if sum(fmt) != len(teams):
+            raise TfjmError(
+                f"Le format {'+'.join(map(str, fmt))} n'a pas {len(teams)} équipes."
+            )
 
         teams_roles = [get(ctx.guild.roles, name=tri) for tri in teams]
         if not all(teams_roles):
@@ -655,26 +872,138 @@ class TirageCog(Cog, name="Tirages"):
             else:
                 rounds = 0, 1
         else:
-            try:
-                tirage = self.get_tirages()[continue_id]
-            except KeyError:
+            tirage = DiscordTirage.load(continue_id)
+            if tirage is None:
                 raise TfjmError(
-                    f"Il n'y pas de tirage {continue_id}. ID possibles {french_join(self.get_tirages())}"
+                    f"Il n'y pas de tirage {continue_id}. ID possibles {french_join(map(str, get_store().ids()))}"
                 )
 
             rounds = (1,)
+            tirage.attach(ctx)
+
+        # The channels of a tournament are in a category with its name
+        if channel.category is not None and channel.category.name in TOURNOIS:
+            get_store().set_tournoi(tirage.id, channel.category.name)
+
+        if optimize:
+            tirage.groups = self.tournois_of(teams)
 
-            tirage.ctx = ctx
-            tirage.queue = asyncio.Queue()
+        tirage.journal = Journal.create(
+            tirage.id, channel=channel_id, rounds=rounds, groups=tirage.groups
+        )
+        if continue_id is not None:
             for i, t in enumerate(teams_roles):
                 await tirage.event(Event(t.name, i + 1))
 
-        self.tirages[channel_id] = tirage
-        await self.tirages[channel_id].run(rounds)
+        self.scheduler.start(channel_id, tirage, rounds)
+
+    def tournois_of(self, trigrams) -> Dict[str, str]:
+        """The tournament of each team, to separate them in the poules."""
+
+        teams_cog = self.bot.get_cog("Teams")
+        if teams_cog is None:
+            return {}
+        teams = (teams_cog.teams.get(t) for t in trigrams)
+        return {team.trigram: team.tournoi for team in teams if team is not None}
+
+    @Cog.listener()
+    async def on_ready(self):
+        # Poules that could not be sent before the restart
+        get_pusher().start()
+
+        for path in Journal.pending():
+            await self.resume_tirage(path)
+
+    async def resume_tirage(self, path):
+        """Replay the journal of a tirage that was interrupted by a restart."""
+
+        header, events = Journal.read(path)
+        channel = self.bot.get_channel(header["channel"])
+        if channel is None or channel.id in self.scheduler:
+            return
+
+        tirage = DiscordTirage.load(header["tirage"])
+        if tirage is None:
+            path.unlink()
+            return
+
+        rounds = tuple(header["rounds"])
+        tirage.attach(channel)
+        tirage.groups = header.get("groups")
+        tirage.deadline = header.get("deadline")
+        tirage.autoplay = header.get("autoplay", False)
+        tirage.reset_rounds(rounds)
+        tirage.journal = Journal(path)
+        tirage.resume(events)
+
+        await channel.send(
+            f"J'ai redémarré pendant le tirage {tirage.id}, il reprend là où il s'était arrêté."
+        )
+        self.scheduler.start(channel.id, tirage, rounds)
+
+    @draw_group.command(name="status", aliases=["état"])
+    @commands.has_any_role(*Role.ORGAS)
+    async def status_cmd(self, ctx: Context):
+        """(orga) Affiche tous les tirages en cours."""
+
+        sessions = list(self.scheduler)
+        if not sessions:
+            return await ctx.send("Il n'y a pas de tirage en cours.")
+
+        embed = discord.Embed(title="Tirages en cours", color=EMBED_COLOR)
+        for session in sessions:
+            tirage = session.tirage
+            duration = timedelta(seconds=round(time() - session.started))
+            embed.add_field(
+                name=f"Tirage {tirage.id}",
+                value=f"Salon: <#{session.channel_id}>\n"
+                f"Étape: {describe_phase(tirage.phase)}\n"
+                f"Événements en attente: {session.queue_depth}\n"
+                f"Messages en attente: {len(tirage.outbox.pending)}\n"
+                f"Délai: {describe_deadline(tirage)}\n"
+                f"Coups joués automatiquement: {tirage.autoplayed}\n"
+                f"Depuis: {duration}",
+            )
+        await ctx.send(embed=embed)
+
+    @draw_group.command(
+        name="timeout", aliases=["délai", "delai"], usage="SECONDES|off [--auto]"
+    )
+    @commands.has_any_role(*Role.ORGAS)
+    async def timeout_cmd(self, ctx: Context, seconds: str, auto: str = ""):
+        """
+        (orga) Donne un délai aux capitaines pour jouer.
+
+        À la moitié du délai, les capitaines qui doivent jouer sont
+        notifiés. Avec `--auto`, à la fin du délai les dés et les
+        problèmes sont tirés à leur place, et le problème tiré est
+        accepté, ce qui ne coûte jamais de pénalité. Le délai est
+        gardé si le bot redémarre pendant le tirage.
+
+        Exemples:
+            `!draw timeout 120` - Rappel aux capitaines au bout d'une minute
+            `!draw timeout 60 --auto` - Joue pour eux au bout d'une minute
+            `!draw timeout off` - Pas de délai
+        """
+
+        tirage = self.scheduler.get(ctx.channel.id)
+        if tirage is None:
+            raise TfjmError("Il n'y a pas de tirage en cours sur ce salon.")
+
+        if seconds.lower() == "off":
+            tirage.set_deadline(None)
+        else:
+            try:
+                deadline = float(seconds)
+            except ValueError:
+                raise TfjmError(f"`{seconds}` n'est pas un nombre de secondes.")
+            if deadline < MIN_DEADLINE:
+                raise TfjmError(
+                    f"Le délai doit être d'au moins {MIN_DEADLINE} secondes."
+                )
+            tirage.set_deadline(deadline, auto == "--auto")
 
-        if self.tirages[channel_id]:
-            # Check if aborted in an other way
-            del self.tirages[channel_id]
+        await ctx.send(f"Délai du tirage {tirage.id}: {describe_deadline(tirage)}.")
 
     @draw_group.command(name="abort")
     @commands.has_any_role(*Role.ORGAS)
@@ -690,25 +1019,17 @@ class TirageCog(Cog, name="Tirages"):
         """
         channel_id = ctx.channel.id
 
-        if channel_id in self.tirages:
-            id = self.tirages[channel_id].id
+        session = self.scheduler.abort(channel_id)
+        if session is not None:
+            id = session.tirage.id
             await ctx.send(f"Le tirage {id} est annulé.")
-            self.tirages[channel_id].save()
-            del self.tirages[channel_id]
+            session.tirage.save()
 
             if force:
-                tirages = self.get_tirages()
-                del tirages[id]
-
-                File.TIRAGES.touch()
-                with open(File.TIRAGES, "w") as f:
-                    yaml.dump(tirages, f)
+                get_store().delete(id)
         else:
             await ctx.send("Il n'y a pas de tirage en cours.")
 
-    def get_tirages(self) -> Dict[int, BaseTirage]:
-        return DiscordTirage.load_all()
-
     @draw_group.command(name="show")
     async def show_cmd(self, ctx: Context, tirage_id: str = "all"):
         """
@@ -720,9 +1041,7 @@ class TirageCog(Cog, name="Tirages"):
             `!draw show 42` - Affiche le tirage n°42
         """
 
-        tirages = self.get_tirages()
-
-        if not tirages:
+        if len(get_store()) == 0:
             return await ctx.send("Il n'y a pas encore eu de tirages.")
 
         if tirage_id.lower() == "all":
@@ -731,22 +1050,28 @@ class TirageCog(Cog, name="Tirages"):
                 "quelles équipes y on participé."
                 "Vous pouvez en consulter un en particulier avec `!draw show ID`."
             )
-            msg = "\n".join(
-                f"`{key}`: {', '.join(tirage.teams)}" for key, tirage in tirages.items()
-            )
-            await ctx.send(msg)
+            await paginate(ctx, self.bot, self.render_tirages_page)
         elif len(tirage_id) == 3 and tirage_id.isupper():
-            for t in tirages.values():
-                for p, teams in t.poules.items():
-                    if tirage_id in teams:
-                        t.ctx = ctx
-                        await t.annonce_poule(p)
+            found = get_store().poules_of(tirage_id)
+            if not found:
+                return await ctx.send(
+                    f"L'équipe {tirage_id} n'a participé à aucun tirage."
+                )
+
+            for id, poules in groupby(found, key=itemgetter(0)):
+                tirage = DiscordTirage.load(id)
+                wanted = {(poule, rnd) for _, poule, rnd in poules}
+                await tirage.show(
+                    ctx, *(p for p in tirage.poules if (p.poule, p.rnd) in wanted)
+                )
         else:
             try:
                 n = int(tirage_id)
                 if n < 0:
                     raise ValueError
-                tirage = tirages[n]
+                tirage = DiscordTirage.load(n)
+                if tirage is None:
+                    raise KeyError
             except (ValueError, KeyError):
                 await ctx.send(
                     f"`{tirage_id}` n'est pas un identifiant valide. "
@@ -755,56 +1080,270 @@ class TirageCog(Cog, name="Tirages"):
             else:
                 await tirage.show(ctx)
 
-    @draw_group.command(name="send")
+    @staticmethod
+    def render_tirages_page(before):
+        """
+        One page of `!draw show all`, with the tirages older than `before`.
+
+        The page stops before the tirage that would make it longer than
+        a message, and the next page starts at this tirage.
+        """
+
+        tirages = get_store().page(before, TIRAGES_PER_PAGE + 1)
+        lines = []
+        length = 0
+        for key, teams in tirages:
+            line = f"`{key}`: {', '.join(teams)}"[:MAX_MESSAGE_LENGTH]
+            if (
+                len(lines) == TIRAGES_PER_PAGE
+                or length + len(line) > MAX_MESSAGE_LENGTH
+            ):
+                break
+            lines.append(line)
+            length += len(line) + 1
+            next_cursor = key
+        else:
+            # Every tirage fits, there is no next page
+            next_cursor = None
+
+        return "\n".join(lines), next_cursor
+
+    @draw_group.command(name="history", aliases=["historique", "h"])
+    async def history_cmd(self, ctx: Context, trigram: str):
+        """
+        Affiche les problèmes d'une équipe dans tous ses tirages.
+
+        Exemple:
+            `!draw history ABC` - Les problèmes de l'équipe ABC
+        """
+
+        trigram = trigram.upper()
+        history = get_store().history(trigram)
+        if not history:
+            return await ctx.send(f"L'équipe {trigram} n'a participé à aucun tirage.")
+
+        embed = discord.Embed(
+            title=f"Historique des tirages de {trigram}", color=EMBED_COLOR
+        )
+        # Only the most recent poules, with one field for the others
+        hidden = max(0, len(history) - MAX_FIELDS + 1)
+        if hidden:
+            embed.add_field(
+                name="…",
+                value=f"et {hidden} poules plus anciennes, "
+                f"du tirage {history[0][0]} au tirage {history[hidden - 1][0]}",
+                inline=False,
+            )
+        for id, poule, team in history[hidden:]:
+            embed.add_field(
+                name=f"Tirage {id} - {ROUND_NAMES[poule.rnd]}, poule {poule}",
+                value=f"**{team.accepted_problems[poule.rnd] or 'Pas encore tiré'}**\n"
+                + team.details(poule.rnd),
+                inline=False,
+            )
+        embed.set_footer(text="Un tirage peut être affiché avec `!draw show ID`")
+        await ctx.send(embed=embed)
+
+    @draw_group.command(name="stats", aliases=["temps"])
+    @commands.has_any_role(*Role.ORGAS)
+    async def stats_cmd(self, ctx: Context, tirage_id: int):
+        """
+        (orga) Affiche le temps passé dans chaque étape d'un tirage.
+
+        Pour chaque étape et chaque équipe, on donne la médiane,
+        les 90e et 99e centiles et le maximum, en secondes.
+
+        Exemple:
+            `!draw stats 42` - Les temps du tirage n°42
+        """
+
+        if tirage_id not in get_store():
+            raise TfjmError(
+                f"`{tirage_id}` n'est pas un identifiant valide. "
+                f"Les identifiants valides sont visibles avec `!draw show all`"
+            )
+
+        marks = get_store().marks(tirage_id)
+        for session in self.scheduler:
+            if session.tirage.id == tirage_id:
+                # Not saved yet
+                marks += session.tirage.marks
+        stats = summary(marks)
+        if not stats["phases"]:
+            return await ctx.send(
+                f"Aucun temps n'a été mesuré pour le tirage {tirage_id}."
+            )
+
+        def line(name, s):
+            p50, p90, p99 = s["percentiles"]
+            return (
+                f"`{name:<8}` {p50:6.1f} {p90:6.1f} {p99:6.1f} {s['max']:6.1f}"
+                f" ({s['count']})"
+            )
+
+        embed = discord.Embed(
+            title=f"Temps du tirage {tirage_id}",
+            description="Médiane, 90e et 99e centiles, maximum en secondes "
+            "(nombre de mesures)",
+            color=EMBED_COLOR,
+        )
+        embed.add_field(
+            name="Étapes",
+            value="\n".join(line(name, s) for name, s in stats["phases"].items()),
+            inline=False,
+        )
+        teams = [line(team, s) for team, s in stats["teams"].items()]
+        if teams:
+            embed.add_field(
+                name="Temps de réponse des équipes",
+                value="\n".join(teams)[:MAX_FIELD_LENGTH],
+                inline=False,
+            )
+        embed.set_footer(text=f"Collisions aux dés: {stats['collisions']}")
+        await ctx.send(embed=embed)
+
+    @draw_group.command(name="export", usage="[--force]")
+    @commands.has_any_role(*Role.ORGAS)
+    async def export_cmd(self, ctx: Context, force: str = ""):
+        """
+        (orga) Exporte tous les tirages en HTML, JSON et CSV.
+
+        Le fichier CSV, une ligne par équipe dans chaque poule, est envoyé
+        ici pour être ouvert dans un tableur. Seuls les tirages qui ont
+        changé depuis le dernier export sont réécrits, sauf avec `--force`.
+
+        Exemple:
+            `!draw export` - Exporte les tirages
+        """
+
+        def run():
+            # The connection of the store can only be used in its own thread
+            store = TirageStore(get_store().path)
+            try:
+                return export(store, File.EXPORT, force=force == "--force")
+            finally:
+                store.db.close()
+
+        report = await asyncio.get_event_loop().run_in_executor(None, run)
+        await ctx.send(
+            f"{report.tirages} tirages exportés en {report.seconds:.2f}s "
+            f"({report.written} mis à jour, {report.skipped} inchangés).",
+            file=discord.File(File.EXPORT / "poules.csv"),
+        )
+
+    @draw_group.command(name="send", usage="ID [POULE ROUND | --all]")
     @commands.has_role(Role.DEV)
     async def send_cmd(self, ctx, tirage_id: int, poule="A", round: int = 1):
         """
         (dev) Envoie les poules sur tfjm.org
 
-        Exemple:
+        Les poules sont envoyées automatiquement à la fin de leur tirage,
+        cette commande sert à les renvoyer. Celles qui échouent sont
+        réessayées automatiquement.
+
+        Exemples:
             `!draw send 42 B 1` - Envoie la poule B1 du tirage n°42.
+            `!draw send 42 --all` - Envoie toutes les poules du tirage n°42.
         """
 
-        tirages = self.get_tirages()
-
-        try:
-            n = int(tirage_id)
-            if n < 0:
-                raise ValueError
-            tirage = tirages[n]
-        except (ValueError, KeyError):
-            await ctx.send(
+        tirage = DiscordTirage.load(tirage_id)
+        if tirage is None:
+            raise TfjmError(
                 f"`{tirage_id}` n'est pas un identifiant valide. "
                 f"Les identifiants valides sont visibles avec `!draw show all`"
             )
+
+        pusher = get_pusher()
+        if not pusher.enabled:
+            raise TfjmError("Il n'y a pas de token pour l'api de tfjm.org.")
+
+        if poule == "--all":
+            results = await pusher.push_all(tirage)
+            if not results:
+                raise TfjmError("Aucune poule de ce tirage n'est entièrement tirée.")
         else:
             poule = get(tirage.poules, poule=poule, rnd=round - 1)
             if poule is None:
                 raise TfjmError("Il n'y a pas de telle poule dans ce tirage")
+            results = [await pusher.push(tirage, poule)]
 
-            data = f"{round};" + ";".join(
-                x
-                for t in tirage.poules[poule]
-                for x in (
-                    tirage.teams[t].name,
-                    tirage.teams[t].accepted_problems[round - 1][0],
-                )
+        await ctx.send(
+            "\n".join(
+                f"`{r.poule}`: "
+                + ("envoyée" if r.ok else f"échec ({r.status}), elle sera renvoyée")
+                for r in results
             )
-            data = f'"{data}"'
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    "https://inscription.tfjm.org/api/pool/",
-                    headers={
-                        "Authorization": f"Token {TFJM_TOKEN}",
-                        "Content-type": "application/json",
-                    },
-                    data=data,
-                ) as resp:
-                    await ctx.send(str(resp))
-                    await ctx.send(str(resp.status))
-                    await ctx.send(str(resp.reason))
-                    await ctx.send(await resp.content.read())
+        )
+
+    @draw_group.command(
+        name="simulate",
+        aliases=["simule"],
+        usage="TAILLE [N] [REFUS] [--penalites] [--sans-doubles]",
+    )
+    @commands.has_role(Role.CNO)
+    async def simulate_cmd(self, ctx, *args):
+        """
+        (cno) Simule un grand nombre de tirages de problèmes.
+
+        Les capitaines refusent chaque problème avec une probabilité `REFUS`,
+        sauf si cela leur coûte une pénalité. Avec `--penalites`, ils refusent
+        même s'il y a une pénalité. Avec `--sans-doubles`, deux équipes d'une
+        poule de 5 ne peuvent pas accepter le même problème.
+
+        Exemple:
+            `!draw simulate 5 1000000 0.4` - Un million de poules de 5 équipes
+            `!draw simulate 5 --penalites` - Cent mille poules, refus même avec pénalité
+        """
+
+        flags = {a for a in args if a.startswith("--")}
+        unknown = flags - {"--penalites", "--sans-doubles"}
+        if unknown:
+            raise TfjmError(f"Option inconnue: {french_join(sorted(unknown))}")
+
+        values = [a for a in args if not a.startswith("--")]
+        if len(values) > 3:
+            raise TfjmError("Il y a trop d'arguments, voir `!help draw simulate`.")
+        try:
+            size = int(values[0]) if len(values) > 0 else 3
+            runs = int(values[1]) if len(values) > 1 else 100_000
+            reject = float(values[2]) if len(values) > 2 else 0.3
+        except ValueError:
+            raise TfjmError(
+                "La taille et le nombre de simulations sont des entiers "
+                "et la probabilité de refus un nombre, comme `0.3`."
+            )
+
+        if not 3 <= size <= len(PROBLEMS):
+            raise TfjmError(
+                f"Les poules doivent avoir entre 3 et {len(PROBLEMS)} équipes."
+            )
+        if not 0 < runs <= 10_000_000:
+            raise TfjmError(
+                "Le nombre de simulations doit être entre 1 et 10 millions."
+            )
+        if not 0 <= reject < 1:
+            raise TfjmError("La probabilité de refus doit être entre 0 et 1.")
+
+        strategy = Strategy(reject, avoid_penalty="--penalites" not in flags)
+        rules = Rules(doubles="--sans-doubles" not in flags)
+
+        async with ctx.typing():
+            report = await simulate_async(size, runs, strategy, rules)
+
+        embed = discord.Embed(
+            title=f"{runs} poules de {size} équipes simulées",
+            description=f"Refus avec probabilité {reject}, "
+            + (
+                "pénalités acceptées"
+                if not strategy.avoid_penalty
+                else "sans pénalités"
+            )
+            + ("" if rules.doubles else ", sans problèmes doublés"),
+            color=EMBED_COLOR,
+        )
+        for name, value in report.summary().items():
+            embed.add_field(name=name, value=value)
+        await ctx.send(embed=embed)
 
     @draw_group.command(name="order")
     @commands.has_role(Role.DEV)
@@ -812,9 +1351,10 @@ class TirageCog(Cog, name="Tirages"):
         """(dev) L'ordre des équipes sera celui du message."""
 
         channel = ctx.channel.id
-        if channel in self.tirages:
+        tirage = self.scheduler.get(channel)
+        if tirage is not None:
             for i, t in enumerate(teams):
-                await self.tirages[channel].event(Event(t.name, i + 1))
+                await tirage.event(Event(t.name, i + 1, ctx))
 
 
 def setup(bot):
@@ -5,6 +5,7 @@ from time import time
 __all__ = [
     "DISCORD_TOKEN",
     "TFJM_TOKEN",
+    "TFJM_API_URL",
     "Role",
     "PROBLEMS",
     "MAX_REFUSE",
@@ -26,17 +27,9 @@ __all__ = [
 
 DISCORD_TOKEN = os.environ.get("TFJM_DISCORD_TOKEN")
 TFJM_TOKEN = os.environ.get("TFJM_ORG_TOKEN")
+TFJM_API_URL = os.environ.get("TFJM_API_URL", "https://inscription.tfjm.org/api/")
 
 
-if DISCORD_TOKEN is None:
-    print("No token for the bot were found.")
-    print("You need to set the TFJM_DISCORD_TOKEN variable in your environement")
-    print("Or just run:")
-    print()
-    print(f'    TFJM_DISCORD_TOKEN="your token here" python tfjm-discord-bot.py')
-    print()
-    quit(1)
-
 GUILD = "690934836696973404"
 DIEGO = 430566197868625920  # Mon id
 ANANAS = 619132180408303616
@@ -91,12 +84,18 @@ class Emoji:
     CROSS = "❌"
     PLUS_1 = "👍"
     MINUS_1 = "👎"
+    PREVIOUS = "◀️"
+    NEXT = "▶️"
     RAINBOW_HEART = "<:rainbow_heart:714172834632564818>"
 
 
 class File:
     TOP_LEVEL = Path(__file__).parent.parent
     TIRAGES = TOP_LEVEL / "data" / "tirages.yaml"
+    TIRAGES_DB = TOP_LEVEL / "data" / "tirages.db"
+    JOURNALS = TOP_LEVEL / "data" / "journals"
+    EXPORT = TOP_LEVEL / "data" / "export"
+    LAYOUT = TOP_LEVEL / "data" / "layout.yaml"
     TEAMS = TOP_LEVEL / "data" / "teams"
     JOKES = TOP_LEVEL / "data" / "jokes"
     JOKES_V2 = TOP_LEVEL / "data" / "jokesv2"
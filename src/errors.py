@@ -2,7 +2,7 @@
 This module defines all the custom Exceptions used in this project.
 """
 
-__all__ = ["TfjmError", "UnwantedCommand"]
+__all__ = ["TfjmError", "UnwantedCommand", "InvalidTirage"]
 
 
 class TfjmError(Exception):
@@ -26,3 +26,10 @@ class UnwantedCommand(TfjmError):
         if reason is None:
             reason = "Cette commande n'était pas attendu à ce moment."
         super(UnwantedCommand, self).__init__(reason)
+
+
+class InvalidTirage(TfjmError):
+    """Raised when stored data does not describe a valid tirage."""
+
+    def __init__(self, reason):
+        super(InvalidTirage, self).__init__(f"Tirage invalide: {reason}")
@@ -0,0 +1,253 @@
+"""
+Export of all the tirages as a static website and spreadsheets.
+
+The tirages are written to:
+
+    index.html           links to every tirage
+    tirages/<id>.html    the poules of the tirage, with the passage order
+    tirages/<id>.json    the codec document of the tirage
+    tirages/<id>.csv     its lines of poules.csv
+    tirages.json         all the codec documents
+    poules.csv           one line per team in a poule, for spreadsheets
+    manifest.json        version and hash of each exported tirage
+
+Only the tirages saved since the last export are read from the
+database, the others are known by their version. The files of all the
+tirages are built from the files of each one, and are not written at
+all when nothing changed. Run it with
+
+    python -m src.export --output data/export
+"""
+
+import argparse
+import csv
+import hashlib
+import html
+import json
+from collections import namedtuple
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List
+
+from src import codec
+from src.base_tirage import BaseTirage, Poule
+from src.constants import *
+from src.passage import ROLES, layout
+from src.tirage_store import TirageStore
+
+__all__ = ["FIELDS", "ExportReport", "poule_rows", "export"]
+
+FIELDS = [
+    "tirage",
+    "round",
+    "poule",
+    "position",
+    "team",
+    "problem",
+    "rejected",
+    "coefficient",
+]
+"""Columns of poules.csv."""
+
+ExportReport = namedtuple("ExportReport", ["tirages", "written", "skipped", "seconds"])
+
+PAGE = """<!DOCTYPE html>
+<html lang="fr">
+<head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin-bottom: 2em; }}
+td, th {{ border: 1px solid #999; padding: 0.3em 0.8em; text-align: center; }}
+</style></head>
+<body>
+<h1>{title}</h1>
+{body}
+</body>
+</html>
+"""
+
+
+def poule_rows(tirage: BaseTirage, poule: Poule) -> List[Dict]:
+    """The teams of the poule in passage order, as shown in its summary."""
+
+    return [
+        {
+            "tirage": tirage.id,
+            "round": poule.rnd + 1,
+            "poule": poule.poule,
+            "position": position + 1,
+            "team": trigram,
+            "problem": tirage.teams[trigram].accepted(poule.rnd),
+            "rejected": list(tirage.teams[trigram].rejected[poule.rnd]),
+            "coefficient": tirage.teams[trigram].coeff(poule.rnd),
+        }
+        for position, trigram in enumerate(tirage.poules[poule])
+    ]
+
+
+def render_poule(tirage: BaseTirage, poule: Poule) -> str:
+    rows = poule_rows(tirage, poule)
+    matches = layout(len(rows))
+    roles = [[""] * len(matches) for _ in rows]
+    for col, m in enumerate(matches):
+        for team, role in zip((m.defender, m.opponent, m.reporter), ROLES):
+            roles[team][col] = role
+
+    several_rooms = any(m.room for m in matches)
+    head = ["Équipe", "Problème", "Refusés", "Coefficient"] + [
+        f"Phase {m.phase + 1}" + (f", salle {m.room + 1}" if several_rooms else "")
+        for m in matches
+    ]
+
+    lines = [
+        f"<h2>Poule {html.escape(str(poule))} ({ROUND_NAMES[poule.rnd]})</h2>",
+        "<table>",
+        "<tr>" + "".join(f"<th>{html.escape(h)}</th>" for h in head) + "</tr>",
+    ]
+    for row, team_roles in zip(rows, roles):
+        cells = [
+            row["team"],
+            row["problem"] or "-",
+            ", ".join(row["rejected"]) or "aucun",
+            str(row["coefficient"]),
+        ] + team_roles
+        lines.append(
+            "<tr>" + "".join(f"<td>{html.escape(c)}</td>" for c in cells) + "</tr>"
+        )
+    lines.append("</table>")
+    return "\n".join(lines)
+
+
+def render_tirage(tirage: BaseTirage) -> str:
+    poules = sorted(tirage.poules, key=lambda p: (p.rnd, p.poule))
+    body = "\n".join(render_poule(tirage, p) for p in poules)
+    return PAGE.format(title=f"Tirage {tirage.id}", body=body)
+
+
+def render_index(teams: Dict[int, List[str]]) -> str:
+    items = "\n".join(
+        f'<li><a href="tirages/{i}.html">Tirage {i}</a>: '
+        f"{html.escape(', '.join(names))}</li>"
+        for i, names in teams.items()
+    )
+    return PAGE.format(title="Tirages", body=f"<ul>\n{items}\n</ul>")
+
+
+def tirage_files(pages: Path, tirage_id) -> List[Path]:
+    return [pages / f"{tirage_id}.{ext}" for ext in ("html", "json", "csv")]
+
+
+def write_tirage(tirage: BaseTirage, pages: Path) -> str:
+    """Write the files of one tirage and return the hash of its codec document."""
+
+    raw = codec.dumps(tirage)
+    html_path, json_path, csv_path = tirage_files(pages, tirage.id)
+
+    html_path.write_text(render_tirage(tirage), encoding="utf-8")
+    json_path.write_bytes(raw)
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, FIELDS)
+        for poule in sorted(tirage.poules, key=lambda p: (p.rnd, p.poule)):
+            for row in poule_rows(tirage, poule):
+                row["rejected"] = "; ".join(row["rejected"])
+                writer.writerow(row)
+
+    return hashlib.sha256(raw).hexdigest()
+
+
+def write_aggregates(output: Path, pages: Path, manifest: Dict[str, Dict]):
+    """Write the files of all the tirages, by joining the files of each."""
+
+    ids = sorted(manifest, key=int)
+    with open(output / "tirages.json", "wb") as f:
+        f.write(b"[")
+        for n, tirage_id in enumerate(ids):
+            raw = (pages / f"{tirage_id}.json").read_bytes()
+            f.write(b"," + raw if n else raw)
+        f.write(b"]")
+
+    with open(output / "poules.csv", "w", newline="", encoding="utf-8") as f:
+        csv.DictWriter(f, FIELDS).writeheader()
+        for tirage_id in ids:
+            f.write((pages / f"{tirage_id}.csv").read_text(encoding="utf-8"))
+
+    teams = {int(i): manifest[i]["teams"] for i in ids}
+    (output / "index.html").write_text(render_index(teams), encoding="utf-8")
+
+
+def export(store: TirageStore, output: Path = File.EXPORT, force=False) -> ExportReport:
+    """
+    Write the tirages of the store in `output`.
+
+    A tirage is only read and written when its version differs from
+    the manifest of the previous export, unless `force`.
+    """
+
+    start = perf_counter()
+    pages = output / "tirages"
+    pages.mkdir(parents=True, exist_ok=True)
+
+    manifest_path = output / "manifest.json"
+    try:
+        previous = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        previous = {}
+
+    manifest = {}
+    written = skipped = 0
+    for tirage_id, version in store.versions().items():
+        key = str(tirage_id)
+        old = previous.get(key)
+        if (
+            not force
+            and isinstance(old, dict)
+            and old.get("version") == version
+            and all(f.exists() for f in tirage_files(pages, tirage_id))
+        ):
+            manifest[key] = old
+            skipped += 1
+            continue
+
+        tirage = store.load(tirage_id)
+        manifest[key] = {
+            "version": version,
+            "sha256": write_tirage(tirage, pages),
+            "teams": list(tirage.teams),
+        }
+        written += 1
+
+    # Files of deleted tirages
+    removed = previous.keys() - manifest.keys()
+    for tirage_id in removed:
+        for path in tirage_files(pages, tirage_id):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    aggregates = ["tirages.json", "poules.csv", "index.html", "manifest.json"]
+    if written or removed or not all((output / f).exists() for f in aggregates):
+        write_aggregates(output, pages, manifest)
+        manifest_path.write_text(json.dumps(manifest, indent=1))
+
+    return ExportReport(len(manifest), written, skipped, perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-o", "--output", type=Path, default=File.EXPORT)
+    parser.add_argument("--db", type=Path, default=File.TIRAGES_DB)
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="Write all the pages again"
+    )
+    args = parser.parse_args()
+
+    report = export(TirageStore(args.db), args.output, args.force)
+    print(
+        f"{report.tirages} tirages exported to {args.output} in {report.seconds:.3f}s "
+        f"({report.written} written, {report.skipped} unchanged)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Append-only journal of the events of running tirages.
+
+Every event accepted by a tirage is written to the journal of the tirage,
+so that a tirage interrupted by a crash of the bot can be replayed up
+to the exact step it was at.
+"""
+
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Iterator, List, Tuple, Union
+
+from src.constants import *
+
+__all__ = ["Journal"]
+
+EventData = Tuple[str, Union[bool, int, str]]
+
+
+class Journal:
+    """
+    Journal of the accepted events of one tirage.
+
+    The first line is a header describing how to resume the tirage,
+    then there is one line per event. Writes are buffered and
+    fsync'ed in batches, at most SYNC_DELAY seconds after an event.
+    """
+
+    SYNC_DELAY = 0.2
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.cut(path)
+        self.file = open(path, "a")
+        self._sync_handle = None
+
+    @classmethod
+    def create(cls, tirage_id, **header):
+        """Start a new journal for the tirage, replacing any previous one."""
+
+        File.JOURNALS.mkdir(parents=True, exist_ok=True)
+        path = cls.path_for(tirage_id)
+        with open(path, "w") as f:
+            f.write(json.dumps({"tirage": tirage_id, **header}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return cls(path)
+
+    @staticmethod
+    def path_for(tirage_id) -> Path:
+        return File.JOURNALS / f"{tirage_id}.jsonl"
+
+    @staticmethod
+    def pending() -> Iterator[Path]:
+        """All the journals of tirages that did not finish."""
+
+        if File.JOURNALS.exists():
+            yield from sorted(File.JOURNALS.glob("*.jsonl"))
+
+    @staticmethod
+    def read(path: Path) -> Tuple[dict, List[EventData]]:
+        """Return the header and the events of a journal."""
+
+        with open(path) as f:
+            header = json.loads(f.readline())
+            events = []
+            for line in f:
+                try:
+                    if not line.endswith("\n"):
+                        raise ValueError
+                    team, value = json.loads(line)
+                except ValueError:
+                    # The last line may be incomplete if we crashed while writing it.
+                    break
+                events.append((team, value))
+        return header, events
+
+    @staticmethod
+    def cut(path: Path):
+        """
+        Remove the incomplete line left by a crash, if any.
+
+        Otherwise the events appended after it would be lost, as `read`
+        stops at the first line it cannot parse.
+        """
+
+        with open(path, "rb+") as f:
+            end = 0
+            for n, line in enumerate(f):
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError
+                    if n:
+                        team, value = json.loads(line)
+                except ValueError:
+                    f.truncate(end)
+                    os.fsync(f.fileno())
+                    break
+                end += len(line)
+
+    def update_header(self, **fields):
+        """
+        Change some fields of the header, keeping the events.
+
+        The journal is rewritten next to the old one then replaces it,
+        so a crash leaves one of the two complete.
+        """
+
+        self.sync()
+        header, _ = self.read(self.path)
+        header.update(fields)
+
+        tmp = self.path.with_suffix(".tmp")
+        with open(self.path) as old, open(tmp, "w") as new:
+            old.readline()
+            new.write(json.dumps(header) + "\n")
+            for line in old:
+                new.write(line)
+            new.flush()
+            os.fsync(new.fileno())
+
+        self.file.close()
+        os.replace(tmp, self.path)
+        self.file = open(self.path, "a")
+
+    def append(self, event):
+        self.file.write(json.dumps([event.team, event.value]) + "\n")
+
+        if self._sync_handle is None:
+            loop = asyncio.get_event_loop()
+            self._sync_handle = loop.call_later(self.SYNC_DELAY, self.sync)
+
+    def sync(self):
+        if self._sync_handle is not None:
+            self._sync_handle.cancel()
+            self._sync_handle = None
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self, delete=False):
+        """Stop journaling. The journal is deleted if the tirage needs no resuming."""
+
+        if self.file.closed:
+            return
+
+        self.sync()
+        self.file.close()
+        if delete:
+            self.path.unlink()
@@ -0,0 +1,217 @@
+"""
+Declarative layout of the server.
+
+The categories, channels and permissions that each tournament needs
+are described in `data/layout.yaml`. `plan` compares this layout with
+the state of the guild and lists the few requests needed to reach it,
+which `apply` then sends concurrently. Nothing is ever deleted.
+"""
+
+import asyncio
+from collections import Counter, namedtuple
+from pathlib import Path
+from typing import List, Optional
+
+import discord
+import yaml
+from discord import PermissionOverwrite
+
+from src.constants import *
+from src.errors import TfjmError
+from src.utils import RateLimiter
+
+__all__ = ["ChannelSpec", "Action", "load_layout", "plan", "apply", "describe"]
+
+ChannelSpec = namedtuple(
+    "ChannelSpec", ["category", "name", "type", "overwrites", "exact"]
+)
+"""A channel wanted in the guild, the overwrites mapping role names to permissions."""
+
+Action = namedtuple("Action", ["kind", "target", "run"])
+"""A request to send. `run()` returns the coroutine that sends it."""
+
+TYPES = {"text": discord.ChannelType.text, "voice": discord.ChannelType.voice}
+EVERYONE = "@everyone"
+REQUESTS = (10, 10)
+"""Requests sent at most by `apply`, as (calls, seconds)."""
+MAX_LINES = 20
+"""Actions and problems listed at most in the dry run."""
+
+ACTION_NAMES = {
+    "create_category": "catégories à créer",
+    "create_channel": "salons à créer",
+    "edit_channel": "salons à modifier",
+}
+
+
+def channel_name(name: str, type) -> str:
+    """The name Discord gives to the channel: text channels are lowercase, without spaces."""
+
+    if type in ("text", discord.ChannelType.text):
+        return name.lower().replace(" ", "-")
+    return name
+
+
+def channel_spec(data: dict, tournoi=None, category=None) -> ChannelSpec:
+    def fill(text: str) -> str:
+        return text.format(tournoi=tournoi) if tournoi is not None else text
+
+    if not isinstance(data, dict) or "name" not in data:
+        raise TfjmError(f"Salon invalide dans le layout: {data}")
+    if data.get("type", "text") not in TYPES:
+        raise TfjmError(f"Type de salon inconnu: {data.get('type')}")
+
+    overwrites = {}
+    for role, perms in (data.get("overwrites") or {}).items():
+        # Shared channels get the overwrite once per tournament
+        for t in TOURNOIS if tournoi is None and "{tournoi}" in role else [tournoi]:
+            name = role.format(tournoi=t) if t is not None else role
+            try:
+                overwrites[name] = PermissionOverwrite(**perms)
+            except (TypeError, ValueError) as e:
+                raise TfjmError(f"Permissions invalides pour {name}: {e}")
+
+    return ChannelSpec(
+        category,
+        channel_name(fill(data["name"]), data.get("type", "text")),
+        data.get("type", "text"),
+        overwrites,
+        bool(data.get("exact", False)),
+    )
+
+
+def load_layout(path: Path = File.LAYOUT) -> List[ChannelSpec]:
+    """All the channels of the layout file, for every tournament."""
+
+    with open(path) as f:
+        try:
+            data = yaml.safe_load(f) or {}
+        except yaml.YAMLError as e:
+            raise TfjmError(f"Le layout n'est pas du YAML valide: {e}")
+
+    specs = []
+    per_tournoi = data.get("tournois") or {}
+    for tournoi in TOURNOIS:
+        category = per_tournoi.get("category", "{tournoi}").format(tournoi=tournoi)
+        for channel in per_tournoi.get("channels", ()):
+            if tournoi not in channel.get("except", ()):
+                specs.append(channel_spec(channel, tournoi, category))
+
+    for channel in data.get("channels", ()):
+        specs.append(channel_spec(channel, category=channel.get("category")))
+    return specs
+
+
+def plan(guild: discord.Guild, specs: List[ChannelSpec]):
+    """
+    The requests needed to make the guild follow the layout, and the problems.
+
+    The actions are in two steps: the categories first, then the
+    channels, which may need the new categories. Inside a step, the
+    actions can be done concurrently. Each action is one request.
+    """
+
+    # The state of the guild, read once
+    roles = {r.name: r for r in guild.roles}
+    roles[EVERYONE] = guild.default_role
+    categories = {c.name: c for c in guild.categories}
+    channels = {}
+    for c in guild.channels:
+        if not isinstance(c, discord.CategoryChannel):
+            name = channel_name(c.name, c.type)
+            channels[c.category.name if c.category else None, name, c.type] = c
+            # Channels without category in the layout can be in any category
+            channels.setdefault((None, name, c.type), c)
+
+    first, then, problems = [], [], []
+    new_categories = set()
+
+    for spec in specs:
+        missing = [name for name in spec.overwrites if name not in roles]
+        if missing:
+            problems.append(f"{spec.name}: rôles introuvables {', '.join(missing)}")
+            continue
+        wanted = {roles[name]: ow for name, ow in spec.overwrites.items()}
+
+        if spec.category is not None and spec.category not in categories:
+            if spec.category not in new_categories:
+                new_categories.add(spec.category)
+                first.append(create_category(guild, spec.category, categories))
+
+        channel = channels.get((spec.category, spec.name, TYPES[spec.type]))
+        if channel is None:
+            then.append(create_channel(guild, spec, wanted, categories))
+            continue
+
+        current = channel.overwrites
+        target = wanted if spec.exact else {**current, **wanted}
+        if target != current:
+            then.append(
+                Action(
+                    "edit_channel",
+                    channel.name,
+                    lambda c=channel, t=target: c.edit(
+                        overwrites=t, reason="Layout of the server"
+                    ),
+                )
+            )
+
+    return [first, then], problems
+
+
+def create_category(guild, name, categories) -> Action:
+    async def run():
+        categories[name] = await guild.create_category(
+            name, reason="Layout of the server"
+        )
+
+    return Action("create_category", name, run)
+
+
+def create_channel(guild, spec: ChannelSpec, overwrites, categories) -> Action:
+    async def run():
+        # Created in the first step if it did not exist
+        category = categories.get(spec.category)
+        create = (
+            guild.create_voice_channel
+            if spec.type == "voice"
+            else guild.create_text_channel
+        )
+        await create(
+            spec.name,
+            overwrites=overwrites,
+            category=category,
+            reason="Layout of the server",
+        )
+
+    return Action("create_channel", f"{spec.category or ''}/{spec.name}", run)
+
+
+def describe(steps: List[List[Action]], problems: List[str]) -> str:
+    """What a plan would do, for the dry run."""
+
+    counts = Counter(action.kind for step in steps for action in step)
+    if not counts and not problems:
+        return "Le serveur est déjà conforme au layout."
+
+    lines = [f"{n} {ACTION_NAMES[kind]}" for kind, n in counts.items()]
+    lines.append(f"**{sum(counts.values())} appels à l'API**")
+    actions = [a for step in steps for a in step]
+    lines.extend(f" - {ACTION_NAMES[a.kind]}: {a.target}" for a in actions[:MAX_LINES])
+    if len(actions) > MAX_LINES:
+        lines.append(f" - et {len(actions) - MAX_LINES} autres")
+    lines.extend(f":warning: {p}" for p in problems[:MAX_LINES])
+    return "\n".join(lines)
+
+
+async def apply(steps: List[List[Action]], limiter: Optional[RateLimiter] = None):
+    """Send the requests of the plan, each step concurrently."""
+
+    limiter = limiter or RateLimiter(*REQUESTS)
+
+    async def run(action: Action):
+        async with limiter:
+            await action.run()
+
+    for step in steps:
+        await asyncio.gather(*map(run, step))
@@ -0,0 +1,235 @@
+"""
+Monte Carlo analysis of the rules of the tirage.
+
+This simulates the drawing of the problems of a poule many times
+at once with numpy, to see how the rules (number of free refusals,
+penalty, doubled problems in poules of 5) change the outcomes
+for different strategies of the captains.
+
+    python -m src.montecarlo --size 5 --runs 1000000
+"""
+
+import argparse
+import asyncio
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import List
+
+import numpy as np
+
+from src.constants import *
+
+__all__ = ["Rules", "Strategy", "Report", "simulate", "simulate_async"]
+
+BATCH_SIZE = 50_000
+
+
+@dataclass(frozen=True)
+class Rules:
+    max_refuse: int = MAX_REFUSE
+    """Number of problems a team can refuse without penalty."""
+    penalty: float = 0.5
+    """Penalty on the coefficient for each extra refusal."""
+    doubles: bool = True
+    """Whether two teams of a poule of 5 can accept the same problem."""
+    problems: int = len(PROBLEMS)
+
+    def capacity(self, size):
+        return 2 if self.doubles and size >= 5 else 1
+
+    def coeff(self, refused):
+        return 2 - self.penalty * np.maximum(0, refused - self.max_refuse)
+
+
+@dataclass(frozen=True)
+class Strategy:
+    reject: float = 0.3
+    """Probability to refuse a problem."""
+    avoid_penalty: bool = True
+    """Whether to always accept when refusing would cost a penalty."""
+
+
+@dataclass
+class Report:
+    size: int
+    runs: int = 0
+    coefficients: Counter = field(default_factory=Counter)
+    """Number of teams with each coefficient."""
+    refused: Counter = field(default_factory=Counter)
+    """Number of teams for each number of problems refused."""
+    doubles: Counter = field(default_factory=Counter)
+    """Number of poules for each number of problems accepted by two teams."""
+    redraws: int = 0
+    """Number of times a team drew a problem it had already refused."""
+    position_coeff: List[float] = None
+    """Sum of the coefficients for each position in the drawing order."""
+
+    def merge(self, other: "Report"):
+        self.runs += other.runs
+        self.coefficients += other.coefficients
+        self.refused += other.refused
+        self.doubles += other.doubles
+        self.redraws += other.redraws
+        if self.position_coeff is None:
+            self.position_coeff = list(other.position_coeff)
+        else:
+            self.position_coeff = [
+                a + b for a, b in zip(self.position_coeff, other.position_coeff)
+            ]
+        return self
+
+    def mean_coeff_by_position(self):
+        return [c / self.runs for c in self.position_coeff]
+
+    def summary(self):
+        teams = self.runs * self.size
+
+        def fmt(counter: Counter, total):
+            return "\n".join(
+                f"`{k:>4}`: {100 * v / total:5.1f}%" for k, v in sorted(counter.items())
+            )
+
+        return {
+            "Coefficients": fmt(self.coefficients, teams),
+            "Problèmes refusés": fmt(self.refused, teams),
+            "Problèmes doublés": fmt(self.doubles, self.runs),
+            "Coefficient moyen par ordre de tirage": "\n".join(
+                f"`{i + 1}`: {c:.3f}"
+                for i, c in enumerate(self.mean_coeff_by_position())
+            ),
+            "Retirages": f"{self.redraws / teams:.2f} par équipe",
+        }
+
+
+def counter(values):
+    return Counter(
+        dict(zip(*(a.tolist() for a in np.unique(values, return_counts=True))))
+    )
+
+
+def simulate(size, runs, strategy=Strategy(), rules=Rules(), seed=None) -> Report:
+    """
+    Simulate the drawing of problems in `runs` poules of `size` teams.
+
+    Team i is the i-th to draw. As in BaseTirage.draw_poule, the teams
+    draw one after the other, skipping the ones that already accepted.
+    """
+
+    rng = np.random.default_rng(seed)
+    n, p = runs, rules.problems
+    capacity = rules.capacity(size)
+    rows = np.arange(n)
+
+    counts = np.zeros((n, p), dtype=np.int8)
+    accepted = np.full((n, size), -1, dtype=np.int16)
+    rejected = np.zeros((n, size, p), dtype=bool)
+    refused = np.zeros((n, size), dtype=np.int16)
+    draws = np.zeros((n, size), dtype=np.int16)
+    current = np.zeros(n, dtype=np.int16)
+    active = rows
+    redraws = 0
+
+    while active.size:
+        team = current[active]
+
+        # Uniform choice among the available problems
+        keys = rng.random((active.size, p))
+        keys[counts[active] >= capacity] = -1
+        pb = keys.argmax(axis=1)
+
+        already = rejected[active, team, pb]
+        penalty = ~already & (refused[active, team] >= rules.max_refuse)
+        accept = rng.random(active.size) >= strategy.reject
+        if strategy.avoid_penalty:
+            accept |= penalty
+        # Nobody draws forever
+        accept |= draws[active, team] >= 4 * p
+        draws[active, team] += 1
+        redraws += int(already.sum())
+
+        acc, rej = active[accept], active[~accept]
+        accepted[acc, team[accept]] = pb[accept]
+        counts[acc, pb[accept]] += 1
+
+        new = ~already[~accept]
+        rejected[rej[new], team[~accept][new], pb[~accept][new]] = True
+        refused[rej[new], team[~accept][new]] += 1
+
+        # Next team that still has to accept a problem
+        nxt = (team + 1) % size
+        for _ in range(size):
+            waiting = accepted[active, nxt] >= 0
+            nxt[waiting] = (nxt[waiting] + 1) % size
+        current[active] = nxt
+
+        active = active[(accepted[active] < 0).any(axis=1)]
+
+    coeff = rules.coeff(refused)
+    return Report(
+        size=size,
+        runs=runs,
+        coefficients=counter(coeff),
+        refused=counter(refused),
+        doubles=counter((counts >= 2).sum(axis=1)),
+        redraws=redraws,
+        position_coeff=coeff.sum(axis=0).tolist(),
+    )
+
+
+_pool = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max(1, (os.cpu_count() or 2) - 1))
+    return _pool
+
+
+async def simulate_async(size, runs, strategy=Strategy(), rules=Rules()) -> Report:
+    """Same as simulate, but in batches in a process pool, so the bot stays responsive."""
+
+    loop = asyncio.get_event_loop()
+    batches = [min(BATCH_SIZE, runs - i) for i in range(0, runs, BATCH_SIZE)]
+    reports = await asyncio.gather(
+        *(
+            loop.run_in_executor(
+                get_pool(), partial(simulate, size, batch, strategy, rules)
+            )
+            for batch in batches
+        )
+    )
+
+    report = Report(size)
+    for r in reports:
+        report.merge(r)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--size", type=int, default=3)
+    parser.add_argument("-r", "--runs", type=int, default=100_000)
+    parser.add_argument("--reject", type=float, default=0.3)
+    parser.add_argument("--take-penalties", action="store_true")
+    parser.add_argument("--max-refuse", type=int, default=MAX_REFUSE)
+    parser.add_argument("--penalty", type=float, default=0.5)
+    parser.add_argument("--no-doubles", action="store_true")
+    args = parser.parse_args()
+
+    strategy = Strategy(args.reject, not args.take_penalties)
+    rules = Rules(args.max_refuse, args.penalty, not args.no_doubles)
+    report = asyncio.run(simulate_async(args.size, args.runs, strategy, rules))
+
+    print(f"{report.runs} poules of {report.size} teams, {strategy}, {rules}")
+    for name, value in report.summary().items():
+        print()
+        print(name)
+        print(value.replace("`", ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Coalescing of the messages sent in a channel.
+
+Discord rate limits the messages per channel, so when a lot of
+short messages are sent at once, it is better to merge them. For the
+same reason, a message that shows a changing state is edited at most
+once per `EDIT_DELAY`, with the latest state.
+"""
+
+import asyncio
+import sys
+import traceback
+from typing import Iterable, Iterator, List, Set
+
+import discord
+
+__all__ = ["Outbox", "LiveMessage", "pack_messages"]
+
+MAX_MESSAGE_LENGTH = 2000
+EDIT_DELAY = 1.5
+"""Seconds to wait for other changes before editing a live message."""
+
+
+def pack_messages(messages: Iterable[str], limit=MAX_MESSAGE_LENGTH) -> Iterator[str]:
+    """Merge consecutive messages, keeping their order, in as few messages under `limit` as possible."""
+
+    current = ""
+    for msg in messages:
+        while len(msg) > limit:
+            # Too long on its own, we cut it at the last line break that fits.
+            cut = msg.rfind("\n", 0, limit)
+            if cut <= 0:
+                cut = limit
+            if current:
+                yield current
+                current = ""
+            yield msg[:cut]
+            msg = msg[cut:].lstrip("\n")
+
+        if not current:
+            current = msg
+        elif len(current) + 1 + len(msg) <= limit:
+            current += "\n" + msg
+        else:
+            yield current
+            current = msg
+
+    if current:
+        yield current
+
+
+class Outbox:
+    """
+    Queue of the messages for one channel.
+
+    Messages put in the outbox during the same tick of the event loop
+    are sent together as few messages as possible, in order.
+
+    The background sends are kept in `tasks`: their errors are printed,
+    and `close` or `cancel` must be called when the outbox is not used
+    anymore.
+    """
+
+    def __init__(self, channel, limiter: asyncio.Semaphore = None):
+        self.channel = channel
+        self.limiter = limiter or asyncio.Semaphore(1)
+        self.pending: List[str] = []
+        self.tasks: Set[asyncio.Future] = set()
+        self._scheduled = False
+        self._lock = asyncio.Lock()
+
+    def put(self, content: str):
+        """Queue a message, that will be sent at the next tick."""
+
+        self.pending.append(content)
+        if not self._scheduled:
+            self._scheduled = True
+            self.spawn(self.flush())
+
+    def spawn(self, coro) -> asyncio.Future:
+        """Run the coroutine in the background, until the outbox is closed."""
+
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self._done)
+        return task
+
+    def _done(self, task: asyncio.Future):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            e = task.exception()
+            traceback.print_tb(e.__traceback__, file=sys.stderr)
+            print(f"Could not send in {self.channel}: {e}")
+
+    async def close(self):
+        """Wait for the background sends, and send what is still pending."""
+
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.flush()
+
+    def cancel(self):
+        """Stop the background sends, the pending messages are dropped."""
+
+        for task in self.tasks:
+            task.cancel()
+        self.pending.clear()
+        self._scheduled = False
+
+    async def flush(self):
+        """Send all the pending messages now."""
+
+        async with self._lock:
+            await self._flush()
+
+    async def send(self, content=None, **kwargs):
+        """Send a message right away, after all the pending ones."""
+
+        async with self._lock:
+            await self._flush()
+            async with self.limiter:
+                return await self.channel.send(content, **kwargs)
+
+    async def _flush(self):
+        self._scheduled = False
+        messages, self.pending = self.pending, []
+        for msg in pack_messages(messages):
+            async with self.limiter:
+                await self.channel.send(msg)
+
+
+class LiveMessage:
+    """
+    An embed of an outbox, edited in place and pinned if `pin`.
+
+    The embed is posted after the pending messages of the outbox at
+    the first update. The next updates during `delay` seconds are
+    merged in a single edit, with the last embed given. The edits are
+    background tasks of the outbox, which closes or cancels them.
+    """
+
+    def __init__(self, outbox: Outbox, delay=EDIT_DELAY, pin=True):
+        self.outbox = outbox
+        self.delay = delay
+        self.pin = pin
+        self.message = None
+        self.embed = None
+        self._shown = None
+        self._scheduled = False
+        self._lock = asyncio.Lock()
+
+    def update(self, embed: discord.Embed):
+        """Show this embed instead of the previous one, soon."""
+
+        self.embed = embed
+        if not self._scheduled:
+            self._scheduled = True
+            self.outbox.spawn(self._update_later())
+
+    async def _update_later(self):
+        if self.message is not None:
+            await asyncio.sleep(self.delay)
+        await self.flush()
+
+    async def flush(self):
+        """Show the last embed now."""
+
+        async with self._lock:
+            self._scheduled = False
+            embed = self.embed
+            if embed is None or embed is self._shown:
+                return
+
+            if self.message is None:
+                self.message = await self.outbox.send(embed=embed)
+                if self.pin:
+                    await self._try(self.message.pin)
+            else:
+                async with self.outbox.limiter:
+                    await self.message.edit(embed=embed)
+            self._shown = embed
+
+    async def close(self, embed: discord.Embed = None):
+        """Show the final embed and unpin the message."""
+
+        if embed is not None:
+            self.embed = embed
+        await self.flush()
+        if self.pin and self.message is not None:
+            await self._try(self.message.unpin)
+
+    async def _try(self, action):
+        # Without the permission to pin, the message is still edited
+        try:
+            async with self.outbox.limiter:
+                await action()
+        except discord.HTTPException as e:
+            print(f"Could not {action.__name__} the message: {e}")
@@ -0,0 +1,122 @@
+"""
+Partition of the teams in poules.
+
+By default the poules are filled in the order of the dice. For big
+tournaments, `separate` moves teams around so that teams from the same
+tournament (or school...) and teams that already met in a previous
+round end up in different poules. The dice still decide everything
+else: the search starts from the dice order and only keeps swaps
+that strictly reduce the number of conflicts.
+"""
+
+from itertools import combinations
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+__all__ = ["pool_sizes", "fill", "separate", "conflicts"]
+
+SIZE_COST = {3: 0, 4: 1, 5: 3}
+"""How much we want to avoid each size of poule. Poules of 5 need two rooms."""
+
+
+def pool_sizes(teams: int, costs: Dict[int, int] = SIZE_COST) -> List[int]:
+    """The sizes of the poules for this number of teams with the lowest total cost."""
+
+    inf = float("inf")
+    best: List[Tuple[float, Optional[int]]] = [(0, None)] + [(inf, None)] * teams
+    for n in range(1, teams + 1):
+        for size, cost in costs.items():
+            if size <= n and best[n - size][0] + cost < best[n][0]:
+                best[n] = (best[n - size][0] + cost, size)
+
+    if best[teams][0] == inf:
+        raise ValueError(f"Cannot split {teams} teams in poules of {list(costs)}")
+
+    sizes = []
+    while teams:
+        size = best[teams][1]
+        sizes.append(size)
+        teams -= size
+    return sorted(sizes)
+
+
+def fill(teams: Sequence[str], sizes: Iterable[int]) -> List[List[str]]:
+    """Cut the teams in consecutive poules."""
+
+    poules, start = [], 0
+    for size in sizes:
+        poules.append(list(teams[start : start + size]))
+        start += size
+    return poules
+
+
+def conflicts(
+    poule: Iterable[str],
+    groups: Dict[str, Hashable],
+    met: Set[Tuple[str, str]] = frozenset(),
+) -> int:
+    """Number of pairs in the poule from the same group or that already met."""
+
+    return sum(
+        (a in groups and groups.get(a) == groups.get(b)) + ((a, b) in met)
+        for a, b in combinations(poule, 2)
+    )
+
+
+def separate(
+    teams: Sequence[str],
+    sizes: Sequence[int],
+    groups: Dict[str, Hashable] = None,
+    met: Iterable[Iterable[str]] = (),
+    max_passes=20,
+) -> List[List[str]]:
+    """
+    Split the teams, in dice order, in poules with as few conflicts as possible.
+
+    `groups` maps a team to its tournament, school... and `met` are
+    poules of previous rounds. Without conflicts, this is the same as
+    filling the poules in order.
+    """
+
+    groups = groups or {}
+    pairs = set()
+    for poule in met:
+        for a, b in combinations(poule, 2):
+            pairs.add((a, b))
+            pairs.add((b, a))
+
+    def cost(a, b):
+        return (a in groups and groups.get(a) == groups.get(b)) + ((a, b) in pairs)
+
+    poules = fill(teams, sizes)
+    where = {t: (p, i) for p, poule in enumerate(poules) for i, t in enumerate(poule)}
+
+    def load(team, p, without=None):
+        """Conflicts of the team if it was in poule p, ignoring `without`."""
+        return sum(cost(team, o) for o in poules[p] if o != team and o != without)
+
+    # Teams are considered in dice order, so the first ones stay in place.
+    for _ in range(max_passes):
+        improved = False
+        for a in teams:
+            pa, ia = where[a]
+            here = load(a, pa)
+            if not here:
+                continue
+            for b in teams:
+                pb, ib = where[b]
+                if pb == pa:
+                    continue
+                before = here + load(b, pb)
+                after = load(a, pb, without=b) + load(b, pa, without=a)
+                if after < before:
+                    poules[pa][ia], poules[pb][ib] = b, a
+                    where[a], where[b] = (pb, ib), (pa, ia)
+                    pa, ia = pb, ib
+                    here = load(a, pa)
+                    improved = True
+                    if not here:
+                        break
+        if not improved:
+            break
+
+    return poules
@@ -0,0 +1,169 @@
+"""
+Passage order in the poules.
+
+In a poule of n teams there are n presentations, one per defender.
+They happen during successive phases, each phase using up to `rooms`
+rooms at the same time. This module decides who opposes and reports
+in each presentation and draws the corresponding tables.
+"""
+
+from collections import namedtuple
+from typing import Dict, List, Optional, Sequence
+
+__all__ = ["Match", "rooms_for", "layout", "passage_order", "render_table"]
+
+Match = namedtuple("Match", ["phase", "room", "defender", "opponent", "reporter"])
+"""A presentation, the teams being their position in the passage order."""
+
+# The official layout of poules of 5, in two rooms.
+FIVE_TEAMS = [
+    Match(0, 0, 0, 2, 3),
+    Match(0, 1, 1, 3, 4),
+    Match(1, 0, 2, 0, 1),
+    Match(1, 1, 3, 4, 0),
+    Match(2, 0, 4, 1, 2),
+]
+
+ROLES = ("Def", "Opp", "Rap")
+CELL = 9
+
+
+def rooms_for(size) -> int:
+    """How many rooms are used in parallel for a poule of this size."""
+
+    if size == 5:
+        return 2
+    return max(1, size // 3)
+
+
+def layout(size, rooms=None) -> List[Match]:
+    """
+    The presentations of a poule, in the order of the passage order.
+
+    The i-th team defends the i-th problem, and the presentations are
+    placed in the rooms then the phases in this order. The opponent
+    and the reporter are `rooms` and `2 * rooms` places after the
+    defender, so no team is needed in two rooms at once when there
+    are at least three teams per room.
+    """
+
+    rooms = rooms or rooms_for(size)
+    if size == 5 and rooms == 2:
+        return list(FIVE_TEAMS)
+
+    return [
+        Match(i // rooms, i % rooms, i, (i + rooms) % size, (i + 2 * rooms) % size)
+        for i in range(size)
+    ]
+
+
+def passage_order(
+    teams: Sequence[str], problems: Sequence[Optional[str]], rooms: int
+) -> List[str]:
+    """
+    Reorder the teams so the ones with the same problem present it in the same phase.
+
+    Teams that share a problem are put together in the first phase
+    with enough free rooms, the other teams keep their order in the
+    remaining places. This runs in linear time in the number of teams.
+    """
+
+    groups: Dict[Optional[str], List[str]] = {}
+    for team, pb in zip(teams, problems):
+        groups.setdefault(pb, []).append(team)
+
+    phases = -(-len(teams) // rooms)
+    free = [min(rooms, len(teams) - p * rooms) for p in range(phases)]
+    placed: List[List[str]] = [[] for _ in range(phases)]
+    singles = []
+    first = 0  # No phase before has room for another group
+
+    for group in groups.values():
+        if len(group) == 1:
+            singles.append(group[0])
+            continue
+
+        p = first
+        while p < phases and free[p] < len(group):
+            p += 1
+        if p == phases:
+            # Too many teams with the same problem, they can not be together
+            singles.extend(group)
+            continue
+
+        placed[p].extend(group)
+        free[p] -= len(group)
+        while first < phases and free[first] < 2:
+            first += 1
+
+    order = []
+    singles.reverse()
+    for p in range(phases):
+        order.extend(placed[p])
+        for _ in range(free[p]):
+            order.append(singles.pop())
+    return order
+
+
+def render_table(records, matches: List[Match], compact=False) -> str:
+    """
+    Draw the table of a poule.
+
+    `records` are the teams in passage order, with a `name` and a `pb`.
+    In compact mode, there is no line between the teams.
+    """
+
+    rooms = max(m.room for m in matches) + 1
+    phases = max(m.phase for m in matches) + 1
+    per_phase = [sum(m.phase == p for m in matches) for p in range(phases)]
+    roles = [[""] * len(matches) for _ in records]
+    for col, m in enumerate(matches):
+        for team, role in zip((m.defender, m.opponent, m.reporter), ROLES):
+            roles[team][col] = role
+
+    if rooms == 1:
+        # Only one room, the phases are the columns
+        first = 5
+        head = [
+            ["T F"] + [f"Phase {p + 1}" for p in range(phases)],
+            ["J M"] + [f"Pb. {records[m.defender].pb}" for m in matches],
+        ]
+        names = [f" {r.name} " for r in records]
+    else:
+        first = 3
+        names = [r.name.center(first) for r in records]
+
+    def line(left, mid, right, widths, fill="═"):
+        return left + mid.join(fill * w for w in widths) + right
+
+    def row(cells, widths):
+        return "║" + "║".join(c.center(w) for c, w in zip(cells, widths)) + "║"
+
+    cols = [first] + [CELL] * len(matches)
+    lines = [line("╔", "╦", "╗", cols)]
+    if rooms == 1:
+        lines += [row(cells, cols) for cells in head]
+    else:
+        merged = [first] + [n * CELL + n - 1 for n in per_phase]
+        lines[0] = line("╔", "╦", "╗", merged)
+        lines.append(row([""] + [f"Phase {p + 1}" for p in range(phases)], merged))
+        # Split the merged phases in rooms
+        sep = "╠" + "═" * first
+        for n in per_phase:
+            sep += "╬" + "╦".join("═" * CELL for _ in range(n))
+        lines.append(sep + "╣")
+        lines.append(row([""] + [f"Salle {m.room + 1}" for m in matches], cols))
+        lines.append(
+            row([""] + [f"Pb. {records[m.defender].pb}" for m in matches], cols)
+        )
+
+    middle = line("╠", "╬", "╣", cols)
+    for i, (name, team_roles) in enumerate(zip(names, roles)):
+        if i == 0 or not compact:
+            lines.append(middle)
+        lines.append(
+            "║" + name + "║" + "║".join(c.center(CELL) for c in team_roles) + "║"
+        )
+    lines.append(line("╚", "╩", "╝", cols))
+
+    return "```\n" + "\n".join(lines) + "```"
@@ -0,0 +1,278 @@
+"""
+The teams registered for the tournaments.
+
+They are read from `data/teams`, a CSV file with a header and one line
+per team, exported from the registration website:
+
+    "name";"trigram";"tournoi";"secret";"status"
+
+The file changes a lot during the registration week, so it is read
+again as soon as it is modified, without restarting the bot.
+
+Who is in which team on discord is kept in a `Membership` index,
+built once and then updated from the discord events, so that nothing
+needs to go through all the members of the guild.
+"""
+
+import csv
+import os
+from collections import namedtuple
+from pathlib import Path
+from time import monotonic
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from src.constants import *
+
+__all__ = ["Team", "TeamRegistry", "Membership"]
+
+Team = namedtuple("Team", ["name", "trigram", "tournoi", "secret", "status"])
+
+CHECK_INTERVAL = 1
+"""Seconds between two checks that the file did not change."""
+
+
+class TeamRegistry:
+    """
+    The teams of the file, indexed by trigram, tournament and discord role.
+
+    Every lookup first reloads the file if it was modified, at most
+    once every `CHECK_INTERVAL` seconds.
+    """
+
+    def __init__(self, path: Path = File.TEAMS):
+        self.path = path
+        self.by_trigram: Dict[str, Team] = {}
+        self.by_tournoi: Dict[str, Dict[str, Team]] = {}
+        self.by_role: Dict[int, Team] = {}
+        self.listeners: List[Callable[[Set[str]], None]] = []
+        """Called with the trigrams of the teams that changed, after each reload."""
+        self._mtime = None
+        self._checked = float("-inf")
+        self.refresh(force=True)
+
+    def refresh(self, force=False) -> Set[str]:
+        """
+        Reload the file if it changed since the last time.
+
+        Return the trigrams of the teams that were added, modified or removed.
+        """
+
+        now = monotonic()
+        if not force and now - self._checked < CHECK_INTERVAL:
+            return set()
+        self._checked = now
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            mtime = None
+        else:
+            mtime = (stat.st_mtime_ns, stat.st_size)
+
+        if mtime == self._mtime:
+            return set()
+        self._mtime = mtime
+        changed = self._update(self._read() if mtime is not None else {})
+        if changed:
+            for listener in self.listeners:
+                listener(changed)
+        return changed
+
+    def _read(self) -> Dict[str, Team]:
+        teams = {}
+        with open(self.path, newline="") as f:
+            rows = csv.reader(f, delimiter=";")
+            next(rows, None)  # header
+            for line, row in enumerate(rows, start=2):
+                if not row:
+                    continue
+                if len(row) != len(Team._fields):
+                    print(f"Ignoring line {line} of {self.path}: {row}")
+                    continue
+                team = Team(*(field.strip() for field in row))
+                teams[team.trigram] = team
+        return teams
+
+    def _update(self, teams: Dict[str, Team]) -> Set[str]:
+        """Change only the entries of the teams that are new, modified or removed."""
+
+        changed = set()
+        for trigram, old in list(self.by_trigram.items()):
+            if teams.get(trigram) != old:
+                del self.by_trigram[trigram]
+                del self.by_tournoi[old.tournoi][trigram]
+                changed.add(trigram)
+
+        for trigram, team in teams.items():
+            if trigram not in self.by_trigram:
+                self.by_trigram[trigram] = team
+                self.by_tournoi.setdefault(team.tournoi, {})[trigram] = team
+                changed.add(trigram)
+
+        # Roles point to the new version of their team
+        self.by_role = {
+            role_id: self.by_trigram[team.trigram]
+            for role_id, team in self.by_role.items()
+            if team.trigram in self.by_trigram
+        }
+        return changed
+
+    def get(self, trigram) -> Optional[Team]:
+        self.refresh()
+        return self.by_trigram.get(trigram)
+
+    def of_tournoi(self, tournoi) -> List[Team]:
+        self.refresh()
+        return list(self.by_tournoi.get(tournoi, {}).values())
+
+    def for_role(self, role) -> Optional[Team]:
+        """The team of a discord role, or None if it is not the role of a team."""
+
+        self.refresh()
+        team = self.by_role.get(role.id)
+        if team is None:
+            # Team roles are named after the trigram
+            team = self.by_trigram.get(role.name)
+            if team is not None:
+                self.by_role[role.id] = team
+        return team
+
+    def forget_role(self, role_id):
+        """The role was deleted or renamed."""
+
+        self.by_role.pop(role_id, None)
+
+    def __contains__(self, trigram):
+        return self.get(trigram) is not None
+
+    def __iter__(self) -> Iterator[Team]:
+        self.refresh()
+        return iter(list(self.by_trigram.values()))
+
+    def __len__(self):
+        self.refresh()
+        return len(self.by_trigram)
+
+
+class Membership:
+    """
+    The members and the captains of each team on discord.
+
+    `build` goes through the guild once, then the cog keeps the index up
+    to date with `update_member`, `remove_member` and `update_role` from
+    the discord events. The members of the teams that change in the file
+    are indexed again by `update_teams`. Members are stored by id.
+    """
+
+    def __init__(self, registry: TeamRegistry):
+        self.registry = registry
+        self.members: Dict[str, Set[int]] = {}
+        self.captains: Dict[str, Set[int]] = {}
+        self.of_member: Dict[int, Set[str]] = {}
+        self.guild = None
+        self.ready = False
+        registry.listeners.append(self.update_teams)
+
+    def build(self, guild):
+        self.guild = guild
+        self.members.clear()
+        self.captains.clear()
+        self.of_member.clear()
+        for member in guild.members:
+            self.update_member(member)
+        self.ready = True
+
+    def update_member(self, member):
+        """Index the teams of the member again, after their roles changed."""
+
+        self.remove_member(member.id)
+
+        trigrams = set()
+        captain = False
+        for role in member.roles:
+            captain = captain or role.name == Role.CAPTAIN
+            team = self.registry.for_role(role)
+            if team is not None:
+                trigrams.add(team.trigram)
+
+        if not trigrams:
+            return
+        self.of_member[member.id] = trigrams
+        for trigram in trigrams:
+            self.members.setdefault(trigram, set()).add(member.id)
+            if captain:
+                self.captains.setdefault(trigram, set()).add(member.id)
+
+    def remove_member(self, member_id):
+        for trigram in self.of_member.pop(member_id, ()):
+            for index in (self.members, self.captains):
+                ids = index.get(trigram)
+                if ids is not None:
+                    ids.discard(member_id)
+                    if not ids:
+                        del index[trigram]
+
+    def update_role(self, before, after=None):
+        """
+        A role was renamed, or deleted if there is no `after`.
+
+        The teams of the members of the team it was, and of the members
+        who have it now, are computed again.
+        """
+
+        team = self.registry.for_role(before)
+        affected = set(self.members.get(team.trigram, ())) if team else set()
+        if after is not None:
+            affected.update(m.id for m in after.members)
+
+        self.registry.forget_role(before.id)
+        for member_id in affected:
+            member = before.guild.get_member(member_id)
+            if member is None:
+                self.remove_member(member_id)
+            else:
+                self.update_member(member)
+
+    def update_teams(self, trigrams: Set[str]):
+        """
+        Those teams were added, modified or removed in the file.
+
+        The members indexed in them, and the members with a role named
+        after them, are indexed again.
+        """
+
+        if not self.ready:
+            return
+
+        affected = set()
+        for trigram in trigrams:
+            affected.update(self.members.get(trigram, ()))
+        for role in self.guild.roles:
+            if role.name in trigrams:
+                affected.update(m.id for m in role.members)
+
+        for member_id in affected:
+            member = self.guild.get_member(member_id)
+            if member is None:
+                self.remove_member(member_id)
+            else:
+                self.update_member(member)
+
+    def teams_of(self, member_id) -> Set[str]:
+        self.registry.refresh()
+        return self.of_member.get(member_id, set())
+
+    def captains_of(self, trigram) -> Set[int]:
+        self.registry.refresh()
+        return self.captains.get(trigram, set())
+
+    def teams_by_tournoi(self) -> Dict[str, List[str]]:
+        """The trigrams of the teams with a captain on discord, for each tournament."""
+
+        self.registry.refresh()
+        tournois = {}
+        for trigram in sorted(self.captains):
+            team = self.registry.get(trigram)
+            if team is not None:
+                tournois.setdefault(team.tournoi, []).append(trigram)
+        return tournois
@@ -0,0 +1,93 @@
+"""
+Scheduling of the tirages running at the same time.
+
+Each running tirage is a session bound to a channel. The scheduler
+runs every session in its own task, so a tirage never blocks the
+command that started it nor the other tirages.
+"""
+
+import asyncio
+import sys
+import traceback
+from time import time
+from typing import Dict, Optional
+
+from src.base_tirage import BaseTirage
+
+__all__ = ["Session", "TirageScheduler"]
+
+
+class Session:
+    """A tirage running in a channel."""
+
+    def __init__(self, channel_id, tirage: BaseTirage, rounds):
+        self.channel_id = channel_id
+        self.tirage = tirage
+        self.rounds = rounds
+        self.started = time()
+        self.aborted = False
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def queue_depth(self):
+        return self.tirage.queue.qsize()
+
+
+class TirageScheduler:
+    """Owns all the running tirages, at most one per channel."""
+
+    def __init__(self):
+        self.sessions: Dict[int, Session] = {}
+
+    def __contains__(self, channel_id):
+        return channel_id in self.sessions
+
+    def __iter__(self):
+        return iter(list(self.sessions.values()))
+
+    def get(self, channel_id) -> Optional[BaseTirage]:
+        session = self.sessions.get(channel_id)
+        return session and session.tirage
+
+    def start(self, channel_id, tirage: BaseTirage, rounds) -> Session:
+        """Run the tirage in the background, in the given channel."""
+
+        assert channel_id not in self.sessions, "Already a tirage in this channel"
+
+        session = Session(channel_id, tirage, rounds)
+        self.sessions[channel_id] = session
+        session.task = asyncio.ensure_future(self._run(session))
+        return session
+
+    def abort(self, channel_id) -> Optional[Session]:
+        """Stop the tirage of the channel, if any. It can not be resumed."""
+
+        session = self.sessions.pop(channel_id, None)
+        if session is not None:
+            session.aborted = True
+            session.task.cancel()
+        return session
+
+    async def _run(self, session: Session):
+        tirage = session.tirage
+        try:
+            await tirage.run(session.rounds)
+        except asyncio.CancelledError:
+            # If we are not aborted, the bot is shutting down
+            # and the journal is kept to resume the tirage later.
+            self._close_journal(tirage, delete=session.aborted)
+            raise
+        except Exception as e:
+            traceback.print_tb(e.__traceback__, file=sys.stderr)
+            print(e)
+            self._close_journal(tirage, delete=False)
+        else:
+            self._close_journal(tirage, delete=True)
+        finally:
+            if self.sessions.get(session.channel_id) is session:
+                del self.sessions[session.channel_id]
+
+    @staticmethod
+    def _close_journal(tirage, delete):
+        if tirage.journal is not None:
+            tirage.journal.close(delete=delete)
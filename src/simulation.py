@@ -0,0 +1,248 @@
+"""
+Headless simulation of tirages.
+
+This drives complete tirages without discord, with scripted captains
+that answer every prompt as soon as it is asked, to measure the
+performance of the draw engine. Run it with
+
+    python -m src.simulation --sessions 1000
+"""
+
+import argparse
+import asyncio
+import random
+import tracemalloc
+from collections import defaultdict, namedtuple
+from time import perf_counter
+from typing import Dict, List, Sequence
+
+from src import codec
+from src.base_tirage import BaseTirage, Team
+from src.constants import *
+from src.timings import percentiles
+
+__all__ = [
+    "FakeRole",
+    "Captain",
+    "HeadlessTirage",
+    "FORMATS",
+    "simulate",
+    "history_memory",
+]
+
+FakeRole = namedtuple("FakeRole", ["name", "mention"])
+
+# All the formats accepted by `!draw start`
+FORMATS = [
+    (3,),
+    (4,),
+    (5,),
+    (3, 3),
+    (3, 4),
+    (4, 4),
+    (3, 5),
+    (4, 5),
+    (5, 5),
+    (3, 3, 3),
+    (3, 3, 4),
+    (3, 4, 5),
+]
+
+
+class Captain:
+    """Strategy of the captains to accept or refuse the problems they draw."""
+
+    def __init__(self, reject_probability=0.3):
+        self.reject_probability = reject_probability
+
+    def accept(self, team, pb, rnd) -> bool:
+        if not team.has_rejected(rnd, pb) and team.rejected_count(rnd) >= MAX_REFUSE:
+            # Refusing would cost a penalty
+            return True
+        return random.random() >= self.reject_probability
+
+
+class HeadlessTirage(BaseTirage):
+    """
+    A tirage where the captains are scripted.
+
+    It counts the events it receives and the time spent in each phase.
+    """
+
+    def __init__(self, *teams, fmt, captain: Captain):
+        super(HeadlessTirage, self).__init__(*teams, fmt=fmt)
+        self.captain = captain
+        self.events = 0
+        self.phases: Dict[str, List[float]] = defaultdict(list)
+        self._started = {}
+
+    def begin(self, phase):
+        self._started[phase] = perf_counter()
+
+    def end(self, phase):
+        self.phases[phase].append(perf_counter() - self._started.pop(phase))
+
+    async def next(self, typ, team=None, **kwargs):
+        event = await super().next(typ, team, **kwargs)
+        self.events += 1
+        return event
+
+    async def start_make_poule(self, rnd):
+        self.begin("poules")
+        for team in self.teams:
+            await self.dice(team)
+
+    async def annonce_poules(self, poules):
+        self.end("poules")
+
+    async def start_draw_poule(self, poule):
+        self.begin("poule")
+
+    async def annonce_poule(self, poule):
+        self.end("poule")
+
+    async def start_draw_order(self, poule):
+        self.begin("ordre")
+        for team in self.poules[poule]:
+            await self.dice(team)
+
+    async def annonce_draw_order(self, order):
+        self.end("ordre")
+
+    async def warn_colisions(self, collisions: List[str]):
+        for team in collisions:
+            await self.dice(team)
+
+    async def start_select_pb(self, team):
+        self.begin("problème")
+        await self.rproblem(team.name)
+
+    async def info_draw_pb(self, team, pb, rnd):
+        await self.accept(team.name, self.captain.accept(team, pb, rnd))
+
+    async def info_accepted(self, team, pb, still_available):
+        self.end("problème")
+
+    async def info_rejected(self, team, pb, rnd):
+        self.end("problème")
+
+
+def make_tirage(fmt, captain) -> HeadlessTirage:
+    teams = [FakeRole(f"T{i:02}", f"<@&{i}>") for i in range(sum(fmt))]
+    return HeadlessTirage(*teams, fmt=fmt, captain=captain)
+
+
+async def run_sessions(formats, sessions, captain):
+    tirages = [make_tirage(formats[i % len(formats)], captain) for i in range(sessions)]
+    await asyncio.gather(*(t.run() for t in tirages))
+    return tirages
+
+
+def simulate(
+    formats: Sequence[Sequence[int]] = FORMATS,
+    sessions=1000,
+    captain: Captain = None,
+    memory_sample=100,
+):
+    """
+    Run `sessions` complete tirages concurrently and return the measures.
+
+    The memory is measured in a second run, on `memory_sample` sessions,
+    as tracing allocations slows everything down.
+    """
+
+    captain = captain or Captain()
+
+    start = perf_counter()
+    tirages = asyncio.run(run_sessions(formats, sessions, captain))
+    duration = perf_counter() - start
+
+    phases = defaultdict(list)
+    for t in tirages:
+        for phase, durations in t.phases.items():
+            phases[phase].extend(durations)
+    events = sum(t.events for t in tirages)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = asyncio.run(run_sessions(formats, memory_sample, captain))
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return {
+        "sessions": sessions,
+        "duration": duration,
+        "events": events,
+        "events/s": events / duration,
+        "phases": {p: percentiles(d) for p, d in phases.items()},
+        "bytes/session": (after - before) / len(kept),
+    }
+
+
+def history_memory(count=1000):
+    """Bytes used by a finished tirage and by one of its teams, once loaded."""
+
+    raw = [codec.dumps(codec.random_tirage(i)) for i in range(count)]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tirages = [codec.loads(r) for r in raw]
+    after_tirages = tracemalloc.get_traced_memory()[0]
+    teams = [
+        Team.restore(t.name, t.mention, t.accepted_problems, t.rejected)
+        for tirage in tirages
+        for t in tirage.teams.values()
+    ]
+    after_teams = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return {
+        "bytes/tirage": (after_tirages - before) / count,
+        "bytes/team": (after_teams - after_tirages) / len(teams),
+    }
+
+
+def parse_formats(formats: str):
+    return [tuple(map(int, fmt.split("+"))) for fmt in formats.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--sessions", type=int, default=1000)
+    parser.add_argument(
+        "-f",
+        "--formats",
+        type=parse_formats,
+        default=FORMATS,
+        help="Comma separated formats, like 3+3,5 (default: all)",
+    )
+    parser.add_argument("-r", "--reject", type=float, default=0.3)
+    parser.add_argument("-s", "--seed", type=int)
+    parser.add_argument(
+        "-m",
+        "--memory",
+        action="store_true",
+        help="Measure the memory of finished tirages instead",
+    )
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.memory:
+        res = history_memory(args.sessions)
+        print(f"{res['bytes/tirage']:.0f} bytes per finished tirage")
+        print(f"{res['bytes/team']:.0f} bytes per team")
+        return
+
+    res = simulate(args.formats, args.sessions, Captain(args.reject))
+
+    print(f"{res['sessions']} tirages in {res['duration']:.3f}s")
+    print(f"{res['events']} events, {res['events/s']:.0f} events/s")
+    print(f"{res['bytes/session'] / 1024:.1f} KiB per session")
+    print()
+    print(f"{'phase':>10} {'p50':>10} {'p90':>10} {'p99':>10}")
+    for phase, values in res["phases"].items():
+        print(f"{phase:>10}", *(f"{v * 1000:8.3f}ms" for v in values))
+
+
+if __name__ == "__main__":
+    main()
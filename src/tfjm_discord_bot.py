@@ -4,6 +4,7 @@ from discord import Intents
 
 from src.constants import *
 from src.core import CustomBot
+from src.scheduler import TirageScheduler
 
 # We allow "! " to catch people that put a space in their commands.
 # It must be in first otherwise "!" always match first and the space is not recognised
@@ -12,10 +13,19 @@ from src.utils import fg
 # Global variable to hold the tirages.
 # We *want* it to be global so we can reload the tirages cog without
 # removing all the running tirages
-tirages = {}
+scheduler = TirageScheduler()
 
 
 def start():
+    if DISCORD_TOKEN is None:
+        print("No token for the bot were found.")
+        print("You need to set the TFJM_DISCORD_TOKEN variable in your environement")
+        print("Or just run:")
+        print()
+        print(f'    TFJM_DISCORD_TOKEN="your token here" python tfjm-discord-bot.py')
+        print()
+        quit(1)
+
     bot = CustomBot(("! ", "!"), case_insensitive=True, owner_id=DIEGO, intents=Intents.all())
 
     @bot.event
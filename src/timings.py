@@ -0,0 +1,117 @@
+"""
+Where the time goes during a tirage.
+
+The draw engine marks the start and the end of each step of a tirage
+(see `BaseTirage.mark`) and the marks are saved with the tirage. This
+module turns them into durations, per phase and per team, for
+`!draw stats`.
+"""
+
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from src.base_tirage import Mark
+
+__all__ = ["PHASES", "percentiles", "durations", "summary"]
+
+# Name of each measure, with the marks at its start and at its end
+PHASES = {
+    "Poules": ("poules", ("poules_done",)),
+    "Ordre": ("order", ("order_done",)),
+    "Poule": ("poule", ("poule_done",)),
+    "Dé": ("dice_round", ("dice",)),
+    "Tirage": ("select", ("drawn",)),
+    "Décision": ("drawn", ("accepted", "rejected")),
+}
+
+# Phases that run for one team at a time. The other phases are
+# started once for everyone, like a dice round for all the teams.
+PER_TEAM = ("Tirage", "Décision")
+
+
+def percentiles(values):
+    """The 50th, 90th and 99th percentiles, by nearest rank, so always one of the values."""
+
+    if not values:
+        return [0] * 3
+    values = sorted(values)
+    n = len(values)
+    # The smallest value with at least p% of the values at or below it
+    return [values[max(0, math.ceil(p * n / 100) - 1)] for p in (50, 90, 99)]
+
+
+def durations(marks: Iterable[Mark]) -> Tuple[Dict[str, List[Tuple]], int]:
+    """
+    The durations of each phase, as (team, seconds), and the number of collisions.
+
+    The team is None for the phases that do not belong to a team.
+    A phase ends at the first matching mark after its start, for the
+    same team in the phases of `PER_TEAM`.
+    """
+
+    ends = {end: phase for phase, (_, e) in PHASES.items() for end in e}
+    starts = defaultdict(list)
+    for phase, (start, _) in PHASES.items():
+        starts[start].append(phase)
+
+    started = {}
+    measures = defaultdict(list)
+    collisions = 0
+    for mark in marks:
+        if mark.kind == "collision":
+            collisions += 1
+
+        phase = ends.get(mark.kind)
+        key = (phase, mark.team if phase in PER_TEAM else None)
+        if key in started:
+            measures[phase].append((mark.team, mark.time - started[key]))
+            # A dice round ends once for every team
+            if phase != "Dé":
+                del started[key]
+
+        for phase in starts.get(mark.kind, ()):
+            started[phase, mark.team if phase in PER_TEAM else None] = mark.time
+
+    return measures, collisions
+
+
+def summary(marks: Iterable[Mark]) -> Dict[str, Dict]:
+    """
+    Percentiles of the durations, per phase and per team.
+
+    The measures of a team are all the times it had to answer:
+    dices, problems to draw, and to accept or refuse.
+
+    Each phase and each team maps to the number of measures, their
+    percentiles and their maximum. "Collisions" is the number of dice
+    rounds that had to be redone.
+    """
+
+    measures, collisions = durations(marks)
+
+    phases = {}
+    teams = defaultdict(list)
+    for phase, values in measures.items():
+        seconds = [s for _, s in values]
+        phases[phase] = {
+            "count": len(seconds),
+            "percentiles": percentiles(seconds),
+            "max": max(seconds),
+        }
+        for team, s in values:
+            if team is not None:
+                teams[team].append(s)
+
+    return {
+        "phases": phases,
+        "teams": {
+            team: {
+                "count": len(seconds),
+                "percentiles": percentiles(seconds),
+                "max": max(seconds),
+            }
+            for team, seconds in sorted(teams.items())
+        },
+        "collisions": collisions,
+    }
@@ -0,0 +1,404 @@
+"""
+Persistent storage of the tirages.
+
+All the tirages are kept in a single SQLite database, with
+one row per tirage, per team in a tirage and per team in a poule.
+Saving a tirage only touches its own rows, so it costs the same
+whatever the number of tirages already done. The timestamps of the
+steps of each tirage are appended next to it, to see where time goes.
+
+Each save increments the version of the tirage. The rendered summaries
+of the poules are cached for one version, so they are computed again
+only when the tirage changed.
+"""
+
+import json
+import sqlite3
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from time import time
+from typing import Dict, Optional, Type, List, Tuple
+
+from src.base_tirage import BaseTirage, Mark, Poule, Team
+from src.codec import load_legacy_yaml
+from src.constants import *
+
+__all__ = ["TirageStore", "get_store"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tirages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    format TEXT NOT NULL,
+    created REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    tournoi TEXT
+);
+
+CREATE TABLE IF NOT EXISTS teams (
+    tirage_id INTEGER NOT NULL REFERENCES tirages(id) ON DELETE CASCADE,
+    trigram TEXT NOT NULL,
+    mention TEXT NOT NULL,
+    accepted_0 TEXT,
+    accepted_1 TEXT,
+    rejected_0 TEXT NOT NULL DEFAULT '[]',
+    rejected_1 TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (tirage_id, trigram)
+);
+CREATE INDEX IF NOT EXISTS teams_trigram ON teams(trigram);
+
+CREATE TABLE IF NOT EXISTS poules (
+    tirage_id INTEGER NOT NULL REFERENCES tirages(id) ON DELETE CASCADE,
+    rnd INTEGER NOT NULL,
+    poule TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    trigram TEXT NOT NULL,
+    PRIMARY KEY (tirage_id, rnd, poule, position)
+);
+CREATE INDEX IF NOT EXISTS poules_trigram ON poules(trigram);
+
+CREATE TABLE IF NOT EXISTS marks (
+    tirage_id INTEGER NOT NULL REFERENCES tirages(id) ON DELETE CASCADE,
+    time REAL NOT NULL,
+    kind TEXT NOT NULL,
+    trigram TEXT,
+    poule TEXT
+);
+CREATE INDEX IF NOT EXISTS marks_tirage ON marks(tirage_id);
+
+CREATE TABLE IF NOT EXISTS summaries (
+    tirage_id INTEGER NOT NULL REFERENCES tirages(id) ON DELETE CASCADE,
+    rnd INTEGER NOT NULL,
+    poule TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (tirage_id, rnd, poule)
+);
+"""
+
+SUMMARY_CACHE_SIZE = 256
+"""How many rendered summaries are also kept in memory."""
+
+
+class TirageStore:
+    """Transactional storage of the tirages in a SQLite database."""
+
+    def __init__(self, path: Path = File.TIRAGES_DB):
+        self.path = path
+        self.db = sqlite3.connect(str(path), isolation_level=None)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+        columns = [c[1] for c in self.db.execute("PRAGMA table_info(tirages)")]
+        if "version" not in columns:
+            # Databases created before the versions
+            self.db.execute(
+                "ALTER TABLE tirages ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+            )
+        if "tournoi" not in columns:
+            # Databases created before the tournaments were recorded
+            self.db.execute("ALTER TABLE tirages ADD COLUMN tournoi TEXT")
+        # (tirage id, round, poule) -> (version, summary), least recent first
+        self._summaries = OrderedDict()
+
+    @contextmanager
+    def transaction(self):
+        """Context manager for a write transaction."""
+
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.db
+        except:
+            self.db.execute("ROLLBACK")
+            raise
+        else:
+            self.db.execute("COMMIT")
+
+    def new_id(self) -> int:
+        """Reserve a new id for a tirage, without loading any other tirage."""
+
+        cur = self.db.execute(
+            "INSERT INTO tirages (format, created) VALUES ('[]', ?)", (time(),)
+        )
+        return cur.lastrowid
+
+    def ids(self) -> List[int]:
+        return [i for i, in self.db.execute("SELECT id FROM tirages ORDER BY id")]
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM tirages").fetchone()[0]
+
+    def __contains__(self, tirage_id):
+        return (
+            self.db.execute(
+                "SELECT 1 FROM tirages WHERE id = ?", (tirage_id,)
+            ).fetchone()
+            is not None
+        )
+
+    def save(self, tirage: BaseTirage):
+        """Write the state of the tirage, replacing the previous one."""
+
+        with self.transaction():
+            self._save(tirage)
+        # Only once they are committed, otherwise they are saved next time
+        tirage.marks.clear()
+
+    def _save(self, tirage: BaseTirage):
+        self.db.execute(
+            "INSERT INTO tirages (id, format, created) VALUES (?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET format = excluded.format, "
+            "version = version + 1",
+            (tirage.id, json.dumps(list(tirage.format)), time()),
+        )
+        self.db.execute("DELETE FROM teams WHERE tirage_id = ?", (tirage.id,))
+        self.db.execute("DELETE FROM poules WHERE tirage_id = ?", (tirage.id,))
+
+        self.db.executemany(
+            "INSERT INTO teams VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    tirage.id,
+                    team.name,
+                    team.mention,
+                    *team.accepted_problems,
+                    *(json.dumps(sorted(r)) for r in team.rejected),
+                )
+                for team in tirage.teams.values()
+            ],
+        )
+        self.db.executemany(
+            "INSERT INTO poules VALUES (?, ?, ?, ?, ?)",
+            [
+                (tirage.id, poule.rnd, poule.poule, position, trigram)
+                for poule, trigrams in tirage.poules.items()
+                for position, trigram in enumerate(trigrams)
+            ],
+        )
+        self.db.executemany(
+            "INSERT INTO marks VALUES (?, ?, ?, ?, ?)",
+            [(tirage.id, *mark) for mark in tirage.marks],
+        )
+
+    def delete(self, tirage_id):
+        self.db.execute("DELETE FROM tirages WHERE id = ?", (tirage_id,))
+        for key in [k for k in self._summaries if k[0] == tirage_id]:
+            del self._summaries[key]
+
+    def set_tournoi(self, tirage_id, tournoi: str):
+        """Record the tournament the tirage was made for."""
+
+        self.db.execute(
+            "UPDATE tirages SET tournoi = ? WHERE id = ?", (tournoi, tirage_id)
+        )
+
+    def latest_of(self, tournoi: str) -> Optional[int]:
+        """The id of the last tirage made for the tournament, if any."""
+
+        return self.db.execute(
+            "SELECT MAX(id) FROM tirages WHERE tournoi = ?", (tournoi,)
+        ).fetchone()[0]
+
+    def versions(self) -> Dict[int, int]:
+        """The version of every tirage, by id. Ids are never reused."""
+
+        return dict(self.db.execute("SELECT id, version FROM tirages ORDER BY id"))
+
+    def version(self, tirage_id) -> int:
+        """The number of times the tirage was saved, 0 if it does not exist."""
+
+        row = self.db.execute(
+            "SELECT version FROM tirages WHERE id = ?", (tirage_id,)
+        ).fetchone()
+        return row[0] if row is not None else 0
+
+    def summary(self, tirage_id, poule: Poule, version) -> Optional[dict]:
+        """The summary of the poule rendered for this version of the tirage, if any."""
+
+        key = (tirage_id, poule.rnd, poule.poule)
+        cached = self._summaries.get(key)
+        if cached is not None and cached[0] == version:
+            self._summaries.move_to_end(key)
+            return cached[1]
+
+        row = self.db.execute(
+            "SELECT data FROM summaries "
+            "WHERE tirage_id = ? AND rnd = ? AND poule = ? AND version = ?",
+            (*key, version),
+        ).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        self._remember(key, version, data)
+        return data
+
+    def save_summary(self, tirage_id, poule: Poule, version, data: dict):
+        """Cache the rendered summary of a poule, for this version of the tirage."""
+
+        key = (tirage_id, poule.rnd, poule.poule)
+        self.db.execute(
+            "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)",
+            (*key, version, json.dumps(data)),
+        )
+        self._remember(key, version, data)
+
+    def _remember(self, key, version, data):
+        self._summaries[key] = (version, data)
+        self._summaries.move_to_end(key)
+        if len(self._summaries) > SUMMARY_CACHE_SIZE:
+            self._summaries.popitem(last=False)
+
+    def marks(self, tirage_id) -> List[Mark]:
+        """The timestamps of the steps of a tirage, in order."""
+
+        return [
+            Mark(*row)
+            for row in self.db.execute(
+                "SELECT time, kind, trigram, poule FROM marks "
+                "WHERE tirage_id = ? ORDER BY rowid",
+                (tirage_id,),
+            )
+        ]
+
+    def load(
+        self, tirage_id, cls: Type[BaseTirage] = BaseTirage
+    ) -> Optional[BaseTirage]:
+        """Load one tirage, or None if there is no tirage with this id."""
+
+        row = self.db.execute(
+            "SELECT format FROM tirages WHERE id = ?", (tirage_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        teams = {
+            trigram: Team.restore(
+                trigram,
+                mention,
+                (acc0, acc1),
+                (json.loads(rej0), json.loads(rej1)),
+            )
+            for trigram, mention, acc0, acc1, rej0, rej1 in self.db.execute(
+                "SELECT trigram, mention, accepted_0, accepted_1, rejected_0, rejected_1 "
+                "FROM teams WHERE tirage_id = ? ORDER BY rowid",
+                (tirage_id,),
+            )
+        }
+
+        poules = {}
+        current = None
+        for rnd, poule, trigram in self.db.execute(
+            "SELECT rnd, poule, trigram FROM poules WHERE tirage_id = ? "
+            "ORDER BY rnd, poule, position",
+            (tirage_id,),
+        ):
+            if current is None or (current.rnd, current.poule) != (rnd, poule):
+                current = Poule(poule, rnd)
+                poules[current] = []
+            poules[current].append(trigram)
+
+        return cls.restore(tirage_id, json.loads(row[0]), teams, poules)
+
+    def load_all(self, cls: Type[BaseTirage] = BaseTirage) -> Dict[int, BaseTirage]:
+        return {i: self.load(i, cls) for i in self.ids()}
+
+    def page(self, before=None, limit=20) -> List[Tuple[int, List[str]]]:
+        """
+        The teams of at most `limit` tirages, newest first.
+
+        Only the tirages with an id lower than `before` are
+        considered, so `before` is the last id of the previous page.
+        """
+
+        if before is None:
+            ids = self.db.execute(
+                "SELECT id FROM tirages ORDER BY id DESC LIMIT ?", (limit,)
+            )
+        else:
+            ids = self.db.execute(
+                "SELECT id FROM tirages WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (before, limit),
+            )
+        teams = {i: [] for i, in ids}
+        if not teams:
+            return []
+
+        for tirage_id, trigram in self.db.execute(
+            f"SELECT tirage_id, trigram FROM teams "
+            f"WHERE tirage_id IN ({', '.join('?' * len(teams))}) ORDER BY rowid",
+            tuple(teams),
+        ):
+            teams[tirage_id].append(trigram)
+        return list(teams.items())
+
+    def poules_of(self, trigram) -> List[Tuple[int, str, int]]:
+        """
+        All the poules where the team was, as (tirage id, poule, round).
+
+        This uses the index on the poules, which is up to date as soon
+        as a tirage is saved, that is after each announced poule.
+        """
+
+        return self.db.execute(
+            "SELECT tirage_id, poule, rnd FROM poules WHERE trigram = ? "
+            "ORDER BY tirage_id, rnd, poule",
+            (trigram,),
+        ).fetchall()
+
+    def history(self, trigram) -> List[Tuple[int, Poule, Team]]:
+        """The state of the team in all the poules it was, without loading the tirages."""
+
+        history = []
+        for tirage_id, rnd, poule, mention, acc0, acc1, rej0, rej1 in self.db.execute(
+            "SELECT p.tirage_id, p.rnd, p.poule, t.mention, t.accepted_0, t.accepted_1, "
+            "t.rejected_0, t.rejected_1 "
+            "FROM poules p JOIN teams t "
+            "ON t.tirage_id = p.tirage_id AND t.trigram = p.trigram "
+            "WHERE p.trigram = ? ORDER BY p.tirage_id, p.rnd",
+            (trigram,),
+        ):
+            team = Team.restore(
+                trigram, mention, (acc0, acc1), (json.loads(rej0), json.loads(rej1))
+            )
+            history.append((tirage_id, Poule(poule, rnd), team))
+        return history
+
+    def migrate_yaml(self, path: Path = File.TIRAGES):
+        """
+        Import the tirages of the old yaml file, once.
+
+        The file is renamed afterwards so the migration does not happen twice.
+        """
+
+        if not path.exists():
+            return
+
+        with open(path) as f:
+            tirages = load_legacy_yaml(f)
+
+        with self.transaction():
+            for tirage in tirages.values():
+                self._save(tirage)
+
+        path.rename(path.with_suffix(".yaml.migrated"))
+        print(f"Migrated {len(tirages)} tirages from {path} to {self.path}.")
+
+
+_store = None
+
+
+def get_store() -> TirageStore:
+    """Return the store shared by the whole bot, opening it the first time."""
+
+    global _store
+    if _store is None:
+        store = TirageStore()
+        # Only kept once migrated, so a failed migration is tried again
+        try:
+            store.migrate_yaml()
+        except Exception:
+            store.db.close()
+            raise
+        _store = store
+    return _store
@@ -1,7 +1,9 @@
 import asyncio
+from collections import deque
 from pprint import pprint
 from functools import wraps
 from io import StringIO
+from time import monotonic
 from typing import Union
 
 import discord
@@ -93,9 +95,90 @@ async def confirm(ctx, bot, prompt):
         return False
 
 
+async def paginate(ctx, bot, page, first=None, timeout=300):
+    """
+    Send a message with pages that can be browsed with reactions.
+
+    `page(cursor)` returns the content of the page at `cursor` and the
+    cursor of the next page, or None if it is the last one. Pages are
+    only rendered when they are shown.
+    """
+
+    cursors = [first]
+    content, next_cursor = page(first)
+    msg: discord.Message = await ctx.send(content)
+    if next_cursor is None:
+        return msg
+
+    await msg.add_reaction(Emoji.PREVIOUS)
+    await msg.add_reaction(Emoji.NEXT)
+
+    def check(reaction: discord.Reaction, u):
+        return (
+            u != bot.user
+            and msg.id == reaction.message.id
+            and str(reaction.emoji) in (Emoji.PREVIOUS, Emoji.NEXT)
+        )
+
+    while True:
+        try:
+            reaction, u = await bot.wait_for(
+                "reaction_add", check=check, timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            break
+
+        try:
+            await msg.remove_reaction(reaction.emoji, u)
+        except discord.Forbidden:
+            pass
+
+        if str(reaction.emoji) == Emoji.NEXT and next_cursor is not None:
+            cursors.append(next_cursor)
+        elif str(reaction.emoji) == Emoji.PREVIOUS and len(cursors) > 1:
+            cursors.pop()
+        else:
+            continue
+
+        content, next_cursor = page(cursors[-1])
+        await msg.edit(content=content)
+
+    try:
+        await msg.clear_reactions()
+    except (discord.NotFound, discord.Forbidden):
+        pass
+    return msg
+
+
 def start_time():
     return psutil.Process().create_time()
 
 
 def setup(bot: Bot):
     pass
+
+
+class RateLimiter:
+    """
+    Async context manager letting at most `calls` calls start every `period` seconds.
+
+    Discord limits each route separately, so each kind of request
+    should have its own limiter.
+    """
+
+    def __init__(self, calls, period):
+        self.calls = calls
+        self.period = period
+        self._starts = deque()
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        async with self._lock:
+            if len(self._starts) >= self.calls:
+                wait = self._starts.popleft() + self.period - monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            self._starts.append(monotonic())
+
+    async def __aexit__(self, *exc_info):
+        pass
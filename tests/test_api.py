@@ -0,0 +1,138 @@
+import asyncio
+import sqlite3
+
+from aiohttp import web
+
+from src.api import PoolPusher, is_drawn
+from src.simulation import Captain, make_tirage
+
+
+class StandIn:
+    """A local api that fails the first `failures` requests, answering after `delay`."""
+
+    def __init__(self, failures=0, delay=0):
+        self.failures = failures
+        self.delay = delay
+        self.received = []
+
+    async def handler(self, request):
+        body = await request.text()
+        await asyncio.sleep(self.delay)
+        if self.failures > 0:
+            self.failures -= 1
+            return web.Response(status=503)
+        self.received.append(body)
+        return web.Response(status=201)
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_post("/api/pool/", self.handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}/api"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.runner.cleanup()
+
+
+def make_pusher(url):
+    pusher = PoolPusher(sqlite3.connect(":memory:", isolation_level=None), url, "tok")
+    pusher.BASE_DELAY = 0.01
+    return pusher
+
+
+async def drawn_tirage(fmt=(3, 3)):
+    tirage = make_tirage(fmt, Captain())
+    await tirage.run()
+    tirage.id = 7
+    return tirage
+
+
+async def until_sent(pusher, timeout=5):
+    for _ in range(int(timeout / 0.02)):
+        if not pusher.pending():
+            return
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"Still pending: {pusher.pending()}")
+
+
+def test_failed_pushes_are_retried():
+    async def main():
+        async with StandIn(failures=2) as api:
+            tirage = await drawn_tirage()
+            pusher = make_pusher(api.url)
+
+            results = await pusher.push_all(tirage)
+            assert len(results) == len(tirage.poules)
+            assert sum(not r.ok for r in results) == 2
+            assert len(pusher.pending()) == 2
+
+            await until_sent(pusher)
+            assert len(api.received) == len(tirage.poules)
+            await pusher.close()
+
+    asyncio.run(main())
+
+
+def test_push_all_skips_unfinished_poules():
+    async def main():
+        async with StandIn() as api:
+            tirage = await drawn_tirage()
+            unfinished = next(p for p in tirage.poules if p.rnd == 1)
+            tirage.teams[tirage.poules[unfinished][0]].reset(unfinished.rnd)
+            assert not is_drawn(tirage, unfinished)
+
+            pusher = make_pusher(api.url)
+            results = await pusher.push_all(tirage)
+            assert {r.poule for r in results} == set(tirage.poules) - {unfinished}
+            assert all(r.ok for r in results)
+            await pusher.close()
+
+    asyncio.run(main())
+
+
+def test_worker_survives_unexpected_errors():
+    async def main():
+        async with StandIn() as api:
+            tirage = await drawn_tirage((3,))
+            pusher = make_pusher(api.url)
+            post = pusher.post
+            calls = []
+
+            async def malformed(payload):
+                calls.append(payload)
+                if len(calls) == 1:
+                    raise ValueError("malformed response")
+                return await post(payload)
+
+            pusher.post = malformed
+            pusher.enqueue(tirage, next(iter(tirage.poules)))
+            await until_sent(pusher)
+            assert len(calls) == 2
+            assert len(api.received) == 1
+            await pusher.close()
+
+    asyncio.run(main())
+
+
+def test_poule_sent_by_the_worker_is_not_pushed_again():
+    async def main():
+        async with StandIn(delay=0.2) as api:
+            tirage = await drawn_tirage((3,))
+            poule = next(iter(tirage.poules))
+            pusher = make_pusher(api.url)
+
+            pusher.enqueue(tirage, poule)
+            await asyncio.sleep(0.05)
+            result = await pusher.push(tirage, poule)
+
+            assert result.ok
+            assert len(api.received) == 1
+            assert not pusher.pending()
+            await pusher.close()
+
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from src import codec, tirage_store
+from src.codec import InvalidTirage, load_legacy_yaml
+from src.tirage_store import TirageStore
+
+BASELINE = Path(__file__).parent / "data" / "tirages_baseline.yaml"
+"""Written by yaml.dump in the bot before the codec, with a DiscordTirage."""
+
+
+def check_baseline(tirage):
+    assert tirage.id == 1
+    assert tuple(tirage.format) == (5,)
+    assert list(tirage.teams) == ["AAA", "BBB", "CCC", "DDD", "EEE"]
+    assert tirage.teams["AAA"].accepted_problems == (
+        "4: Sauver les meubles",
+        "8: Robots auto-réplicateurs",
+    )
+    assert tirage.teams["BBB"].rejected == (
+        ("8: Robots auto-réplicateurs",),
+        ("3: Un festin stratégique",),
+    )
+    assert {(str(p), tuple(t)) for p, t in tirage.poules.items()} == {
+        ("A1", ("AAA", "BBB", "CCC", "DDD", "EEE")),
+        ("A2", ("EEE", "DDD", "CCC", "BBB", "AAA")),
+    }
+
+
+def test_load_baseline_dump():
+    with open(BASELINE) as f:
+        tirages = load_legacy_yaml(f)
+
+    assert list(tirages) == [1]
+    check_baseline(tirages[1])
+    assert codec.loads(codec.dumps(tirages[1])).teams["BBB"].rejected_count(0) == 1
+
+
+def test_migrate_baseline_dump(tmp_path):
+    legacy = tmp_path / "tirages.yaml"
+    shutil.copy(BASELINE, legacy)
+
+    store = TirageStore(tmp_path / "tirages.db")
+    store.migrate_yaml(legacy)
+
+    assert not legacy.exists()
+    assert store.ids() == [1]
+    check_baseline(store.load(1))
+
+
+def test_failed_migration_is_tried_again(tmp_path, monkeypatch):
+    legacy = tmp_path / "tirages.yaml"
+    legacy.write_text("1: !!python/object:os.system {}\n")
+
+    class Store(TirageStore):
+        def __init__(self):
+            super().__init__(tmp_path / "tirages.db")
+
+        def migrate_yaml(self):
+            super().migrate_yaml(legacy)
+
+    monkeypatch.setattr(tirage_store, "TirageStore", Store)
+    monkeypatch.setattr(tirage_store, "_store", None)
+
+    with pytest.raises(InvalidTirage):
+        tirage_store.get_store()
+    assert tirage_store._store is None
+
+    shutil.copy(BASELINE, legacy)
+    check_baseline(tirage_store.get_store().load(1))
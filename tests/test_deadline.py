@@ -0,0 +1,67 @@
+import asyncio
+
+from src.base_tirage import BaseTirage, Event
+from src.constants import File
+from src.journal import Journal
+from src.simulation import FakeRole
+
+
+def idle_tirage(fmt=(3,)):
+    teams = [FakeRole(f"T{i:02}", f"<@&{i}>") for i in range(sum(fmt))]
+    return BaseTirage(*teams, fmt=fmt)
+
+
+def test_idle_tirage_is_played_automatically():
+    async def main():
+        tirage = idle_tirage((3, 3))
+        tirage.set_deadline(0.005, autoplay=True)
+        await asyncio.wait_for(tirage.run(), 10)
+
+        assert tirage.phase == ("finished",)
+        assert tirage.autoplayed > 0
+        for poule, teams in tirage.poules.items():
+            assert all(tirage.teams[t].accepted(poule.rnd) for t in teams)
+
+    asyncio.run(main())
+
+
+def test_deadline_is_kept_in_the_journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(File, "JOURNALS", tmp_path)
+
+    async def main():
+        tirage = idle_tirage()
+        tirage.journal = Journal.create(7, channel=1, rounds=[0, 1])
+        tirage.journal.append(Event("T00", 42))
+
+        tirage.set_deadline(30, autoplay=True)
+        tirage.journal.append(Event("T01", 12))
+        tirage.journal.close()
+
+        header, events = Journal.read(Journal.path_for(7))
+        assert header == {
+            "tirage": 7,
+            "channel": 1,
+            "rounds": [0, 1],
+            "deadline": 30,
+            "autoplay": True,
+        }
+        assert events == [("T00", 42), ("T01", 12)]
+        assert list(tmp_path.iterdir()) == [Journal.path_for(7)]
+
+    asyncio.run(main())
+
+
+def test_idle_teams_roll_at_the_same_deadline():
+    async def main():
+        tirage = idle_tirage((3, 3))
+        tirage.set_deadline(0.3, autoplay=True)
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        dices = await asyncio.wait_for(tirage.get_dices(list(tirage.teams)), 10)
+
+        assert sorted(dices) == sorted(tirage.teams)
+        # One deadline, and one more for each collision
+        collisions = tirage.autoplayed - len(dices)
+        assert loop.time() - start < 0.3 * (collisions + 2)
+
+    asyncio.run(main())
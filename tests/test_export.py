@@ -0,0 +1,49 @@
+import random
+
+from src import codec
+from src.export import export
+from src.tirage_store import TirageStore
+
+
+def filled_store(path, n=20):
+    random.seed(0)
+    store = TirageStore(path)
+    for _ in range(n):
+        store.save(codec.random_tirage(store.new_id()))
+    return store
+
+
+def aggregates(output):
+    return {
+        name: (output / name).read_bytes()
+        for name in ["tirages.json", "poules.csv", "index.html", "manifest.json"]
+    }
+
+
+def test_unchanged_tirages_are_not_loaded(tmp_path, monkeypatch):
+    store = filled_store(tmp_path / "tirages.db")
+    output = tmp_path / "export"
+    assert export(store, output).written == 20
+
+    mtimes = {p: p.stat().st_mtime_ns for p in output.rglob("*")}
+    monkeypatch.setattr(store, "load", None)
+    report = export(store, output)
+
+    assert (report.written, report.skipped) == (0, 20)
+    assert {p: p.stat().st_mtime_ns for p in output.rglob("*")} == mtimes
+
+
+def test_incremental_export_matches_full_export(tmp_path):
+    store = filled_store(tmp_path / "tirages.db")
+    export(store, tmp_path / "incremental")
+
+    tirage = store.load(5)
+    tirage.teams[next(iter(tirage.teams))].reset(0)
+    store.save(tirage)
+    store.delete(7)
+    report = export(store, tmp_path / "incremental")
+    assert (report.tirages, report.written, report.skipped) == (19, 1, 18)
+    assert not (tmp_path / "incremental" / "tirages" / "7.html").exists()
+
+    export(store, tmp_path / "full")
+    assert aggregates(tmp_path / "incremental") == aggregates(tmp_path / "full")
@@ -0,0 +1,101 @@
+import itertools
+import random
+from collections import Counter
+
+import pytest
+
+from src.base_tirage import BaseTirage, Poule, Team, can_complete
+from src.constants import PROBLEMS
+
+
+def brute_complete(free, forbidden):
+    """Whether each team can get a problem, by trying every assignment."""
+
+    for choice in itertools.product(range(len(free)), repeat=len(forbidden)):
+        if any(mask >> pb & 1 for mask, pb in zip(forbidden, choice)):
+            continue
+        taken = Counter(choice)
+        if all(taken[i] <= f for i, f in enumerate(free)):
+            return True
+    return False
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_can_complete_matches_brute_force(seed):
+    rng = random.Random(seed)
+    for _ in range(300):
+        n = rng.randint(2, 5)
+        free = tuple(rng.randint(0, 2) for _ in range(n))
+        forbidden = tuple(sorted(rng.getrandbits(n) for _ in range(rng.randint(0, 4))))
+        can_complete.cache_clear()
+        assert can_complete(free, forbidden) == brute_complete(free, forbidden)
+
+
+def random_poule(rng, size):
+    """A poule of the second round, with some teams that already accepted."""
+
+    capacity = 2 if size >= 5 else 1
+    taken = Counter()
+    teams = {}
+    for i in range(size):
+        first = rng.choice(PROBLEMS)
+        second = None
+        if rng.random() < 0.5:
+            choices = [p for p in PROBLEMS if p != first and taken[p] < capacity]
+            if choices:
+                second = rng.choice(choices)
+                taken[second] += 1
+        name = f"T{i:02}"
+        teams[name] = Team.restore(name, name, (first, second), ((), ()))
+
+    poule = Poule("A", 1)
+    tirage = BaseTirage.restore(1, (size,), teams, {poule: list(teams)})
+    # Most problems are already taken, as at the end of a big poule,
+    # so that some draws would leave a team without any problem.
+    for pb in rng.sample(PROBLEMS, len(PROBLEMS) - size):
+        tirage.counts(poule)[pb] = capacity
+    return tirage, poule
+
+
+def brute_feasible(tirage, poule, team, problems):
+    capacity = tirage.capacity(poule)
+    others = [
+        t
+        for t in (tirage.teams[n] for n in tirage.poules[poule])
+        if t is not team and t.accepted(poule.rnd) is None
+    ]
+    feasible = []
+    for pb in problems:
+        taken = tirage.counts(poule).copy()
+        taken[pb] += 1
+        free = tuple(capacity - taken[p] for p in PROBLEMS)
+        forbidden = tuple(
+            sum(1 << i for i, p in enumerate(PROBLEMS) if p in t.accepted_problems)
+            for t in others
+        )
+        if brute_complete(free, forbidden):
+            feasible.append(pb)
+    return feasible
+
+
+@pytest.mark.parametrize("size", [3, 4, 5, 6])
+def test_feasible_matches_brute_force(size):
+    rng = random.Random(size)
+    checked = 0
+    for _ in range(300):
+        tirage, poule = random_poule(rng, size)
+        counts = tirage.counts(poule)
+        capacity = tirage.capacity(poule)
+        for team in tirage.teams.values():
+            if team.accepted(poule.rnd) is not None:
+                continue
+            problems = [
+                p
+                for p in PROBLEMS
+                if counts[p] < capacity and p not in team.accepted_problems
+            ]
+            assert tirage.feasible(poule, team, problems) == brute_feasible(
+                tirage, poule, team, problems
+            )
+            checked += 1
+    assert checked > 100
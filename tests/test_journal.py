@@ -0,0 +1,44 @@
+import asyncio
+
+from src.base_tirage import Event
+from src.constants import File
+from src.journal import Journal
+
+
+def test_events_after_a_crash_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(File, "JOURNALS", tmp_path)
+
+    async def main():
+        journal = Journal.create(3, channel=1, rounds=[0, 1])
+        journal.append(Event("AAA", 12))
+        journal.append(Event("BBB", 34))
+        journal.close()
+
+        # Crash while writing an event
+        with open(journal.path, "a") as f:
+            f.write('["CCC", 5')
+
+        path = Journal.path_for(3)
+        assert Journal.read(path)[1] == [("AAA", 12), ("BBB", 34)]
+
+        journal = Journal(path)
+        journal.append(Event("CCC", 56))
+        journal.append(Event("CCC", True))
+        journal.close()
+
+        header, events = Journal.read(path)
+        assert header == {"tirage": 3, "channel": 1, "rounds": [0, 1]}
+        assert events == [("AAA", 12), ("BBB", 34), ("CCC", 56), ("CCC", True)]
+
+    asyncio.run(main())
+
+
+def test_line_without_end_is_incomplete(tmp_path):
+    path = tmp_path / "1.jsonl"
+    path.write_text('{"tirage": 1}\n["AAA", 12]\n["BBB", 1')
+
+    assert Journal.read(path)[1] == [("AAA", 12)]
+    Journal.cut(path)
+    assert path.read_text() == '{"tirage": 1}\n["AAA", 12]\n'
+    Journal.cut(path)
+    assert path.read_text() == '{"tirage": 1}\n["AAA", 12]\n'
@@ -0,0 +1,63 @@
+import asyncio
+from collections import namedtuple
+from types import SimpleNamespace
+
+import discord
+
+from src.constants import File, TOURNOIS
+from src.layout import load_layout, plan
+
+TEXT, VOICE = discord.ChannelType.text, discord.ChannelType.voice
+Role = namedtuple("Role", ["name"])
+
+
+class Guild:
+    """The state of a guild, changed by the create requests of the plan."""
+
+    def __init__(self, role_names):
+        self.default_role = Role("@everyone")
+        self.roles = [Role(n) for n in role_names]
+        self.categories = []
+        self.channels = []
+
+    async def create_category(self, name, reason):
+        category = SimpleNamespace(name=name)
+        self.categories.append(category)
+        return category
+
+    async def create_text_channel(self, name, **kwargs):
+        self.create(name, TEXT, **kwargs)
+
+    async def create_voice_channel(self, name, **kwargs):
+        self.create(name, VOICE, **kwargs)
+
+    def create(self, name, type, overwrites, category, reason):
+        if type == TEXT:
+            # Like Discord
+            name = name.lower().replace(" ", "-")
+        self.channels.append(
+            SimpleNamespace(
+                name=name, type=type, category=category, overwrites=overwrites
+            )
+        )
+
+
+async def run(steps):
+    for step in steps:
+        for action in step:
+            await action.run()
+
+
+def test_layout_is_applied_once():
+    roles = [f"{r} {t}" for t in TOURNOIS for r in ["Orga", "Jury"]]
+    guild = Guild(roles)
+    specs = load_layout(File.LAYOUT)
+
+    steps, problems = plan(guild, specs)
+    assert problems == []
+    asyncio.run(run(steps))
+    assert "cro-lille" in {c.name for c in guild.channels}
+
+    steps, problems = plan(guild, specs)
+    assert steps == [[], []]
+    assert problems == []
@@ -0,0 +1,35 @@
+import pytest
+
+from src.cogs import tirages as cog
+from src.cogs.tirages import TirageCog
+
+
+class Store:
+    def __init__(self, sizes):
+        self.teams = {
+            i: [f"T{n:02}" for n in range(size)] for i, size in enumerate(sizes, 1)
+        }
+
+    def page(self, before=None, limit=20):
+        ids = sorted((i for i in self.teams if before is None or i < before))
+        return [(i, self.teams[i]) for i in reversed(ids)][:limit]
+
+
+@pytest.mark.parametrize("sizes", [[3] * 45, [25] * 45, [3, 60, 5, 25, 400] * 9, []])
+def test_pages_fit_in_a_message(sizes, monkeypatch):
+    store = Store(sizes)
+    monkeypatch.setattr(cog, "get_store", lambda: store)
+
+    shown = []
+    cursor = None
+    while True:
+        content, cursor = TirageCog.render_tirages_page(cursor)
+        assert len(content) <= 2000
+        lines = content.splitlines()
+        assert 0 < len(lines) <= 20 or not sizes
+        shown.extend(int(line[1:].partition("`")[0]) for line in lines)
+        if cursor is None:
+            break
+        assert cursor == shown[-1]
+
+    assert shown == sorted(store.teams, reverse=True)
@@ -0,0 +1,84 @@
+import random
+from functools import lru_cache
+
+import pytest
+
+from src.partition import SIZE_COST, conflicts, fill, pool_sizes, separate
+
+
+@lru_cache(maxsize=None)
+def best_cost(teams):
+    """The lowest cost of a split, by trying every size of poule first."""
+
+    if teams == 0:
+        return 0
+    return min(
+        (c + best_cost(teams - s) for s, c in SIZE_COST.items() if s <= teams),
+        default=float("inf"),
+    )
+
+
+@pytest.mark.parametrize("teams", range(3, 60))
+def test_pool_sizes_is_optimal(teams):
+    sizes = pool_sizes(teams)
+    assert sum(sizes) == teams
+    assert sizes == sorted(sizes)
+    assert sum(SIZE_COST[s] for s in sizes) == best_cost(teams)
+
+
+def test_pool_sizes_examples():
+    assert pool_sizes(3) == [3]
+    assert pool_sizes(7) == [3, 4]
+    assert pool_sizes(12) == [3, 3, 3, 3]
+
+
+@pytest.mark.parametrize("teams", [0, 1, 2])
+def test_pool_sizes_too_few_teams(teams):
+    if teams == 0:
+        assert pool_sizes(0) == []
+    else:
+        with pytest.raises(ValueError):
+            pool_sizes(teams)
+
+
+def total(poules, groups, met=()):
+    pairs = {(a, b) for poule in met for a in poule for b in poule if a != b}
+    return sum(conflicts(p, groups, pairs) for p in poules)
+
+
+def test_separate_without_conflicts_is_fill():
+    teams = [f"T{i:02}" for i in range(20)]
+    sizes = pool_sizes(20)
+    assert separate(teams, sizes) == fill(teams, sizes)
+
+    groups = {t: i for i, t in enumerate(teams)}
+    assert separate(teams, sizes, groups) == fill(teams, sizes)
+
+
+def test_separate_finds_a_split_without_conflicts():
+    # 4 tournaments of 3 teams, in 4 poules of 3: one of each in a poule
+    teams = [f"T{i:02}" for i in range(12)]
+    groups = {t: i // 3 for i, t in enumerate(teams)}
+    poules = separate(teams, [3, 3, 3, 3], groups)
+    assert total(poules, groups) == 0
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_separate_never_adds_conflicts(seed):
+    rng = random.Random(seed)
+    n = rng.randrange(9, 60)
+    teams = [f"T{i:02}" for i in range(n)]
+    rng.shuffle(teams)
+    groups = {t: rng.randrange(8) for t in teams}
+    sizes = pool_sizes(n)
+    first = separate(teams, sizes, groups)
+
+    assert [len(p) for p in first] == sizes
+    assert sorted(t for p in first for t in p) == sorted(teams)
+    assert total(first, groups) <= total(fill(teams, sizes), groups)
+
+    # Second round, also avoiding the teams already met
+    rng.shuffle(teams)
+    second = separate(teams, sizes, groups, met=first)
+    assert sorted(t for p in second for t in p) == sorted(teams)
+    assert total(second, groups, first) <= total(fill(teams, sizes), groups, first)
@@ -0,0 +1,138 @@
+import random
+from collections import Counter, namedtuple
+
+import pytest
+
+from src.passage import layout, passage_order, render_table, rooms_for
+
+Record = namedtuple("Record", ["name", "pb", "penalite"])
+
+# The tables of the bot before src/passage.py
+OLD_TABLES = {
+    3: """```
+╔═════╦═════════╦═════════╦═════════╗
+║ T F ║ Phase 1 ║ Phase 2 ║ Phase 3 ║
+║ J M ║  Pb. {0.pb}  ║  Pb. {1.pb}  ║  Pb. {2.pb}  ║
+╠═════╬═════════╬═════════╬═════════╣
+║ {0.name} ║   Def   ║   Rap   ║   Opp   ║
+╠═════╬═════════╬═════════╬═════════╣
+║ {1.name} ║   Opp   ║   Def   ║   Rap   ║
+╠═════╬═════════╬═════════╬═════════╣
+║ {2.name} ║   Rap   ║   Opp   ║   Def   ║
+╚═════╩═════════╩═════════╩═════════╝```""",
+    5: """```
+╔═══╦═══════════════════╦═══════════════════╦═════════╗
+║   ║      Phase 1      ║      Phase 2      ║ Phase 3 ║
+╠═══╬═════════╦═════════╬═════════╦═════════╬═════════╣
+║   ║ Salle 1 ║ Salle 2 ║ Salle 1 ║ Salle 2 ║ Salle 1 ║
+║   ║  Pb. {0.pb}  ║  Pb. {1.pb}  ║  Pb. {2.pb}  ║  Pb. {3.pb}  ║  Pb. {4.pb}  ║
+╠═══╬═════════╬═════════╬═════════╬═════════╬═════════╣
+║{0.name}║   Def   ║         ║   Opp   ║   Rap   ║         ║
+╠═══╬═════════╬═════════╬═════════╬═════════╬═════════╣
+║{1.name}║         ║   Def   ║   Rap   ║         ║   Opp   ║
+╠═══╬═════════╬═════════╬═════════╬═════════╬═════════╣
+║{2.name}║   Opp   ║         ║   Def   ║         ║   Rap   ║
+╠═══╬═════════╬═════════╬═════════╬═════════╬═════════╣
+║{3.name}║   Rap   ║   Opp   ║         ║   Def   ║         ║
+╠═══╬═════════╬═════════╬═════════╬═════════╬═════════╣
+║{4.name}║         ║   Rap   ║         ║   Opp   ║   Def   ║
+╚═══╩═════════╩═════════╩═════════╩═════════╩═════════╝```""",
+}
+
+
+def old_five_order(order, problems):
+    """The passage order of poules of 5 before src/passage.py."""
+
+    order = list(order)
+    pb = dict(zip(order, problems))
+    doubles = []
+    i = 0
+    while i < len(order):
+        team = order[i]
+        if problems.count(pb[team]) == 2:
+            doubles.append(order.pop(i))
+            other = next(filter(lambda t: pb[t] == pb[team], order))
+            doubles.append(other)
+            order.remove(other)
+        else:
+            i += 1
+    return doubles + order
+
+
+def phase_sizes(matches):
+    return list(Counter(m.phase for m in matches).values())
+
+
+def random_problems(size, capacity, rng):
+    taken = Counter()
+    problems = []
+    for _ in range(size):
+        pb = rng.choice([p for p in range(8) if taken[p] < capacity])
+        taken[pb] += 1
+        problems.append(pb)
+    return problems
+
+
+def test_five_teams_order_unchanged():
+    rng = random.Random(0)
+    teams = list("ABCDE")
+    for _ in range(20_000):
+        problems = random_problems(5, 2, rng)
+        assert passage_order(teams, problems, 2) == old_five_order(teams, problems)
+
+
+@pytest.mark.parametrize("size", [3, 4])
+def test_small_poules_keep_their_order(size):
+    teams = list("ABCD")[:size]
+    assert passage_order(teams, list(range(size)), rooms_for(size)) == teams
+
+
+@pytest.mark.parametrize("size", range(3, 17))
+def test_passage_order_groups_shared_problems(size):
+    rng = random.Random(size)
+    rooms = rooms_for(size)
+    matches = layout(size, rooms)
+    teams = [f"T{i:02}" for i in range(size)]
+    for _ in range(500):
+        problems = random_problems(size, 2, rng)
+        order = passage_order(teams, problems, rooms)
+        assert sorted(order) == teams
+
+        pb = dict(zip(teams, problems))
+        phase = {order[m.defender]: m.phase for m in matches}
+        shared = [t for t in teams if problems.count(pb[t]) == 2]
+        # Two teams with the same problem defend it in the same phase,
+        # unless there are more pairs than the phases can hold
+        if len(shared) // 2 <= sum(n // 2 for n in phase_sizes(matches)):
+            for t in shared:
+                other = next(o for o in shared if o != t and pb[o] == pb[t])
+                assert phase[t] == phase[other]
+
+
+@pytest.mark.parametrize("size", range(3, 17))
+def test_layout_roles(size):
+    matches = layout(size)
+    assert sorted(m.defender for m in matches) == list(range(size))
+    for team in range(size):
+        roles = [
+            (m.defender == team) + (m.opponent == team) + (m.reporter == team)
+            for m in matches
+        ]
+        assert roles.count(1) == 3 and roles.count(0) == size - 3
+
+    if size != 5:
+        # Nobody is needed in two rooms at once
+        for p in {m.phase for m in matches}:
+            busy = [
+                t
+                for m in matches
+                if m.phase == p
+                for t in (m.defender, m.opponent, m.reporter)
+            ]
+            assert len(busy) == len(set(busy))
+
+
+@pytest.mark.parametrize("size", sorted(OLD_TABLES))
+def test_tables_unchanged(size):
+    records = [Record(f"T{i}X", str(i + 3), "") for i in range(size)]
+    assert render_table(records, layout(size)) == OLD_TABLES[size].format(*records)
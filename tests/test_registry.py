@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+from src.constants import Role
+from src.registry import Membership, TeamRegistry
+
+HEADER = '"name";"trigram";"tournoi";"secret";"status"\n'
+
+
+class Guild:
+    def __init__(self):
+        self.roles = []
+        self.members = []
+
+    def role(self, name):
+        role = SimpleNamespace(id=len(self.roles) + 1, name=name, members=[])
+        self.roles.append(role)
+        return role
+
+    def member(self, *roles):
+        member = SimpleNamespace(id=100 + len(self.members), roles=list(roles))
+        for role in roles:
+            role.members.append(member)
+        self.members.append(member)
+        return member
+
+    def get_member(self, member_id):
+        return next((m for m in self.members if m.id == member_id), None)
+
+
+def write(path, *trigrams):
+    path.write_text(
+        HEADER + "".join(f'"Team {t}";"{t}";"Lille";"s{t}";"ok"\n' for t in trigrams)
+    )
+
+
+def test_members_follow_the_file(tmp_path):
+    path = tmp_path / "teams"
+    write(path, "AAA")
+    registry = TeamRegistry(path)
+    membership = Membership(registry)
+
+    guild = Guild()
+    captain = guild.role(Role.CAPTAIN)
+    a = guild.member(guild.role("AAA"), captain)
+    b = guild.member(guild.role("BBB"), captain)
+    membership.build(guild)
+    assert membership.captains_of("AAA") == {a.id}
+    assert membership.captains_of("BBB") == set()
+
+    # BBB registers after the index was built, and AAA leaves
+    write(path, "BBB", "CCC")
+    assert registry.refresh(force=True) == {"AAA", "BBB", "CCC"}
+    assert membership.captains_of("BBB") == {b.id}
+    assert membership.teams_of(b.id) == {"BBB"}
+    assert membership.captains_of("AAA") == set()
+    assert membership.teams_of(a.id) == set()
+    assert membership.teams_by_tournoi() == {"Lille": ["BBB"]}
+
+    assert registry.refresh(force=True) == set()
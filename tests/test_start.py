@@ -0,0 +1,47 @@
+import pytest
+
+from src.cogs.tirages import parse_start
+
+
+def parse(command):
+    parsed = parse_start(command.split())
+    if parsed is None:
+        return None
+    match, flags, continue_id = parsed
+    return match["fmt"], match["teams"].split(), flags, continue_id
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        "3 AAA BBB CCC --finale --optimize",
+        "3 AAA BBB CCC --optimize --finale",
+        "3 --optimise AAA BBB CCC --finale",
+        "--finale --optimize 3 AAA BBB CCC",
+    ],
+)
+def test_options_in_any_order(command):
+    assert parse(command) == ("3", ["AAA", "BBB", "CCC"], {"finale", "optimize"}, None)
+
+
+def test_continue():
+    expected = (None, ["AAA", "BBB", "CCC"], set(), 7)
+    assert parse("AAA BBB CCC --continue=7") == expected
+    assert parse("--continue 7 AAA BBB CCC") == expected
+    assert parse("AAA BBB CCC --continue=7 --optimize")[2] == {"optimize"}
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        "3 AAA BBB CCC --finale --continue=7",
+        "3 AAA BBB CCC --continue=x",
+        "3 AAA BBB CCC --continue=7 --continue=8",
+        "3 AAA BBB CCC --final",
+        "3 AAA",
+        "3+ AAA BBB CCC",
+        "",
+    ],
+)
+def test_malformed(command):
+    assert parse(command) is None
@@ -0,0 +1,23 @@
+import random
+
+import pytest
+
+from src.timings import percentiles
+
+
+def test_percentiles_examples():
+    assert percentiles([]) == [0, 0, 0]
+    assert percentiles([3.5]) == [3.5, 3.5, 3.5]
+    assert percentiles(list(range(100, 0, -1))) == [50, 90, 99]
+    assert percentiles(list(range(1, 11))) == [5, 9, 10]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_percentiles_are_nearest_ranks(seed):
+    rng = random.Random(seed)
+    values = [rng.random() for _ in range(rng.randint(1, 300))]
+    for p, q in zip((50, 90, 99), percentiles(values)):
+        assert q in values
+        below = sum(v <= q for v in values)
+        assert below * 100 >= p * len(values)
+        assert (below - 1) * 100 < p * len(values)
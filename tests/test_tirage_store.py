@@ -0,0 +1,41 @@
+import sqlite3
+
+from src import codec
+from src.tirage_store import TirageStore
+
+
+def test_latest_tirage_of_a_tournament(tmp_path):
+    store = TirageStore(tmp_path / "tirages.db")
+    ids = []
+    for tournoi in ["Lille", "Lyon", "Lille", None, "Finale"]:
+        tirage = codec.random_tirage(store.new_id())
+        store.save(tirage)
+        if tournoi is not None:
+            store.set_tournoi(tirage.id, tournoi)
+        ids.append(tirage.id)
+
+    assert store.latest_of("Lille") == ids[2]
+    assert store.latest_of("Lyon") == ids[1]
+    assert store.latest_of("Finale") == ids[4]
+    assert store.latest_of("Paris") is None
+
+    # Saving the tirage again keeps its tournament
+    store.save(store.load(ids[4]))
+    assert store.latest_of("Finale") == ids[4]
+
+
+def test_tournament_column_is_added(tmp_path):
+    path = tmp_path / "tirages.db"
+    db = sqlite3.connect(str(path))
+    db.execute(
+        "CREATE TABLE tirages (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "format TEXT NOT NULL, created REAL NOT NULL)"
+    )
+    db.execute("INSERT INTO tirages (format, created) VALUES ('[3]', 0)")
+    db.commit()
+    db.close()
+
+    store = TirageStore(path)
+    assert store.latest_of("Lille") is None
+    store.set_tournoi(1, "Lille")
+    assert store.latest_of("Lille") == 1